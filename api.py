@@ -0,0 +1,267 @@
+"""
+API JSON para tomar pedidos desde el celular (preventistas en la calle).
+
+Un proceso aparte de Streamlit, con la misma lógica de negocio
+(servicios.py) y el mismo pool de conexiones (conexion.py): cada pedido es
+una transacción corta, sin volver a correr el script de la app. El catálogo
+sale del cache de catalogo.py, que se invalida con los avisos NOTIFY igual
+que en la app; el stock se consulta en vivo (descontando las reservas de los
+carritos abiertos).
+
+    GET  /api/salud                      estado del pool (sin token)
+    GET  /api/productos?q=texto&limite=  búsqueda en el catálogo
+    GET  /api/clientes                   clientes
+    GET  /api/stock?ids=1,2,3            disponible por producto
+    POST /api/pedidos                    {id_cliente, lineas: [{id_producto, formato, cantidad}],
+                                          metodo_pago?, nro_factura?, descripcion?}
+
+El precio sale siempre de la lista (productos.precio_venta): el celular no
+lo puede cambiar. Tampoco manda reservas: el pedido solo usa stock libre.
+
+Los pedidos llevan el header Idempotency-Key (uuid): si el celular reintenta
+con la misma clave se devuelve la venta ya grabada (operaciones_aplicadas,
+como la cola local), nunca se graba dos veces.
+
+Uso:
+    python api.py [--host 0.0.0.0] [--puerto 8502]
+
+Lee .streamlit/secrets.toml: [postgres] como la app y [api] token = "...",
+que se manda como 'Authorization: Bearer <token>'.
+"""
+import argparse
+import hmac
+import json
+import tomllib
+import uuid
+from decimal import Decimal
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+from sqlalchemy import exc
+
+import catalogo
+import cola
+import conexion
+import notificaciones
+import rendimiento
+import reservas
+import servicios
+
+RAIZ = Path(__file__).resolve().parent
+MAX_CUERPO = 256 * 1024   # bytes de un pedido
+LIMITE_BUSQUEDA = 50
+LIMITE_MAXIMO = 500
+COLUMNAS_PRODUCTO = ["id_producto", "nombre", "marca", "precio_venta", "precio_venta_caja",
+                     "unidades_por_caja", "stock_actual"]
+
+
+class ErrorApi(Exception):
+    """Error con código HTTP para devolver al cliente"""
+
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+# --- OPERACIONES ---
+
+def buscar_productos(engine, q="", limite=LIMITE_BUSQUEDA):
+    """Productos cuyo nombre o marca contiene q (sin distinguir mayúsculas)"""
+    df = catalogo.cargar_productos(engine)
+    if q:
+        texto = (df["nombre"] + " " + df["marca"]).str.lower()
+        df = df[texto.str.contains(q.lower(), regex=False)]
+    return df[COLUMNAS_PRODUCTO].head(limite).to_dict("records")
+
+
+def listar_clientes(engine):
+    return catalogo.cargar_clientes(engine).to_dict("records")
+
+
+def consultar_stock(engine, ids):
+    """Disponible en vivo: stock_actual menos reservas vigentes"""
+    with engine.connect() as conn, rendimiento.etiqueta("api: stock"):
+        libre = reservas.disponibles(conn, ids)
+    return [{"id_producto": i, "disponible": libre.get(i)} for i in ids]
+
+
+def _entero(x):
+    # JSON true/false llegan como bool, que en Python también es int
+    return isinstance(x, int) and not isinstance(x, bool)
+
+
+def _validar_pedido(datos):
+    """Revisa la forma del pedido (tipos y campos obligatorios); ErrorApi 400 si no cierra.
+
+    Las reglas del negocio (producto inexistente, sin stock) las revisa
+    servicios.vender_pedido y salen como 422.
+    """
+    if "reserva" in datos:
+        raise ErrorApi(HTTPStatus.BAD_REQUEST, "La API no acepta reservas: el pedido toma stock disponible.")
+    if not _entero(datos.get("id_cliente")):
+        raise ErrorApi(HTTPStatus.BAD_REQUEST, "Falta id_cliente (entero).")
+    lineas = datos.get("lineas")
+    if not isinstance(lineas, list) or not lineas:
+        raise ErrorApi(HTTPStatus.BAD_REQUEST, "Falta lineas (lista con al menos un producto).")
+    for n, linea in enumerate(lineas, start=1):
+        if not isinstance(linea, dict):
+            raise ErrorApi(HTTPStatus.BAD_REQUEST, f"La línea {n} tiene que ser un objeto.")
+        for campo in ("id_producto", "cantidad"):
+            if not _entero(linea.get(campo)):
+                raise ErrorApi(HTTPStatus.BAD_REQUEST, f"Falta {campo} (entero) en la línea {n}.")
+        if "precio" in linea:
+            raise ErrorApi(HTTPStatus.BAD_REQUEST, f"La línea {n} no puede fijar precio: se usa el de lista.")
+        if not isinstance(linea.get("formato", "Unidad"), str):
+            raise ErrorApi(HTTPStatus.BAD_REQUEST, f"formato tiene que ser texto en la línea {n}.")
+    for campo in ("metodo_pago", "nro_factura", "descripcion"):
+        if datos.get(campo) is not None and not isinstance(datos[campo], str):
+            raise ErrorApi(HTTPStatus.BAD_REQUEST, f"{campo} tiene que ser texto.")
+
+
+def tomar_pedido(engine, datos, clave):
+    """Graba el pedido como venta (una sola vez por clave). Retorna (respuesta, era_nuevo)"""
+    _validar_pedido(datos)
+    with engine.begin() as conn, rendimiento.etiqueta("api: pedido"):
+        id_venta, nuevo = cola.aplicar_una_vez(conn, clave, "venta", servicios.vender_pedido, datos)
+    if nuevo:
+        catalogo.invalidar("productos")
+    return {"id_venta": id_venta, "clave": clave, "repetido": not nuevo}, nuevo
+
+
+# --- HTTP ---
+
+def _a_json(x):
+    if hasattr(x, "item"):
+        return x.item()
+    if isinstance(x, Decimal):
+        return float(x)
+    return str(x)
+
+
+def _ids(valor):
+    try:
+        return [int(i) for i in valor.split(",") if i.strip()]
+    except ValueError:
+        raise ErrorApi(HTTPStatus.BAD_REQUEST, "ids tiene que ser una lista de enteros separados por coma.")
+
+
+class Manejador(BaseHTTPRequestHandler):
+    server_version = "ElGalponAPI/1.0"
+    protocol_version = "HTTP/1.1"  # keep-alive: el celular reusa la conexión
+
+    def _responder(self, estado, cuerpo):
+        datos = json.dumps(cuerpo, default=_a_json, ensure_ascii=False).encode("utf-8")
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def _autorizado(self):
+        esperado = f"Bearer {self.server.token}"
+        return hmac.compare_digest(self.headers.get("Authorization", "").encode(), esperado.encode())
+
+    def _leer_cuerpo(self):
+        # Se lee siempre (aunque después se rechace): si queda en el socket
+        # rompe el siguiente pedido de la misma conexión keep-alive
+        largo = int(self.headers.get("Content-Length") or 0)
+        if largo > MAX_CUERPO:
+            self.close_connection = True
+            raise ErrorApi(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Pedido demasiado grande.")
+        return self.rfile.read(largo)
+
+    def _leer_json(self, cuerpo):
+        try:
+            datos = json.loads(cuerpo or b"{}")
+        except json.JSONDecodeError:
+            raise ErrorApi(HTTPStatus.BAD_REQUEST, "El cuerpo no es JSON válido.")
+        if not isinstance(datos, dict):
+            raise ErrorApi(HTTPStatus.BAD_REQUEST, "El cuerpo tiene que ser un objeto JSON.")
+        return datos
+
+    def _atender(self, metodo):
+        url = urlparse(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        engine = self.server.engine
+        rendimiento.marcar_seccion(f"api {metodo} {url.path}")
+        try:
+            cuerpo = self._leer_cuerpo() if metodo == "POST" else b""
+            if metodo == "GET" and url.path == "/api/salud":
+                return self._responder(HTTPStatus.OK, {"ok": True, "pool": conexion.estadisticas_pool(engine)})
+            if not self._autorizado():
+                raise ErrorApi(HTTPStatus.UNAUTHORIZED, "Token inválido.")
+
+            if metodo == "GET" and url.path == "/api/productos":
+                try:
+                    limite = int(params.get("limite", LIMITE_BUSQUEDA))
+                except ValueError:
+                    raise ErrorApi(HTTPStatus.BAD_REQUEST, "limite tiene que ser un entero.")
+                limite = max(1, min(limite, LIMITE_MAXIMO))
+                return self._responder(HTTPStatus.OK, buscar_productos(engine, params.get("q", ""), limite))
+            if metodo == "GET" and url.path == "/api/clientes":
+                return self._responder(HTTPStatus.OK, listar_clientes(engine))
+            if metodo == "GET" and url.path == "/api/stock":
+                return self._responder(HTTPStatus.OK, consultar_stock(engine, _ids(params.get("ids", ""))))
+            if metodo == "POST" and url.path == "/api/pedidos":
+                clave = self.headers.get("Idempotency-Key") or str(uuid.uuid4())
+                try:
+                    clave = str(uuid.UUID(clave))
+                except ValueError:
+                    raise ErrorApi(HTTPStatus.BAD_REQUEST, "Idempotency-Key tiene que ser un uuid.")
+                respuesta, nuevo = tomar_pedido(engine, self._leer_json(cuerpo), clave)
+                return self._responder(HTTPStatus.CREATED if nuevo else HTTPStatus.OK, respuesta)
+            raise ErrorApi(HTTPStatus.NOT_FOUND, f"No existe {metodo} {url.path}.")
+
+        except ErrorApi as e:
+            self._responder(e.estado, {"error": str(e)})
+        except ValueError as e:
+            # Reglas del negocio (stock insuficiente, producto inexistente, etc.)
+            self._responder(HTTPStatus.UNPROCESSABLE_ENTITY, {"error": str(e)})
+        except (exc.OperationalError, exc.InterfaceError) as e:
+            self._responder(HTTPStatus.SERVICE_UNAVAILABLE, {"error": f"Base no disponible: {getattr(e, 'orig', e)}"})
+        except exc.DBAPIError as e:
+            self._responder(HTTPStatus.UNPROCESSABLE_ENTITY, {"error": str(getattr(e, "orig", e))})
+        except Exception as e:
+            self._responder(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)})
+
+    def do_GET(self):
+        self._atender("GET")
+
+    def do_POST(self):
+        self._atender("POST")
+
+
+def crear_servidor(engine, token, host="127.0.0.1", puerto=8502):
+    """Servidor listo para serve_forever() (un hilo por conexión, pool compartido)"""
+    servidor = ThreadingHTTPServer((host, puerto), Manejador)
+    servidor.daemon_threads = True
+    servidor.engine = engine
+    servidor.token = token
+    return servidor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--puerto", type=int, default=8502)
+    parser.add_argument("--secrets", default=str(RAIZ / ".streamlit" / "secrets.toml"))
+    args = parser.parse_args()
+
+    with open(args.secrets, "rb") as f:
+        secrets = tomllib.load(f)
+    token = secrets.get("api", {}).get("token")
+    if not token:
+        parser.error("falta [api] token en los secrets")
+
+    engine = conexion.crear_engine({**secrets["postgres"], "application_name": "el-galpon-api"})
+    rendimiento.instrumentar(engine)
+    notificaciones.iniciar(engine)
+    servidor = crear_servidor(engine, token, args.host, args.puerto)
+    print(f"API escuchando en http://{args.host}:{args.puerto}/api/")
+    servidor.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,28 @@
 import streamlit as st
 import pandas as pd
-from sqlalchemy import create_engine, text
-import plotly.express as px
-import plotly.graph_objects as go
-from datetime import datetime, timedelta
+from sqlalchemy import exc, text
+from datetime import date, datetime, timedelta
+import hmac
+import os
 import time 
+from contextlib import contextmanager
+import catalogo
+import cola
+import conexion
+import cubo
+import exportar
+import graficos
+import importar
+import notificaciones
+import precios
+import refresco
+import rendimiento
+import reservas
+import servicios
+import tablero
 # Configuración inicial
 st.set_page_config(page_title="El Galpón - Gestión", layout="wide", page_icon="🍻")
+id_rerun, inicio_rerun = rendimiento.iniciar_rerun()
 
 
 
@@ -59,11 +75,46 @@ if not check_password():
 # --- CONEXIÓN ---
 @st.cache_resource
 def get_engine():
-    c = st.secrets["postgres"]
-    return create_engine(f"postgresql://{c['user']}:{c['password']}@{c['host']}:{c['port']}/{c['database']}")
+    # Pool, pre-ping, recycle y statement_timeout se configuran en st.secrets["postgres"]
+    engine = conexion.crear_engine(st.secrets["postgres"])
+    rendimiento.instrumentar(engine)
+    # Avisos de otras sesiones/procesos: invalidan solo los caches afectados
+    notificaciones.iniciar(engine)
+    # Ventas y compras confirmadas en el mostrador: las graba el replicador de la cola
+    cola.iniciar(engine, servicios.APLICADORES)
+    return engine
 
 engine = get_engine()
 
+# Todas las lecturas de una ejecución del script comparten UNA conexión del
+# pool (se abre con la primera lectura y se devuelve al final del archivo).
+# Las escrituras siguen usando engine.begin() con su propia transacción.
+_conexion_lectura = {"conn": None}
+
+@contextmanager
+def lectura(nombre=None):
+    """Presta la conexión de lectura de esta ejecución (nombre: etiqueta para ⏱️ Performance)"""
+    if _conexion_lectura["conn"] is None:
+        _conexion_lectura["conn"] = engine.connect()
+    conn = _conexion_lectura["conn"]
+    try:
+        if nombre:
+            with rendimiento.etiqueta(nombre):
+                yield conn
+        else:
+            yield conn
+    except Exception:
+        # Una consulta fallida deja la transacción abortada: la limpiamos
+        # para que las lecturas siguientes no fallen en cadena
+        conn.rollback()
+        raise
+
+def liberar_lectura():
+    """Devuelve la conexión de lectura al pool"""
+    if _conexion_lectura["conn"] is not None:
+        _conexion_lectura["conn"].close()
+        _conexion_lectura["conn"] = None
+
 # --- INICIALIZACIÓN DE MEMORIA ---
 if 'carrito_compra' not in st.session_state:
     st.session_state.carrito_compra = []
@@ -74,80 +125,143 @@ if 'carrito_venta' not in st.session_state:
 if 'carrito_concesion' not in st.session_state:
     st.session_state.carrito_concesion = []
 
-# --- FUNCIONES AUXILIARES ---
-def calcular_costo_real(id_producto):
-    """Obtiene el costo promedio ponderado del producto"""
-    query = text("""
-        SELECT precio_costo_promedio 
-        FROM productos 
-        WHERE id_producto = :id_prod
-    """)
-    with engine.connect() as conn:
-        result = conn.execute(query, {"id_prod": id_producto}).fetchone()
-        return float(result[0]) if result else 0.0
-
-def obtener_kpis():
-    """Obtiene los KPIs actualizados con lógica de formatos y márgenes reales"""
-    query = text("""
-        WITH VentasCalculadas AS (
-            SELECT 
-                -- Calculamos las unidades reales vendidas (unidades x factor de caja)
-                (dv.cantidad_formato * CASE WHEN dv.formato_venta = 'Caja' THEN p.unidades_por_caja ELSE 1 END) as unidades_reales,
-                dv.precio_unitario_historico,
-                p.precio_costo_promedio
-            FROM detalle_ventas dv
-            JOIN ventas v ON dv.id_venta = v.id_venta
-            JOIN productos p ON dv.id_producto = p.id_producto
-            WHERE v.fecha >= CURRENT_DATE - INTERVAL '30 days'
-        ),
-        VentasTotales AS (
-            SELECT 
-                SUM(unidades_reales * precio_unitario_historico) as total_ventas,
-                SUM(unidades_reales * precio_costo_promedio) as costo_total
-            FROM VentasCalculadas
-        ),
-        StockValorizado AS (
-            SELECT SUM(stock_actual * precio_costo_promedio) as valor_inventario
-            FROM productos
+# Id de las reservas de stock de cada carrito (reservas.py)
+for _carrito in ("reserva_venta", "reserva_concesion"):
+    if _carrito not in st.session_state:
+        st.session_state[_carrito] = reservas.nuevo_carrito()
+
+# --- PAGINACIÓN KEYSET DE LOS HISTORIALES ---
+# Cada página arranca donde terminó la anterior: (fecha, id) < (último visto).
+# No hay OFFSET, así que la página 50 cuesta lo mismo que la 1 (un rango
+# sobre el índice de fecha) y nunca se trae el historial entero a pandas.
+TAMANIOS_PAGINA = [25, 50, 100, 250]
+
+def estado_paginacion(vista, filtros):
+    """Pila de cursores de la vista; vuelve a la primera página si cambian los filtros"""
+    clave = f"paginas_{vista}"
+    estado = st.session_state.get(clave)
+    if estado is None or estado["filtros"] != filtros:
+        estado = {"filtros": filtros, "cursores": [None]}
+        st.session_state[clave] = estado
+    return estado
+
+def condicion_cursor(cursor, col_fecha, col_id):
+    """Fragmento WHERE para seguir después del cursor (nada en la primera página)"""
+    if cursor is None:
+        return "", {}
+    return f"AND ({col_fecha}, {col_id}) < (:cur_fecha, :cur_id)", {"cur_fecha": cursor[0], "cur_id": cursor[1]}
+
+def filtro_fechas(vista, dias=30):
+    """Selector de rango de fechas (por defecto, los últimos `dias`)"""
+    hoy = date.today()
+    rango = st.date_input("Período", value=(hoy - timedelta(days=dias), hoy), key=f"fechas_{vista}", format="DD/MM/YYYY")
+    if len(rango) != 2:  # mientras elige la segunda fecha
+        return hoy - timedelta(days=dias), hoy
+    return rango
+
+def controles_paginacion(vista, estado, hay_mas, ultimo):
+    """Botones Anterior / Siguiente. `ultimo` es la clave (fecha, id) de la última fila"""
+    col_prev, col_pag, col_next = st.columns([1, 2, 1])
+    pagina = len(estado["cursores"])
+    col_pag.caption(f"Página {pagina}")
+    if col_prev.button("⬅️ Anterior", key=f"prev_{vista}", disabled=pagina == 1, width='stretch'):
+        estado["cursores"].pop()
+        st.rerun()
+    if col_next.button("Siguiente ➡️", key=f"next_{vista}", disabled=not hay_mas, width='stretch'):
+        estado["cursores"].append(ultimo)
+        st.rerun()
+
+def cortar_pagina(df, col_id, col_fecha, tam):
+    """Se piden tam+1 cabeceras: si vino la extra hay página siguiente y se descarta.
+    Retorna (df de la página, hay_mas, clave del último)"""
+    ids = df[col_id].unique()
+    hay_mas = len(ids) > tam
+    if hay_mas:
+        df = df[df[col_id] != ids[tam]]
+    if df.empty:
+        return df, False, None
+    ultima = df.iloc[-1]
+    fecha = ultima[col_fecha]
+    return df, hay_mas, (fecha.to_pydatetime() if hasattr(fecha, "to_pydatetime") else fecha, int(ultima[col_id]))
+
+
+# --- EXPORTACIÓN (rango completo, fuera de la página visible) ---
+def exportador(vista, conjuntos):
+    """Genera el archivo en disco en streaming (memoria acotada) y ofrece la descarga"""
+    with st.expander("⬇️ Exportar para contabilidad (CSV / Excel / Parquet)"):
+        col_e1, col_e2, col_e3 = st.columns([2, 2, 1])
+        with col_e1:
+            desde_e, hasta_e = filtro_fechas(f"export_{vista}", dias=365)
+        conjunto = col_e2.selectbox("Datos", conjuntos, key=f"conj_export_{vista}")
+        formato = col_e3.radio("Formato", list(exportar.FORMATOS), key=f"fmt_export_{vista}")
+
+        clave = f"archivo_export_{vista}"
+        if st.button("⚙️ Generar archivo", key=f"gen_export_{vista}"):
+            anterior = st.session_state.pop(clave, None)
+            if anterior and os.path.exists(anterior["ruta"]):
+                os.remove(anterior["ruta"])
+            try:
+                with st.spinner("Exportando..."):
+                    ruta, filas = exportar.exportar(engine, conjunto, desde_e, hasta_e, formato)
+                nombre = f"{conjunto.split(' ')[0].lower()}_{desde_e:%Y%m%d}_{hasta_e:%Y%m%d}{exportar.FORMATOS[formato]}"
+                st.session_state[clave] = {"ruta": ruta, "nombre": nombre, "filas": filas}
+            except Exception as e:
+                st.error(f"Error al exportar: {e}")
+
+        archivo = st.session_state.get(clave)
+        if archivo and os.path.exists(archivo["ruta"]):
+            st.caption(f"{archivo['filas']:,} filas · {os.path.getsize(archivo['ruta']) / 1e6:.1f} MB")
+            with open(archivo["ruta"], "rb") as f:
+                st.download_button(f"⬇️ Descargar {archivo['nombre']}", f, file_name=archivo["nombre"], key=f"desc_export_{vista}")
+
+
+# --- ESTADO DE LA COLA LOCAL ---
+def panel_cola(tipo):
+    """Últimas operaciones confirmadas en el mostrador y si ya llegaron a la base"""
+    ops = cola.recientes(tipo)
+    con_error = [op for op in ops if op["Estado"] == cola.ESTADOS["error"]]
+    pendientes = sum(op["Estado"] == cola.ESTADOS["pendiente"] for op in ops)
+    titulo = f"📡 Sincronización de {cola.TIPOS[tipo].lower()}s"
+    if pendientes or con_error:
+        titulo += f" ({pendientes} en cola, {len(con_error)} con error)"
+    with st.expander(titulo, expanded=bool(con_error)):
+        if not ops:
+            st.caption("Todavía no hay operaciones en la cola local.")
+            return
+        st.dataframe(
+            pd.DataFrame(ops).drop(columns=["clave"]),
+            hide_index=True,
+            width='stretch',
+            column_config={
+                "Total": st.column_config.NumberColumn(format="$%.2f"),
+                "N°": st.column_config.NumberColumn(format="%d"),
+            }
         )
-        SELECT 
-            COALESCE(vt.total_ventas, 0) as ventas_mes,
-            COALESCE(vt.total_ventas - vt.costo_total, 0) as margen_bruto,
-            COALESCE(sv.valor_inventario, 0) as valor_stock,
-            (SELECT COUNT(*) FROM productos WHERE stock_actual <= stock_minimo) as productos_criticos
-        FROM VentasTotales vt, StockValorizado sv
-    """)
-    
-    with engine.connect() as conn:
-        result = conn.execute(query).fetchone()
-        return {
-            'ventas_mes': float(result[0]),
-            'margen_bruto': float(result[1]),
-            'valor_stock': float(result[2]),
-            'productos_criticos': int(result[3])
-        }
-
-
-# --- TABS PRINCIPALES ---
-tab1, tab2, tab3, tab4, tab5, tab6, tab7= st.tabs([
-    "📊 Dashboard", 
-    "💰 Registrar Venta", 
-    "🚚 Cargar Compra",
-    "🤝 Concesiones",
-    "📈 Análisis",
-    "🔍 Auditoría",
-    "📂 Carga de Datos"
-    
-])
+        for op in con_error:
+            col_e, col_r, col_d = st.columns([4, 1, 1])
+            col_e.caption(f"{op['Creada']} · ${op['Total']:,.2f} · {op['Error']}")
+            if col_r.button("🔁 Reintentar", key=f"reint_{op['clave']}"):
+                cola.reintentar(op["clave"])
+                st.rerun()
+            if col_d.button("🗑️ Descartar", key=f"desc_{op['clave']}"):
+                cola.descartar(op["clave"])
+                st.rerun()
+
+
+# --- SECCIONES PRINCIPALES ---
+# Cada sección es una función: solo se ejecuta (y consulta la base) la que
+# está elegida en la barra de navegación (ver el final del archivo).
+barra_navegacion = st.container()
 
 # ==========================================================
 # TAB 1: DASHBOARD MEJORADO
 # ==========================================================
-with tab1:
+def seccion_dashboard():
     st.title("📈 Dashboard - El Galpón")
     
-    # KPIs principales
-    kpis = obtener_kpis()
+    # KPIs principales (lo último calculado; se refresca en segundo plano)
+    kpis = tablero.cargar_kpis(engine)
+    st.caption(refresco.texto_edad(tablero.cargar_kpis, engine))
     
     col1, col2, col3, col4 = st.columns(4)
     
@@ -184,58 +298,20 @@ with tab1:
     
     st.markdown("---")
     
-    # Query principal mejorada
-    query_master = text("""
-    WITH VentasTotales AS (
-        SELECT id_producto, 
-               SUM(cantidad_formato) as total_vendido,
-               MAX(v.fecha) as ultima_venta
-        FROM detalle_ventas dv
-        JOIN ventas v ON dv.id_venta = v.id_venta
-        GROUP BY id_producto
-    ),
-    VentasRecientes AS (
-        SELECT id_producto, SUM(cantidad_formato) as vendido_30d
-        FROM detalle_ventas dv
-        JOIN ventas v ON dv.id_venta = v.id_venta
-        WHERE v.fecha >= CURRENT_DATE - INTERVAL '30 days'
-        GROUP BY id_producto
-    )
-    SELECT 
-        p.id_producto,
-        p.nombre AS "Producto", 
-        m.nombre AS "Marca",
-        p.stock_actual AS "Stock",
-        COALESCE(vr.vendido_30d, 0) AS "Venta 30d",
-        COALESCE(vt.total_vendido, 0) AS "Total Vendido",
-        ROUND(p.precio_costo_promedio, 2) AS "Costo Prorr",
-        p.precio_venta AS "Precio",
-        ROUND(((p.precio_venta - p.precio_costo_promedio) / NULLIF(p.precio_venta, 0) * 100), 1) AS "Margen %",
-        ROUND(p.stock_actual * p.precio_costo_promedio, 2) AS "Valor Stock",
-        CASE 
-            WHEN p.stock_actual <= 0 THEN '🔴 SIN STOCK'
-            WHEN p.stock_actual <= p.stock_minimo THEN '🟡 BAJO'
-            WHEN COALESCE(vr.vendido_30d, 0) = 0 AND p.stock_actual > 0 THEN '⚪ SIN ROTACIÓN'
-            ELSE '🟢 OK' 
-        END AS "Estado",
-        CASE 
-            WHEN COALESCE(vr.vendido_30d, 0) > 0 
-            THEN ROUND(p.stock_actual::numeric / (vr.vendido_30d / 30.0), 1)
-            ELSE NULL 
-        END AS "Días Stock"
-    FROM productos p 
-    JOIN marcas m ON p.id_marca = m.id_marca
-    LEFT JOIN VentasTotales vt ON p.id_producto = vt.id_producto
-    LEFT JOIN VentasRecientes vr ON p.id_producto = vr.id_producto
-    ORDER BY "Venta 30d" DESC NULLS LAST
-""")
-
-    with engine.connect() as conn:
-        df_master = pd.read_sql(query_master, conn)
-
-    df_master['Venta 30d'] = pd.to_numeric(df_master['Venta 30d'])
-    df_master['Total Vendido'] = pd.to_numeric(df_master['Total Vendido'])
-    df_master['Stock'] = pd.to_numeric(df_master['Stock'])
+    # Foto del inventario: se consulta una vez por versión de datos y todo lo
+    # de abajo (estados, filtros, alertas, gráficos) sale de ahí sin ir a la base
+    with st.expander("⚙️ Umbrales de clasificación"):
+        col_u1, col_u2 = st.columns(2)
+        factor_minimo = col_u1.number_input(
+            "Stock BAJO si stock ≤ mínimo ×", min_value=0.0, step=0.25,
+            value=tablero.UMBRALES_POR_DEFECTO["factor_minimo"], key="umbral_factor_minimo"
+        )
+        rotacion_minima = col_u2.number_input(
+            "SIN ROTACIÓN si vendió menos de (unid. 30 días)", min_value=0, step=1,
+            value=tablero.UMBRALES_POR_DEFECTO["rotacion_minima"], key="umbral_rotacion_minima"
+        )
+    snapshot = tablero.armar_snapshot(engine, float(factor_minimo), int(rotacion_minima))
+    df_master = snapshot["df"]
     
     # Filtros
     col_f1, col_f2, col_f3 = st.columns(3)
@@ -243,59 +319,37 @@ with tab1:
     with col_f1:
         filtro_estado = st.multiselect(
             "Filtrar por estado:",
-            options=df_master['Estado'].unique(),
+            options=tablero.ESTADOS,
             default=None
         )
     
     with col_f2:
         filtro_marca = st.multiselect(
             "Filtrar por marca:",
-            options=df_master['Marca'].unique(),
+            options=df_master['Marca'].cat.categories,
             default=None
         )
     
     with col_f3:
         mostrar_sin_rotacion = st.checkbox("Mostrar solo sin rotación", value=False)
     
-    # Aplicar filtros
-    df_filtrado = df_master.copy()
-    
-    if filtro_estado:
-        df_filtrado = df_filtrado[df_filtrado['Estado'].isin(filtro_estado)]
-    
-    if filtro_marca:
-        df_filtrado = df_filtrado[df_filtrado['Marca'].isin(filtro_marca)]
-    
+    # Aplicar filtros (con los índices por estado/marca de la foto)
+    estados = filtro_estado or None
     if mostrar_sin_rotacion:
-        df_filtrado = df_filtrado[df_filtrado['Estado'] == '⚪ SIN ROTACIÓN']
+        estados = [e for e in (estados or tablero.ESTADOS) if e == '⚪ SIN ROTACIÓN']
+    df_filtrado = tablero.filtrar(snapshot, estados, filtro_marca or None)
     
     # Gráficos
     col_g1, col_g2 = st.columns(2)
     
     with col_g1:
-        # Top 10 productos por venta
-        df_top = df_filtrado.nlargest(10, 'Venta 30d')
-        fig1 = px.bar(
-            df_top, 
-            x='Producto', 
-            y='Venta 30d',
-            color='Marca',
-            title="🏆 Top 10 Productos (últimos 30 días)",
-            template="plotly_white"
-        )
-        fig1.update_layout(showlegend=True, height=400)
+        # Top 10 productos por venta (la foto ya viene ordenada por venta)
+        fig1 = graficos.top_ventas(df_filtrado.head(10)[['Producto', 'Marca', 'Venta 30d']])
         st.plotly_chart(fig1, width='stretch', config={'scrollZoom': False})
     
     with col_g2:
-        # Distribución de márgenes
-        fig2 = px.histogram(
-            df_filtrado[df_filtrado['Margen %'].notna()], 
-            x='Margen %',
-            nbins=20,
-            title="📊 Distribución de Márgenes",
-            template="plotly_white"
-        )
-        fig2.update_layout(height=400)
+        # Distribución de márgenes (las cuentas por intervalo se calculan con numpy)
+        fig2 = graficos.distribucion_margenes(tablero.histograma(df_filtrado['Margen %'].to_numpy()))
         st.plotly_chart(fig2, width='stretch', config={'scrollZoom': False})
     
     # Tabla principal con formato mejorado
@@ -317,37 +371,36 @@ with tab1:
         }
     )
     
-    # Resumen de alertas
+    # Resumen de alertas (sobre toda la foto, con los grupos ya armados)
     st.markdown("---")
     st.subheader("⚠️ Alertas y Recomendaciones")
     
     col_a1, col_a2, col_a3 = st.columns(3)
     
     with col_a1:
-        sin_stock = len(df_master[df_master['Estado'] == '🔴 SIN STOCK'])
-        st.warning(f"**{sin_stock}** productos sin stock")
-        if sin_stock > 0:
+        df_sin_stock = tablero.filas_estado(snapshot, '🔴 SIN STOCK')
+        st.warning(f"**{len(df_sin_stock)}** productos sin stock")
+        if not df_sin_stock.empty:
             st.dataframe(
-                df_master[df_master['Estado'] == '🔴 SIN STOCK'][['Producto', 'Venta 30d']],
+                df_sin_stock[['Producto', 'Venta 30d']],
                 hide_index=True,
                 width='stretch'
             )
     
     with col_a2:
-        bajo_stock = len(df_master[df_master['Estado'] == '🟡 BAJO'])
-        st.info(f"**{bajo_stock}** productos con stock bajo")
-        if bajo_stock > 0:
+        df_bajo = tablero.filas_estado(snapshot, '🟡 BAJO')
+        st.info(f"**{len(df_bajo)}** productos con stock bajo")
+        if not df_bajo.empty:
             st.dataframe(
-                df_master[df_master['Estado'] == '🟡 BAJO'][['Producto', 'Stock', 'Venta 30d']],
+                df_bajo[['Producto', 'Stock', 'Venta 30d']],
                 hide_index=True,
                 width='stretch'
             )
     
     with col_a3:
-        sin_rotacion = len(df_master[df_master['Estado'] == '⚪ SIN ROTACIÓN'])
-        st.error(f"**{sin_rotacion}** productos sin movimiento")
-        if sin_rotacion > 0:
-            df_sin_rot = df_master[df_master['Estado'] == '⚪ SIN ROTACIÓN'][['Producto', 'Stock', 'Valor Stock']]
+        df_sin_rot = tablero.filas_estado(snapshot, '⚪ SIN ROTACIÓN')[['Producto', 'Stock', 'Valor Stock']]
+        st.error(f"**{len(df_sin_rot)}** productos sin movimiento")
+        if not df_sin_rot.empty:
             st.dataframe(df_sin_rot, hide_index=True, width='stretch')
             st.caption(f"💰 Inmovilizado: ${df_sin_rot['Valor Stock'].sum():,.2f}")
 
@@ -356,21 +409,13 @@ with tab1:
 # Reemplazá TODA la sección del TAB 2 con esto
 # ==========================================================
 
-with tab2:
+def seccion_ventas():
     st.header("🛒 Armar Pedido de Venta")
     
-    with engine.connect() as conn:
-        clientes = pd.read_sql(text("SELECT id_cliente, razon_social FROM clientes"), conn)
-        prods = pd.read_sql(text("""
-        SELECT p.id_producto, p.nombre, m.nombre as marca, p.precio_venta, 
-               p.precio_venta_caja, p.stock_actual, p.unidades_por_caja,
-               p.precio_costo_promedio
-        FROM productos p
-        JOIN marcas m ON p.id_marca = m.id_marca
-        ORDER BY p.nombre
-        """), conn)
-        
-   
+    clientes = catalogo.cargar_clientes(engine)
+    prods = catalogo.cargar_productos(engine)
+    etiq_clientes = catalogo.etiquetas_clientes(engine)
+    etiq_prods = catalogo.etiquetas_productos(engine)
     
     # Selector de producto mejorado
     with st.expander("🍻 Selección de Producto", expanded=True):
@@ -380,7 +425,7 @@ with tab2:
             prod_sel = col_p.selectbox(
                 "Elegí el producto", 
                 options=prods['id_producto'].tolist(), 
-                format_func=lambda x: f"{prods[prods['id_producto']==x]['nombre'].values[0]} ({prods[prods['id_producto']==x]['marca'].values[0]})",
+                format_func=etiq_prods.get,
                 key="sel_prod_v"
             )
             
@@ -389,13 +434,19 @@ with tab2:
             
             if not df_seleccionado.empty:
                 info_prod = df_seleccionado.iloc[0] # <--- ESTO YA NO FALLA
-                stk = info_prod['stock_actual']
+                # Disponible = stock menos lo reservado en los carritos abiertos
+                # (sin base: el stock cacheado menos lo que espera en la cola local)
+                try:
+                    with lectura("stock disponible") as conn:
+                        stk = reservas.disponibles(conn, [prod_sel]).get(prod_sel, info_prod['stock_actual'])
+                except exc.OperationalError:
+                    stk = info_prod['stock_actual'] + cola.en_transito().get(prod_sel, 0)
                 u_caja = info_prod['unidades_por_caja']
                 precio_unidad = float(info_prod['precio_venta'])
                 costo_unitario = float(info_prod['precio_costo_promedio'])
                 
                 # Burbuja de stock
-                col_st.metric("Stock Real", f"{stk} un.", delta=f"{int(stk // u_caja)} cajas", delta_color="normal")
+                col_st.metric("Disponible", f"{stk} un.", delta=f"{int(stk // u_caja)} cajas", delta_color="normal")
         st.markdown("---")
         
         # NUEVA INTERFAZ MÁS CLARA
@@ -475,19 +526,27 @@ with tab2:
         else:
             puede_agregar = True
         
-        # Botón agregar
+        # Botón agregar: reserva las unidades para que otro vendedor no las venda
         if st.button("🛒 Agregar al Pedido", width='stretch', disabled=not puede_agregar):
-            st.session_state.carrito_venta.append({
-                "id_producto": prod_sel,
-                "Producto": f"{info_prod['nombre']} ({info_prod['marca']})",
-                "Formato": formato,
-                "Cantidad": cantidad,
-                "PrecioUnidad": float(precio_por_unidad),
-                "UnidadesTotales": unidades_totales,
-                "Subtotal": float(subtotal),
-                "Costo": float(costo_total_item),
-                "Margen": margen_real
-            })
+            try:
+                reservo, libre = reservas.reservar(engine, st.session_state.reserva_venta, prod_sel, unidades_totales)
+            except exc.OperationalError:
+                reservo, libre = True, None
+                st.warning("⚠️ Sin conexión a la base: se agrega sin reservar el stock.")
+            if not reservo:
+                st.error(f"⚠️ Otro vendedor reservó ese stock: quedan {libre} unidades disponibles.")
+            else:
+                st.session_state.carrito_venta.append({
+                    "id_producto": prod_sel,
+                    "Producto": f"{info_prod['nombre']} ({info_prod['marca']})",
+                    "Formato": formato,
+                    "Cantidad": cantidad,
+                    "PrecioUnidad": float(precio_por_unidad),
+                    "UnidadesTotales": unidades_totales,
+                    "Subtotal": float(subtotal),
+                    "Costo": float(costo_total_item),
+                    "Margen": margen_real
+                })
             
 
     # Detalle del carrito
@@ -542,7 +601,7 @@ with tab2:
             cliente_sel = col_c.selectbox(
                 "Cliente", 
                 options=clientes['id_cliente'].tolist(), 
-                format_func=lambda x: clientes[clientes['id_cliente']==x]['razon_social'].values[0]
+                format_func=etiq_clientes.get
             )
             
             # ACÁ ESTÁ LO NUEVO: Selector de Pago
@@ -557,82 +616,95 @@ with tab2:
             # Botón de Confirmar
             if st.form_submit_button("🚀 Confirmar Venta", width='stretch'):
                 try:
-                    with engine.begin() as conn:
-                        # 1. INSERTAR EN VENTAS (CABECERA) AGREGANDO EL PAGO
-                        res = conn.execute(text("""
-                            INSERT INTO ventas (id_cliente, total_venta, nro_factura, metodo_pago) 
-                            VALUES (:id_c, :total, :fac, :pago) RETURNING id_venta
-                        """), {
-                            "id_c": cliente_sel, 
-                            "total": float(total_venta_final), 
-                            "fac": nro_fac,
-                            "pago": tipo_pago  # <--- Pasamos el dato nuevo
-                        })
-                        
-                        id_v_new = res.fetchone()[0]
-                        
-                        # 2. Guardamos los productos (Detalle)
-                        for item in st.session_state.carrito_venta:
-                            conn.execute(text("""
-                                INSERT INTO detalle_ventas (
-                                    id_venta, id_producto, formato_venta, 
-                                    cantidad_formato, precio_unitario_historico, descripcion
-                                )
-                                VALUES (:id_v, :id_p, :formato, :cant, :precio, :desc)
-                            """), {
-                                "id_v": id_v_new, 
-                                "id_p": item['id_producto'], 
-                                "formato": item['Formato'], 
-                                "cant": item['Cantidad'], 
-                                "precio": float(item['PrecioUnidad']),
-                                "desc": descripcion_venta
-                            })
-                    
-                    st.success(f"✅ Venta N° {id_v_new} ({tipo_pago}) registrada correctamente.")
+                    # Va a la cola local (no espera a la base); el replicador la graba
+                    clave = cola.encolar("venta", {
+                        "id_cliente": cliente_sel,
+                        "total": float(total_venta_final),
+                        "nro_factura": nro_fac,
+                        "metodo_pago": tipo_pago,
+                        "descripcion": descripcion_venta,
+                        "items": st.session_state.carrito_venta,
+                        "fecha": datetime.now().isoformat(timespec="seconds"),
+                        # El replicador se lleva estas reservas al grabar la venta (siguen
+                        # vigentes el TTL; si vencieron, verifica el disponible)
+                        "reserva": st.session_state.reserva_venta,
+                    })
+                    # Carrito vacío en el acto: un doble clic no la duplica
                     st.session_state.carrito_venta = []
-                    st.cache_data.clear()
+                    st.session_state.reserva_venta = reservas.nuevo_carrito()
+                    st.toast(f"✅ Venta ({tipo_pago}) confirmada · 🕓 en cola {clave[:8]}")
                     st.rerun()
                 except Exception as e:
                     st.error(f"Ocurrió un error: {e}")
 
         if st.button("🗑️ Vaciar Pedido"):
+            try:
+                reservas.liberar(engine, st.session_state.reserva_venta)
+            except exc.OperationalError:
+                pass  # sin base: las reservas vencen solas (TTL)
             st.session_state.carrito_venta = []
             st.rerun()
 
+    panel_cola("venta")
+
     # Historial
     st.markdown("---")
     st.subheader("📜 Historial de Ventas")
     
-    query_hist_v = text("""
+    col_hf, col_hc, col_ht = st.columns([2, 2, 1])
+    with col_hf:
+        desde_v, hasta_v = filtro_fechas("hist_v")
+    opciones_cli = [None] + clientes['id_cliente'].tolist()
+    cli_hist = col_hc.selectbox("Cliente", opciones_cli, format_func=lambda x: "Todos" if x is None else etiq_clientes.get(x), key="cli_hist_v")
+    tam_v = col_ht.selectbox("Por página", TAMANIOS_PAGINA, index=1, key="tam_hist_v")
+
+    pag_v = estado_paginacion("hist_v", (desde_v, hasta_v, cli_hist, tam_v))
+    cond_v, params_v = condicion_cursor(pag_v["cursores"][-1], "v.fecha", "v.id_venta")
+    filtro_cli = "AND v.id_cliente = :id_cli" if cli_hist is not None else ""
+
+    # Primero se elige la página de CABECERAS (rango sobre ventas.fecha) y
+    # después se traen sus líneas
+    query_hist_v = text(f"""
+        WITH pagina AS (
+            SELECT v.id_venta, v.fecha, v.nro_factura, v.id_cliente
+            FROM ventas v
+            WHERE v.fecha >= :desde AND v.fecha < CAST(:hasta AS date) + 1
+              {filtro_cli}
+              {cond_v}
+            ORDER BY v.fecha DESC, v.id_venta DESC
+            LIMIT :limite
+        )
         SELECT 
             v.id_venta AS "N°",
+            v.fecha AS fecha_orden,
             v.nro_factura AS "Factura",
             TO_CHAR(v.fecha, 'DD/MM/YY HH24:MI') AS "Fecha",
             c.razon_social AS "Cliente",
             p.nombre || ' (' || m.nombre || ')' AS "Producto",
             dv.cantidad_formato || ' ' || dv.formato_venta AS "Cant.",
             dv.precio_unitario_historico AS "Precio Unit.",
-            ROUND(dv.cantidad_formato * 
-                CASE 
-                    WHEN dv.formato_venta = 'Caja' 
-                    THEN (dv.precio_unitario_historico * p.unidades_por_caja)
-                    ELSE dv.precio_unitario_historico 
-                END, 2
-            ) AS "Subtotal"
-        FROM ventas v
+            -- Unidades y precio de la venta: no cambian si después se edita la caja
+            ROUND(dv.unidades_reales * dv.precio_unitario_historico, 2) AS "Subtotal"
+        FROM pagina v
         JOIN clientes c ON v.id_cliente = c.id_cliente
         JOIN detalle_ventas dv ON v.id_venta = dv.id_venta
         JOIN productos p ON dv.id_producto = p.id_producto
         JOIN marcas m ON p.id_marca = m.id_marca
-        ORDER BY v.fecha DESC
-        LIMIT 100
+        ORDER BY v.fecha DESC, v.id_venta DESC
     """)
     
-    with engine.connect() as conn:
-        df_hv = pd.read_sql(query_hist_v, conn)
+    try:
+        with lectura("query_hist_v") as conn:
+            df_hv = pd.read_sql(query_hist_v, conn, params={
+                "desde": desde_v, "hasta": hasta_v, "id_cli": cli_hist, "limite": tam_v + 1, **params_v
+            })
+    except exc.OperationalError:
+        st.warning("⚠️ Sin conexión a la base: el historial vuelve cuando se reconecte (lo confirmado espera en la cola).")
+        return
+    df_hv, hay_mas_v, ultimo_v = cortar_pagina(df_hv, "N°", "fecha_orden", tam_v)
     
     st.dataframe(
-        df_hv,
+        df_hv.drop(columns=["fecha_orden"]),
         width='stretch',
         hide_index=True,
         column_config={
@@ -640,6 +712,8 @@ with tab2:
             "Subtotal": st.column_config.NumberColumn(format="$%.2f")
         }
     )
+    controles_paginacion("hist_v", pag_v, hay_mas_v, ultimo_v)
+    exportador("ventas", ["Ventas (detalle)"])
     
     with st.expander("⚠️ Cancelar una Venta"):
         if len(df_hv) > 0:
@@ -647,10 +721,9 @@ with tab2:
             if st.button("❌ Eliminar Venta", type="primary"):
                 try:
                     with engine.begin() as conn:
-                        conn.execute(text("DELETE FROM detalle_ventas WHERE id_venta = :id"), {"id": int(id_v_del)})
-                        conn.execute(text("DELETE FROM ventas WHERE id_venta = :id"), {"id": int(id_v_del)})
+                        servicios.anular_venta(conn, id_v_del)
                     st.success(f"Venta N° {id_v_del} eliminada y stock recompuesto.")
-                    st.cache_data.clear()
+                    catalogo.invalidar("productos")
                     st.rerun()
                 except Exception as e:
                     st.error(f"No se pudo borrar: {e}")
@@ -664,13 +737,14 @@ with tab2:
 # ==========================================================
 # TAB 3: GESTIÓN DE STOCK Y PRECIOS
 # ==========================================================
-with tab3:
+def seccion_compras():
     st.title("📦 Gestión de Stock y Precios")
 
-    # Inicialización de conexión y carga de datos básicos para los selectores
-    with engine.connect() as conn:
-        provs = pd.read_sql(text("SELECT id_proveedor, nombre FROM proveedores ORDER BY nombre"), conn)
-        prods_all = pd.read_sql(text("SELECT id_producto, nombre FROM productos ORDER BY nombre"), conn)
+    # Catálogos para los selectores (cacheados)
+    provs = catalogo.cargar_proveedores(engine)
+    prods_all = catalogo.cargar_productos(engine)
+    etiq_provs = catalogo.etiquetas_proveedores(engine)
+    etiq_prods = catalogo.etiquetas_productos(engine)
 
     # ----------------------------------------------------------------------
     # SECCIÓN 1: INGRESO DE MERCADERÍA (COMPRAS) - "Lo de siempre"
@@ -683,7 +757,7 @@ with tab3:
         prod_sel = col_p2.selectbox(
             "Producto", 
             options=prods_all['id_producto'].tolist(), 
-            format_func=lambda x: prods_all[prods_all['id_producto']==x]['nombre'].values[0], 
+            format_func=etiq_prods.get, 
             key="sel_prod_c"
         )
         
@@ -724,37 +798,22 @@ with tab3:
             prov_sel = col_pr.selectbox(
                 "Proveedor", 
                 options=provs['id_proveedor'].tolist(), 
-                format_func=lambda x: provs[provs['id_proveedor']==x]['nombre'].values[0]
+                format_func=etiq_provs.get
             )
             flete_total = col_fl.number_input("Flete Total de la Factura ($)", min_value=0.0)
             
             if st.form_submit_button("💾 Guardar Compra Completa", width='stretch'):
                 try:
-                    total_final = float(total_neto + flete_total)
-                    with engine.begin() as conn:
-                        # 1. Guardar Cabecera Compra
-                        res = conn.execute(text("""
-                            INSERT INTO compras (id_proveedor, total_compra, costo_flete, nro_factura) 
-                            VALUES (:id_p, :total, :flete, :fac) RETURNING id_compra
-                        """), {"id_p": prov_sel, "total": total_final, "flete": float(flete_total), "fac": nro_fac})
-                        id_compra_new = res.fetchone()[0]
-                        
-                        # 2. Guardar Detalles
-                        for item in st.session_state.carrito_compra:
-                            conn.execute(text("""
-                                INSERT INTO detalle_compras (id_compra, id_producto, cantidad_unidades, precio_compra_neto)
-                                VALUES (:id_c, :id_p, :cant, :precio)
-                            """), {
-                                "id_c": id_compra_new, 
-                                "id_p": item['id_producto'], 
-                                "cant": item['Cantidad'], 
-                                "precio": float(item['Costo Neto'])
-                            })
-                    
-                    st.success(f"✅ ¡Compra N° {id_compra_new} guardada con éxito!")
+                    clave = cola.encolar("compra", {
+                        "id_proveedor": prov_sel,
+                        "total": float(total_neto + flete_total),
+                        "flete": float(flete_total),
+                        "nro_factura": nro_fac,
+                        "items": st.session_state.carrito_compra,
+                        "fecha": datetime.now().isoformat(timespec="seconds"),
+                    })
                     st.session_state.carrito_compra = []
-                    st.cache_data.clear()
-                    time.sleep(0.5)
+                    st.toast(f"✅ Compra confirmada · 🕓 en cola {clave[:8]}")
                     st.rerun()
                 except Exception as e:
                     st.error(f"Error al guardar: {e}")
@@ -763,6 +822,8 @@ with tab3:
             st.session_state.carrito_compra = []
             st.rerun()
 
+    panel_cola("compra")
+
     st.markdown("---")
 
     # ----------------------------------------------------------------------
@@ -771,19 +832,7 @@ with tab3:
     with st.expander("💲 Actualizar Precio de Venta", expanded=False):
         st.caption("Seleccioná un producto para modificar su precio de venta al público.")
         
-        with engine.connect() as conn:
-            # CORRECCIÓN APLICADA: JOIN con marcas para evitar el error de columna
-            query_selector = text("""
-                SELECT 
-                    p.id_producto, 
-                    p.nombre, 
-                    m.nombre as marca, 
-                    p.precio_venta 
-                FROM productos p
-                JOIN marcas m ON p.id_marca = m.id_marca
-                ORDER BY p.nombre
-            """)
-            df_prod_precios = pd.read_sql(query_selector, conn)
+        df_prod_precios = catalogo.cargar_productos(engine)
         
         c_p1, c_p2, c_p3 = st.columns([3, 2, 2])
         
@@ -791,7 +840,7 @@ with tab3:
         prod_a_cambiar = c_p1.selectbox(
             "Buscar Producto a Actualizar", 
             df_prod_precios['id_producto'].tolist(),
-            format_func=lambda x: f"{df_prod_precios[df_prod_precios['id_producto']==x]['nombre'].values[0]} ({df_prod_precios[df_prod_precios['id_producto']==x]['marca'].values[0]})",
+            format_func=etiq_prods.get,
             key="sel_update_price"
         )
         
@@ -809,16 +858,9 @@ with tab3:
             if nuevo_precio != precio_viejo:
                 try:
                     with engine.begin() as conn:
-                        # A. Actualizar Producto
-                        conn.execute(text("UPDATE productos SET precio_venta = :np WHERE id_producto = :idp"), 
-                                   {"np": nuevo_precio, "idp": prod_a_cambiar})
-                        
-                        # B. Guardar Historial (Bitácora)
-                        conn.execute(text("""
-                            INSERT INTO historial_precios (id_producto, precio_anterior, precio_nuevo)
-                            VALUES (:idp, :pv, :pn)
-                        """), {"idp": prod_a_cambiar, "pv": precio_viejo, "pn": nuevo_precio})
-                        
+                        # Producto + bitácora de precios en un solo viaje
+                        precio_viejo = servicios.actualizar_precio(conn, prod_a_cambiar, nuevo_precio) or precio_viejo
+                    catalogo.invalidar("productos")
                     st.success(f"✅ ¡Hecho! {datos_prod['nombre']} pasó de ${precio_viejo:,.2f} a ${nuevo_precio:,.2f}")
                     time.sleep(0.5)
                     st.rerun()
@@ -827,6 +869,75 @@ with tab3:
             else:
                 st.warning("El precio nuevo es igual al actual. Modificalo primero.")
 
+    with st.expander("📈 Remarcación Masiva", expanded=False):
+        st.caption("Cambiá el precio de muchos productos a la vez: por marca, por proveedor o por nombre.")
+
+        df_remarcar = catalogo.cargar_productos(engine)
+        f1, f2, f3 = st.columns(3)
+        marcas_rem = f1.multiselect("Marcas", catalogo.cargar_marcas(engine)['id_marca'].tolist(),
+                                    format_func=catalogo.etiquetas_marcas(engine).get, key="rem_marcas",
+                                    placeholder="Todas")
+        prov_rem = f2.selectbox("Proveedor", [None] + provs['id_proveedor'].tolist(),
+                                format_func=lambda x: "Todos" if x is None else etiq_provs.get(x), key="rem_prov")
+        texto_rem = f3.text_input("Nombre contiene", key="rem_texto")
+
+        if marcas_rem:
+            df_remarcar = df_remarcar[df_remarcar['id_marca'].isin(marcas_rem)]
+        if prov_rem is not None:
+            df_remarcar = df_remarcar[df_remarcar['id_producto'].isin(precios.productos_de_proveedor(engine, prov_rem))]
+        if texto_rem:
+            df_remarcar = df_remarcar[df_remarcar['nombre'].str.contains(texto_rem, case=False, regex=False)]
+
+        r1, r2, r3 = st.columns(3)
+        modo = precios.MODOS[r1.radio("Regla", list(precios.MODOS), key="rem_modo")]
+        valor = r2.number_input("Valor", value=10.0, step=1.0, key="rem_valor",
+                                help="Porcentaje de aumento (negativo = baja), monto a sumar o margen sobre el precio de venta")
+        paso = r3.selectbox("Redondear a", precios.REDONDEOS, index=1, key="rem_paso",
+                            format_func=lambda x: "centavos" if x < 1 else f"${x:,.0f}")
+
+        if modo == "margen":
+            sin_costo = df_remarcar['precio_costo_promedio'] <= 0
+            if sin_costo.any():
+                st.warning(f"{int(sin_costo.sum())} producto(s) sin costo cargado quedan afuera.")
+            df_remarcar = df_remarcar[~sin_costo]
+
+        error_regla = precios.validar_regla(modo, valor)
+        if error_regla:
+            st.error(error_regla)
+        elif df_remarcar.empty:
+            st.info("Ningún producto coincide con los filtros.")
+        else:
+            vista = precios.previsualizar(df_remarcar, modo, valor, paso)
+            cambian = vista[vista['Precio Nuevo'] != vista['Precio Actual']]
+            k1, k2, k3 = st.columns(3)
+            k1.metric("Productos que cambian", f"{len(cambian)} de {len(vista)}")
+            k2.metric("Margen promedio actual", f"{vista['Margen Actual %'].mean():.1f}%")
+            k3.metric("Margen promedio nuevo", f"{vista['Margen Nuevo %'].mean():.1f}%")
+            bajo_costo = int((vista['Precio Nuevo'] < vista['Costo']).sum())
+            if bajo_costo:
+                st.warning(f"⚠️ {bajo_costo} producto(s) quedarían por debajo del costo.")
+            st.dataframe(
+                vista.drop(columns=['id_producto']), hide_index=True, width='stretch', height=300,
+                column_config={
+                    "Costo": st.column_config.NumberColumn(format="$%.2f"),
+                    "Precio Actual": st.column_config.NumberColumn(format="$%.2f"),
+                    "Precio Nuevo": st.column_config.NumberColumn(format="$%.2f"),
+                    "Caja Nueva": st.column_config.NumberColumn(format="$%.2f"),
+                    "Variación %": st.column_config.NumberColumn(format="%.1f%%"),
+                    "Margen Actual %": st.column_config.NumberColumn(format="%.1f%%"),
+                    "Margen Nuevo %": st.column_config.NumberColumn(format="%.1f%%"),
+                },
+            )
+            if st.button(f"💾 Remarcar {len(cambian)} producto(s)", type="primary", width='stretch',
+                         disabled=cambian.empty, key="btn_remarcar"):
+                try:
+                    # Se recalcula sobre el precio vigente en la base, no sobre el cache
+                    cantidad = precios.aplicar(engine, cambian['id_producto'].tolist(), modo, valor, paso)
+                    catalogo.invalidar("productos")
+                    st.success(f"✅ {cantidad} precio(s) actualizados y registrados en el historial.")
+                except Exception as e:
+                    st.error(f"Error: {e}")
+
     st.markdown("---")
 
     # ----------------------------------------------------------------------
@@ -834,40 +945,71 @@ with tab3:
     # ----------------------------------------------------------------------
     st.subheader("🚛 Historial de Ingresos")
     
-    query_hist_c = text("""
+    col_hf, col_hp, col_ht = st.columns([2, 2, 1])
+    with col_hf:
+        desde_c, hasta_c = filtro_fechas("hist_c", dias=90)
+    opciones_prov = [None] + provs['id_proveedor'].tolist()
+    prov_hist = col_hp.selectbox("Proveedor", opciones_prov, format_func=lambda x: "Todos" if x is None else etiq_provs.get(x), key="prov_hist_c")
+    tam_c = col_ht.selectbox("Por página", TAMANIOS_PAGINA, index=1, key="tam_hist_c")
+
+    pag_c = estado_paginacion("hist_c", (desde_c, hasta_c, prov_hist, tam_c))
+    cond_c, params_c = condicion_cursor(pag_c["cursores"][-1], "comp.fecha", "comp.id_compra")
+    filtro_prov = "AND comp.id_proveedor = :id_prov" if prov_hist is not None else ""
+
+    query_hist_c = text(f"""
+        WITH pagina AS (
+            SELECT comp.*
+            FROM compras comp
+            WHERE comp.fecha >= :desde AND comp.fecha < CAST(:hasta AS date) + 1
+              {filtro_prov}
+              {cond_c}
+            ORDER BY comp.fecha DESC, comp.id_compra DESC
+            LIMIT :limite
+        )
         SELECT 
             comp.id_compra AS "N°",
+            comp.fecha AS fecha_orden,
             comp.nro_factura AS "Factura", 
             TO_CHAR(comp.fecha, 'DD/MM/YY') AS "Fecha",
             prov.nombre AS "Proveedor", 
             prod.nombre AS "Producto",
             dc.cantidad_unidades AS "Unid.",
             dc.precio_compra_neto AS "Costo Lista",
-            ROUND(dc.precio_compra_neto * (1 + (comp.costo_flete / NULLIF(comp.total_compra - comp.costo_flete, 0))), 2) AS "Costo Real",
+            dc.flete_asignado AS "Flete Línea",
+            dc.costo_real AS "Costo Real",
             (dc.cantidad_unidades * dc.precio_compra_neto) AS "Subtotal Neto",
             comp.costo_flete AS "Flete Total"
-        FROM compras comp
+        FROM pagina comp
         JOIN proveedores prov ON comp.id_proveedor = prov.id_proveedor
         JOIN detalle_compras dc ON comp.id_compra = dc.id_compra
         JOIN productos prod ON dc.id_producto = prod.id_producto
-        ORDER BY comp.id_compra DESC
-        LIMIT 100
+        ORDER BY comp.fecha DESC, comp.id_compra DESC
     """)
     
-    with engine.connect() as conn:
-        df_hc = pd.read_sql(query_hist_c, conn)
+    try:
+        with lectura("query_hist_c") as conn:
+            df_hc = pd.read_sql(query_hist_c, conn, params={
+                "desde": desde_c, "hasta": hasta_c, "id_prov": prov_hist, "limite": tam_c + 1, **params_c
+            })
+    except exc.OperationalError:
+        st.warning("⚠️ Sin conexión a la base: el historial vuelve cuando se reconecte (lo confirmado espera en la cola).")
+        return
+    df_hc, hay_mas_c, ultimo_c = cortar_pagina(df_hc, "N°", "fecha_orden", tam_c)
     
     st.dataframe(
-        df_hc,
+        df_hc.drop(columns=["fecha_orden"]),
         width='stretch',
         hide_index=True,
         column_config={
             "Costo Lista": st.column_config.NumberColumn(format="$%.2f"),
+            "Flete Línea": st.column_config.NumberColumn(format="$%.2f"),
             "Costo Real": st.column_config.NumberColumn(format="$%.2f"),
             "Subtotal Neto": st.column_config.NumberColumn(format="$%.2f"),
             "Flete Total": st.column_config.NumberColumn(format="$%.2f")
         }
     )
+    controles_paginacion("hist_c", pag_c, hay_mas_c, ultimo_c)
+    exportador("compras", ["Compras (detalle)", "Historial de precios"])
     
     with st.expander("⚠️ Cancelar un Ingreso de Stock"):
         if len(df_hc) > 0:
@@ -875,10 +1017,9 @@ with tab3:
             if st.button("🗑️ Eliminar Compra", type="primary"):
                 try:
                     with engine.begin() as conn:
-                        conn.execute(text("DELETE FROM detalle_compras WHERE id_compra = :id"), {"id": int(id_c_del)})
-                        conn.execute(text("DELETE FROM compras WHERE id_compra = :id"), {"id": int(id_c_del)})
-                    st.success(f"Compra N° {id_c_del} eliminada. Stock ajustado.")
-                    st.cache_data.clear()
+                        servicios.anular_compra(conn, id_c_del)
+                    st.success(f"Compra N° {id_c_del} eliminada. Stock y costo promedio revertidos.")
+                    catalogo.invalidar("productos")
                     time.sleep(1)
                     st.rerun()
                 except Exception as e:
@@ -890,20 +1031,12 @@ with tab3:
 # ==========================================================
 # TAB 4: GESTIÓN DE CONCESIONES
 # ==========================================================
-with tab4:
+def seccion_concesiones():
     st.title("🤝 Gestión de Mercadería en Consignación")
 
     # --- KPIs DE LA CALLE ---
-    query_kpi_concesion = text("""
-        SELECT 
-            COALESCE(SUM(stock_concesion), 0) as unidades_calle,
-            COALESCE(SUM(stock_concesion * precio_costo_promedio), 0) as capital_riesgo,
-            COALESCE(SUM(stock_concesion * precio_venta), 0) as venta_potencial
-        FROM productos
-    """)
-    
-    with engine.connect() as conn:
-        kpis_c = conn.execute(query_kpi_concesion).fetchone()
+    kpis_c = tablero.cargar_kpis_concesion(engine)
+    st.caption(refresco.texto_edad(tablero.cargar_kpis_concesion, engine))
     
     col_k1, col_k2, col_k3 = st.columns(3)
     col_k1.metric("📦 Unidades en la Calle", f"{kpis_c[0]:,.0f}")
@@ -915,36 +1048,50 @@ with tab4:
     # --- SECCIÓN 1: NUEVA ENTREGA ---
     with st.expander("🚚 Nueva Entrega en Concesión", expanded=False):
         
-        with engine.connect() as conn:
-            # Traemos clientes y productos
-            cli_conc = pd.read_sql(text("SELECT id_cliente, razon_social FROM clientes ORDER BY razon_social"), conn)
-            # Solo traemos productos que tengan stock físico > 0
-            prod_conc = pd.read_sql(text("""
-                SELECT id_producto, nombre, stock_actual 
-                FROM productos 
-                WHERE stock_actual > 0 
-                ORDER BY nombre
-            """), conn)
+        # Traemos clientes y productos (cacheados)
+        cli_conc = catalogo.cargar_clientes(engine)
+        # Solo productos que tengan stock físico > 0
+        prods_conc_all = catalogo.cargar_productos(engine)
+        prod_conc = prods_conc_all[prods_conc_all['stock_actual'] > 0]
+        etiq_prod_conc = catalogo.armar_etiquetas(
+            prod_conc['id_producto'],
+            prod_conc['nombre'] + " (Stock: " + prod_conc['stock_actual'].astype(str) + ")"
+        )
+        etiq_cli_conc = catalogo.etiquetas_clientes(engine)
 
         c1, c2, c3 = st.columns([2, 2, 1])
         
         # Selectores
         prod_sel_c = c1.selectbox("Producto a entregar", prod_conc['id_producto'].tolist(), 
-                                format_func=lambda x: f"{prod_conc[prod_conc['id_producto']==x]['nombre'].values[0]} (Stock: {prod_conc[prod_conc['id_producto']==x]['stock_actual'].values[0]})",
+                                format_func=etiq_prod_conc.get,
                                 key="p_conc")
         
-        # Validamos stock disponible para el input
-        stock_disp = prod_conc[prod_conc['id_producto']==prod_sel_c]['stock_actual'].values[0] if not prod_conc.empty else 0
+        # Validamos stock disponible para el input (descontando lo reservado en otros carritos)
+        stock_disp = 0
+        if not prod_conc.empty:
+            try:
+                with lectura("stock disponible") as conn:
+                    stock_disp = reservas.disponibles(conn, [prod_sel_c]).get(prod_sel_c, 0)
+            except exc.OperationalError:
+                stock_disp = int(prod_conc.loc[prod_conc['id_producto'] == prod_sel_c, 'stock_actual'].iloc[0])
         
         cant_c = c2.number_input("Cantidad a dejar", min_value=1, max_value=int(stock_disp) if stock_disp > 0 else 1, step=1, key="cant_conc")
         
-        if c3.button("➕ Agregar", width='stretch'):
-            nombre_p = prod_conc[prod_conc['id_producto'] == prod_sel_c]['nombre'].values[0]
-            st.session_state.carrito_concesion.append({
-                "id": prod_sel_c,
-                "nombre": nombre_p,
-                "cantidad": cant_c
-            })
+        if c3.button("➕ Agregar", width='stretch', disabled=stock_disp <= 0):
+            try:
+                reservo, libre = reservas.reservar(engine, st.session_state.reserva_concesion, prod_sel_c, cant_c)
+            except exc.OperationalError:
+                reservo, libre = True, None
+                st.warning("⚠️ Sin conexión a la base: se agrega sin reservar el stock.")
+            if not reservo:
+                st.error(f"⚠️ Otro vendedor reservó ese stock: quedan {libre} unidades disponibles.")
+            else:
+                nombre_p = prod_conc[prod_conc['id_producto'] == prod_sel_c]['nombre'].values[0]
+                st.session_state.carrito_concesion.append({
+                    "id": prod_sel_c,
+                    "nombre": nombre_p,
+                    "cantidad": cant_c
+                })
             
 
         # Visualizar Carrito Concesión
@@ -955,24 +1102,23 @@ with tab4:
             
             col_confirm_1, col_confirm_2 = st.columns(2)
             cliente_final = col_confirm_1.selectbox("Cliente / Local", cli_conc['id_cliente'].tolist(), 
-                                                  format_func=lambda x: cli_conc[cli_conc['id_cliente']==x]['razon_social'].values[0])
+                                                  format_func=etiq_cli_conc.get)
             
             if col_confirm_2.button("🚀 Confirmar Entrega", type="primary", width='stretch'):
                 try:
+                    pedido_conc = {}
+                    for item in st.session_state.carrito_concesion:
+                        pedido_conc[int(item["id"])] = pedido_conc.get(int(item["id"]), 0) + int(item["cantidad"])
                     with engine.begin() as conn:
-                        # 1. Crear Cabecera
-                        res = conn.execute(text("INSERT INTO concesiones (id_cliente) VALUES (:id_c) RETURNING id_concesion"), {"id_c": cliente_final})
-                        id_new_conc = res.fetchone()[0]
-                        
-                        # 2. Insertar Detalles (El trigger moverá el stock solo)
-                        for item in st.session_state.carrito_concesion:
-                            conn.execute(text("""
-                                INSERT INTO detalle_concesiones (id_concesion, id_producto, cantidad)
-                                VALUES (:id_con, :id_prod, :cant)
-                            """), {"id_con": id_new_conc, "id_prod": item['id'], "cant": item['cantidad']})
+                        # Se llevan las reservas del carrito (y se verifica lo que no estaba reservado)
+                        reservas.consumir(conn, st.session_state.reserva_concesion, pedido_conc)
+                        # Cabecera + detalle en un solo viaje (el trigger moverá el stock solo)
+                        id_new_conc = servicios.registrar_concesion(conn, cliente_final, st.session_state.carrito_concesion)
                     
                     st.success(f"✅ ¡Concesión N° {id_new_conc} registrada! El stock se movió a 'En Concesión'.")
                     st.session_state.carrito_concesion = []
+                    st.session_state.reserva_concesion = reservas.nuevo_carrito()
+                    catalogo.invalidar("productos")
                     st.rerun()
                 except Exception as e:
                     st.error(f"Error: {e}")
@@ -1003,7 +1149,7 @@ with tab4:
         ORDER BY "Días Pasados" DESC
     """)
     
-    with engine.connect() as conn:
+    with lectura("query_estado_conc") as conn:
         df_estado = pd.read_sql(query_estado_conc, conn)
     
     if not df_estado.empty:
@@ -1030,7 +1176,7 @@ with tab4:
     st.header("🔄 Procesar Concesión (Liquidar o Devolver)")
 
     # 1. Seleccionar Cliente con Deuda
-    with engine.connect() as conn:
+    with lectura("clientes_con_deuda") as conn:
         # Buscamos clientes que tengan cosas activas en la tabla detalle_concesiones
         clientes_con_deuda = pd.read_sql(text("""
             SELECT DISTINCT c.id_cliente, c.razon_social 
@@ -1040,9 +1186,10 @@ with tab4:
         """), conn)
 
     if not clientes_con_deuda.empty:
+        etiq_deudores = catalogo.armar_etiquetas(clientes_con_deuda['id_cliente'], clientes_con_deuda['razon_social'])
         cli_proc = st.selectbox("Seleccionar Local para gestionar", 
                               clientes_con_deuda['id_cliente'].tolist(),
-                              format_func=lambda x: clientes_con_deuda[clientes_con_deuda['id_cliente']==x]['razon_social'].values[0])
+                              format_func=etiq_deudores.get)
         
         # 2. Ver qué tiene ese cliente
         if cli_proc:
@@ -1059,111 +1206,73 @@ with tab4:
                 JOIN productos p ON dc.id_producto = p.id_producto
                 WHERE c.id_cliente = :idc AND c.estado = 'ACTIVA'
             """)
-            with engine.connect() as conn:
+            with lectura("query_items_cli") as conn:
                 items_cli = pd.read_sql(query_items_cli, conn, params={"idc": cli_proc})
             
             if not items_cli.empty:
-                st.info(f"Artículos pendientes en: {clientes_con_deuda[clientes_con_deuda['id_cliente']==cli_proc]['razon_social'].values[0]}")
+                st.info(f"Artículos pendientes en: {etiq_deudores[cli_proc]}")
                 
-                # Iteramos por cada producto que tiene el cliente
-                for index, row in items_cli.iterrows():
-                    with st.container():
-                        # Agrandamos un cachito las columnas para que entre el precio
-                        c_prod, c_accion, c_cant, c_precio, c_boton = st.columns([2.5, 2, 1.2, 1.5, 1.5])
-                        
-                        # Nombre del producto
-                        c_prod.markdown(f"**{row['nombre']}**\n\n<small>Stock allá: {row['entregado']}</small>", unsafe_allow_html=True)
-                        
-                        # Radio Button (Vender vs Devolver)
-                        accion = c_accion.radio(
-                            "Acción", 
-                            ["💰 COBRAR", "🔙 DEVOLVER"], 
-                            key=f"act_{row['id_detalle']}", 
-                            label_visibility="collapsed"
-                        )
-                        
-                        # Input de Cantidad
-                        cant_gest = c_cant.number_input(
-                            "Cant.", 
-                            min_value=1, 
-                            max_value=row['entregado'], 
-                            step=1, 
-                            key=f"cant_{row['id_detalle']}"
-                        )
-
-                        # --- CAMBIO CLAVE: Input de Precio (Editable) ---
-                        # Por defecto trae el precio de lista (row['precio_venta']), pero lo podés tocar.
-                        precio_final = c_precio.number_input(
-                            "Precio $",
-                            min_value=0.0,
-                            value=float(row['precio_venta']),
-                            step=50.0,
-                            key=f"precio_{row['id_detalle']}"
-                        )
-                        
-                        # Botón Aplicar
-                        if c_boton.button("Aplicar", key=f"btn_{row['id_detalle']}", width='stretch'):
-                            try:
-                                with engine.begin() as conn:
-                                    # CASO A: VENTA (El cliente vendió y paga)
-                                    if "COBRAR" in accion:
-                                        # 1. Crear Venta Oficial
-                                        # ACÁ USAMOS EL PRECIO EDITADO (precio_final)
-                                        total_operacion = float(cant_gest * precio_final)
-                                        
-                                        res = conn.execute(text("INSERT INTO ventas (id_cliente, total_venta, nro_factura) VALUES (:idc, :tot, 'CONCESION') RETURNING id_venta"), 
-                                                         {"idc": cli_proc, "tot": total_operacion})
-                                        id_v_new = res.fetchone()[0]
-                                        
-                                        # 2. Insertar Detalle con FLAG es_concesion = TRUE
-                                        # ACÁ TAMBIÉN USAMOS EL PRECIO EDITADO
-                                        conn.execute(text("""
-                                            INSERT INTO detalle_ventas (id_venta, id_producto, formato_venta, cantidad_formato, precio_unitario_historico, es_concesion)
-                                            VALUES (:idv, :idp, 'Unidad', :cant, :precio, desc, TRUE)
-                                        """), {
-                                            "idv": id_v_new,
-                                            "idp": row['id_producto'],
-                                            "cant": cant_gest,
-                                            "precio": precio_final,
-                                            "desc": descripcion_venta# <--- Usamos el manual
-                                        })
-                                        msg = f"✅ ¡Cobrado! {cant_gest} un. a ${precio_final:,.2f} c/u. Total: ${total_operacion:,.2f}"
-
-                                    # CASO B: DEVOLUCIÓN (El cliente te devuelve la mercadería)
-                                    else:
-                                        # Devolvemos stock: Resta de Concesión, Suma a Físico
-                                        conn.execute(text("""
-                                            UPDATE productos 
-                                            SET stock_concesion = stock_concesion - :cant,
-                                                stock_actual = stock_actual + :cant
-                                            WHERE id_producto = :idp
-                                        """), {"cant": cant_gest, "idp": row['id_producto']})
-                                        
-                                        # Auditoría manual
-                                        conn.execute(text("""
-                                            INSERT INTO inventario_movimientos (id_producto, tipo, cantidad, fecha)
-                                            VALUES (:idp, 'DEVOLUCION_CONCESION', :cant, NOW())
-                                        """), {"idp": row['id_producto'], "cant": cant_gest})
-                                        msg = f"🔙 ¡Retornado! {cant_gest} unidades volvieron al galpón."
-
-                                    # FINAL COMÚN: Actualizar tabla de concesiones
-                                    if cant_gest == row['entregado']:
-                                        conn.execute(text("DELETE FROM detalle_concesiones WHERE id_detalle = :idd"), {"idd": row['id_detalle']})
-                                    else:
-                                        conn.execute(text("UPDATE detalle_concesiones SET cantidad = cantidad - :cant WHERE id_detalle = :idd"), 
-                                                   {"cant": cant_gest, "idd": row['id_detalle']})
-                                    
-                                    # Limpieza de cabeceras vacías
-                                    conn.execute(text("DELETE FROM concesiones WHERE id_concesion NOT IN (SELECT DISTINCT id_concesion FROM detalle_concesiones)"))
-                                
-                                st.success(msg)
-                                time.sleep(0.5) # Un segundito para leer el mensaje
-                                st.rerun()
-                                
-                            except Exception as e:
-                                st.error(f"Error al procesar: {e}")
-                        
-                        st.divider()
+                st.caption("Cargá cuánto cobrar y cuánto vuelve al galpón en cada fila: se confirma todo junto.")
+
+                # Punto de partida de la grilla (cambiarlo la reinicia)
+                inicial = st.radio(
+                    "Completar con",
+                    ["Nada", "💰 Cobrar todo", "🔙 Devolver todo"],
+                    horizontal=True,
+                    key=f"inicial_liq_{cli_proc}"
+                )
+                grilla = items_cli[['id_detalle', 'id_producto', 'nombre', 'entregado', 'precio_venta']].copy()
+                grilla['cobrar'] = grilla['entregado'] if "Cobrar" in inicial else 0
+                grilla['devolver'] = grilla['entregado'] if "Devolver" in inicial else 0
+
+                # Precio por defecto = precio de lista, pero se puede tocar fila por fila
+                editada = st.data_editor(
+                    grilla,
+                    key=f"liq_{cli_proc}_{inicial}",
+                    width='stretch',
+                    hide_index=True,
+                    disabled=["nombre", "entregado"],
+                    column_order=["nombre", "entregado", "cobrar", "devolver", "precio_venta"],
+                    column_config={
+                        "nombre": "Producto",
+                        "entregado": st.column_config.NumberColumn("Stock allá", format="%d"),
+                        "cobrar": st.column_config.NumberColumn("💰 Cobrar", min_value=0, step=1, format="%d"),
+                        "devolver": st.column_config.NumberColumn("🔙 Devolver", min_value=0, step=1, format="%d"),
+                        "precio_venta": st.column_config.NumberColumn("Precio $", min_value=0.0, step=50.0, format="$%.2f"),
+                    }
+                )
+                editada[['cobrar', 'devolver']] = editada[['cobrar', 'devolver']].fillna(0).astype(int)
+                editada['precio_venta'] = editada['precio_venta'].fillna(0)
+
+                excedidas = editada[editada['cobrar'] + editada['devolver'] > editada['entregado']]
+                total_cobro = float((editada['cobrar'] * editada['precio_venta']).sum())
+                col_l1, col_l2, col_l3 = st.columns(3)
+                col_l1.metric("Unidades a cobrar", int(editada['cobrar'].sum()))
+                col_l2.metric("Unidades a devolver", int(editada['devolver'].sum()))
+                col_l3.metric("Total a cobrar", f"${total_cobro:,.2f}")
+
+                if not excedidas.empty:
+                    st.error(f"⚠️ Cobrar + Devolver supera lo entregado en: {', '.join(excedidas['nombre'])}")
+                elif st.button("✅ Confirmar Liquidación", type="primary", width='stretch'):
+                    lineas = editada[editada['cobrar'] + editada['devolver'] > 0]
+                    if lineas.empty:
+                        st.warning("No hay nada para cobrar ni devolver.")
+                    else:
+                        try:
+                            with engine.begin() as conn:
+                                id_v_new = servicios.liquidar_concesion(
+                                    conn, cli_proc,
+                                    lineas.rename(columns={'precio_venta': 'precio'}).to_dict('records')
+                                )
+                            catalogo.invalidar("productos")
+                            msg = f"✅ ¡Liquidado! Venta N° {id_v_new} por ${total_cobro:,.2f}." if id_v_new else "🔙 ¡Retornado!"
+                            if int(lineas['devolver'].sum()):
+                                msg += f" {int(lineas['devolver'].sum())} unidades volvieron al galpón."
+                            st.success(msg)
+                            time.sleep(0.5) # Un segundito para leer el mensaje
+                            st.rerun()
+                        except Exception as e:
+                            st.error(f"Error al procesar: {e}")
             else:
                 st.warning("Este cliente no tiene productos cargados actualmente.")
     else:
@@ -1177,100 +1286,86 @@ with tab4:
 # ==========================================================
 # TAB 5: ANÁLISIS Y REPORTES
 # ==========================================================
-with tab5:
+def seccion_analisis():
     st.title("📈 Análisis y Reportes")
     
-    # Selector de período
-    col_p1, col_p2 = st.columns(2)
+    # Período libre + comparación + filtros: todo se responde desde el cubo
+    col_p1, col_p2, col_p3 = st.columns([2, 2, 1])
     with col_p1:
-        dias_analisis = st.selectbox("Período de análisis", [7, 30, 60, 90, 180, 365], index=1)
-    with col_p2:
-        st.metric("Analizando últimos", f"{dias_analisis} días")
+        desde_an, hasta_an = filtro_fechas("analisis")
+    comparacion = col_p2.selectbox("Comparar contra", cubo.COMPARACIONES)
+    grano = col_p3.selectbox("Agrupar por", list(cubo.GRANOS))
+
+    with st.expander("🔎 Filtros (marca, cliente, producto)"):
+        col_fa1, col_fa2, col_fa3 = st.columns(3)
+        etiq_marcas_an = catalogo.etiquetas_marcas(engine)
+        etiq_clientes_an = catalogo.etiquetas_clientes(engine)
+        etiq_prods_an = catalogo.etiquetas_productos(engine)
+        marcas_an = col_fa1.multiselect("Marcas", list(etiq_marcas_an), format_func=etiq_marcas_an.get)
+        clientes_an = col_fa2.multiselect("Clientes", list(etiq_clientes_an), format_func=etiq_clientes_an.get)
+        productos_an = col_fa3.multiselect("Productos", list(etiq_prods_an), format_func=etiq_prods_an.get)
+    filtros_an = {"marcas": tuple(marcas_an), "clientes": tuple(clientes_an), "productos": tuple(productos_an)}
+    periodo_ant = cubo.periodo_comparacion(desde_an, hasta_an, comparacion)
+    if periodo_ant:
+        st.caption(f"Comparando {desde_an:%d/%m/%Y} – {hasta_an:%d/%m/%Y} contra {periodo_ant[0]:%d/%m/%Y} – {periodo_ant[1]:%d/%m/%Y}")
     
     st.markdown("---")
     
     # 1. RENTABILIDAD POR PRODUCTO
     st.subheader("💰 Rentabilidad por Producto")
     
-    query_rentabilidad = text("""
-    WITH VentasPeriodo AS (
-        SELECT 
-            dv.id_producto,
-            SUM(dv.cantidad_formato) as unidades_vendidas,
-            SUM(dv.cantidad_formato * dv.precio_unitario_historico) as ingresos,
-            SUM(dv.cantidad_formato * p.precio_costo_promedio) as costos
-        FROM detalle_ventas dv
-        JOIN ventas v ON dv.id_venta = v.id_venta
-        JOIN productos p ON dv.id_producto = p.id_producto
-        WHERE v.fecha >= CURRENT_DATE - INTERVAL ':dias days'
-        GROUP BY dv.id_producto
-    )
-    SELECT 
-        p.nombre AS "Producto",
-        m.nombre AS "Marca",
-        vp.unidades_vendidas AS "Unidades",
-        vp.ingresos AS "Ingresos",
-        vp.costos AS "Costos",
-        (vp.ingresos - vp.costos) AS "Ganancia",
-        ROUND(((vp.ingresos - vp.costos) / NULLIF(vp.ingresos, 0) * 100), 1) AS "Margen %",
-        ROUND((vp.ingresos - vp.costos) / NULLIF(vp.unidades_vendidas, 0), 2) AS "Ganancia/Unidad"
-    FROM VentasPeriodo vp
-    JOIN productos p ON vp.id_producto = p.id_producto
-    JOIN marcas m ON p.id_marca = m.id_marca
-    WHERE vp.unidades_vendidas > 0
-    ORDER BY "Ganancia" DESC
-""")
-
-    
-    with engine.connect() as conn:
-        df_rent = pd.read_sql(query_rentabilidad.bindparams(dias=dias_analisis), conn)
+    df_rent = cubo.por_dimension(engine, "producto", desde_an, hasta_an, **filtros_an).rename(columns={
+        "nombre": "Producto", "unidades": "Unidades", "ingresos": "Ingresos", "costos": "Costos", "ganancia": "Ganancia"
+    })
+    st.caption(refresco.texto_edad(cubo.por_dimension, engine, "producto", desde_an, hasta_an, **filtros_an))
+    df_rent["Marca"] = df_rent["id"].map(catalogo.cargar_productos(engine).set_index("id_producto")["marca"])
+    df_rent["Margen %"] = (df_rent["Ganancia"] / df_rent["Ingresos"].where(df_rent["Ingresos"] != 0) * 100).round(1)
+    df_rent["Ganancia/Unidad"] = (df_rent["Ganancia"] / df_rent["Unidades"]).round(2)
+    df_rent = df_rent[["Producto", "Marca", "Unidades", "Ingresos", "Costos", "Ganancia", "Margen %", "Ganancia/Unidad"]]
     
     if len(df_rent) > 0:
-        # Métricas resumen
+        # Métricas resumen (con la variación contra el período de comparación)
         col_r1, col_r2, col_r3, col_r4 = st.columns(4)
         
         total_ingresos = df_rent['Ingresos'].sum()
         total_costos = df_rent['Costos'].sum()
         total_ganancia = df_rent['Ganancia'].sum()
         margen_promedio = (total_ganancia / total_ingresos * 100) if total_ingresos > 0 else 0
+
+        deltas = {}
+        if periodo_ant:
+            df_ant = cubo.por_dimension(engine, "producto", *periodo_ant, **filtros_an)
+            ing_ant, cos_ant, gan_ant = df_ant['ingresos'].sum(), df_ant['costos'].sum(), df_ant['ganancia'].sum()
+            def variacion(actual, antes):
+                return f"{(actual - antes) / antes * 100:+.1f}%" if antes else None
+            deltas = {
+                "ingresos": variacion(total_ingresos, ing_ant),
+                "costos": variacion(total_costos, cos_ant),
+                "ganancia": variacion(total_ganancia, gan_ant),
+                "margen": f"{margen_promedio - (gan_ant / ing_ant * 100 if ing_ant else 0):+.1f} pts",
+            }
         
-        col_r1.metric("Ingresos Totales", f"${total_ingresos:,.0f}")
-        col_r2.metric("Costos Totales", f"${total_costos:,.0f}")
-        col_r3.metric("Ganancia Neta", f"${total_ganancia:,.0f}")
-        col_r4.metric("Margen Promedio", f"{margen_promedio:.1f}%")
+        col_r1.metric("Ingresos Totales", f"${total_ingresos:,.0f}", delta=deltas.get("ingresos"))
+        col_r2.metric("Costos Totales", f"${total_costos:,.0f}", delta=deltas.get("costos"), delta_color="inverse")
+        col_r3.metric("Ganancia Neta", f"${total_ganancia:,.0f}", delta=deltas.get("ganancia"))
+        col_r4.metric("Margen Promedio", f"{margen_promedio:.1f}%", delta=deltas.get("margen"))
         
         # Gráficos
         col_g1, col_g2 = st.columns(2)
         
         with col_g1:
             # Top productos por ganancia
-            df_top_ganancia = df_rent.nlargest(10, 'Ganancia')
-            fig_ganancia = px.bar(
-                df_top_ganancia,
-                x='Producto',
-                y='Ganancia',
-                color='Margen %',
-                title="🏆 Top 10 Productos por Ganancia",
-                template="plotly_white",
-                color_continuous_scale='RdYlGn'
-            )
-            fig_ganancia.update_layout(height=400)
+            df_top_ganancia = df_rent.nlargest(10, 'Ganancia')[['Producto', 'Ganancia', 'Margen %']]
+            fig_ganancia = graficos.barras_margen(df_top_ganancia, 'Ganancia', "🏆 Top 10 Productos por Ganancia")
             st.plotly_chart(fig_ganancia, width='stretch')
         
         with col_g2:
             # Productos con pérdida o bajo margen
             df_problema = df_rent[df_rent['Margen %'] < 15].sort_values('Ganancia')
             if len(df_problema) > 0:
-                fig_problema = px.bar(
-                    df_problema.head(10),
-                    x='Producto',
-                    y='Margen %',
-                    title="⚠️ Productos con Margen < 15%",
-                    template="plotly_white",
-                    color='Margen %',
-                    color_continuous_scale='RdYlGn'
+                fig_problema = graficos.barras_margen(
+                    df_problema.head(10)[['Producto', 'Margen %']], 'Margen %', "⚠️ Productos con Margen < 15%"
                 )
-                fig_problema.update_layout(height=400)
                 st.plotly_chart(fig_problema, width='stretch')
             else:
                 st.success("✅ Todos los productos tienen buen margen!")
@@ -1289,94 +1384,56 @@ with tab5:
             }
         )
     else:
-        st.info(f"No hay ventas en los últimos {dias_analisis} días para analizar.")
+        st.info("No hay ventas en el período elegido para analizar.")
     
     st.markdown("---")
     
     # 2. EVOLUCIÓN DE VENTAS
     st.subheader("📊 Evolución de Ventas")
     
-    query_evolucion = text("""
-        SELECT 
-            DATE_TRUNC('day', v.fecha) AS fecha,
-            SUM(v.total_venta) as ventas_dia,
-            COUNT(DISTINCT v.id_venta) as num_ventas
-        FROM ventas v
-        WHERE v.fecha >= CURRENT_DATE - INTERVAL ':dias days'
-        GROUP BY DATE_TRUNC('day', v.fecha)
-        ORDER BY fecha
-    """)
-    
-    with engine.connect() as conn:
-        df_evol = pd.read_sql(query_evolucion.bindparams(dias=dias_analisis), conn)
+    df_evol = cubo.serie(engine, grano, desde_an, hasta_an, **filtros_an)
     
     if len(df_evol) > 0:
-        fig_evol = go.Figure()
-        
-        fig_evol.add_trace(go.Scatter(
-            x=df_evol['fecha'],
-            y=df_evol['ventas_dia'],
-            mode='lines+markers',
-            name='Ventas',
-            line=dict(color='#2E86AB', width=3),
-            fill='tozeroy'
-        ))
-        
-        fig_evol.update_layout(
-            title="Ventas Diarias",
-            xaxis_title="Fecha",
-            yaxis_title="Ventas ($)",
-            template="plotly_white",
-            height=400
-        )
+        if periodo_ant:
+            # El período de comparación se corre al eje del actual para superponerlo
+            fig_evol = graficos.evolucion(
+                df_evol, grano, cubo.serie(engine, grano, *periodo_ant, **filtros_an),
+                pd.Timestamp(desde_an) - pd.Timestamp(periodo_ant[0]), comparacion
+            )
+        else:
+            fig_evol = graficos.evolucion(df_evol, grano)
         
         st.plotly_chart(fig_evol, width='stretch')
         
         # Métricas de tendencia
         col_t1, col_t2, col_t3 = st.columns(3)
         
-        promedio_dia = df_evol['ventas_dia'].mean()
-        mejor_dia = df_evol.loc[df_evol['ventas_dia'].idxmax()]
-        total_ventas_periodo = df_evol['num_ventas'].sum()
+        promedio_periodo = df_evol['ingresos'].mean()
+        mejor = df_evol.loc[df_evol['ingresos'].idxmax()]
         
-        col_t1.metric("Promedio Diario", f"${promedio_dia:,.0f}")
-        col_t2.metric("Mejor Día", f"${mejor_dia['ventas_dia']:,.0f}", delta=mejor_dia['fecha'].strftime('%d/%m'))
-        col_t3.metric("Total Operaciones", f"{int(total_ventas_periodo)}")
+        col_t1.metric(f"Promedio por {grano.lower()}", f"${promedio_periodo:,.0f}")
+        col_t2.metric(f"Mejor {grano.lower()}", f"${mejor['ingresos']:,.0f}", delta=mejor['periodo'].strftime('%d/%m'))
+        if marcas_an or productos_an:
+            # Con filtro de producto/marca, una venta puede tener líneas de otros: contamos líneas
+            col_t3.metric("Líneas vendidas", f"{int(df_evol['lineas'].sum())}")
+        else:
+            col_t3.metric("Total Operaciones", f"{int(cubo.operaciones(engine, desde_an, hasta_an, filtros_an['clientes']))}")
     
     st.markdown("---")
     
-    # 3. ANÁLISIS POR MARCA
+    # 3. ANÁLISIS POR MARCA Y POR CLIENTE
     st.subheader("🏷️ Rendimiento por Marca")
     
-    query_marcas = text("""
-        SELECT 
-            m.nombre AS "Marca",
-            COUNT(DISTINCT p.id_producto) AS "Productos",
-            SUM(dv.cantidad_formato) AS "Unidades Vendidas",
-            SUM(dv.cantidad_formato * dv.precio_unitario_historico) AS "Ingresos"
-        FROM detalle_ventas dv
-        JOIN ventas v ON dv.id_venta = v.id_venta
-        JOIN productos p ON dv.id_producto = p.id_producto
-        JOIN marcas m ON p.id_marca = m.id_marca
-        WHERE v.fecha >= CURRENT_DATE - INTERVAL ':dias days'
-        GROUP BY m.nombre
-        ORDER BY "Ingresos" DESC
-    """)
-    
-    with engine.connect() as conn:
-        df_marcas = pd.read_sql(query_marcas.bindparams(dias=dias_analisis), conn)
+    df_marcas = cubo.por_dimension(engine, "marca", desde_an, hasta_an, **filtros_an).sort_values("ingresos", ascending=False)
+    df_marcas = df_marcas.rename(columns={
+        "nombre": "Marca", "productos": "Productos", "unidades": "Unidades Vendidas", "ingresos": "Ingresos"
+    })[["Marca", "Productos", "Unidades Vendidas", "Ingresos"]]
     
     if len(df_marcas) > 0:
         col_m1, col_m2 = st.columns(2)
         
         with col_m1:
-            fig_marcas = px.pie(
-                df_marcas,
-                values='Ingresos',
-                names='Marca',
-                title='Distribución de Ingresos por Marca',
-                template='plotly_white'
-            )
+            fig_marcas = graficos.torta_marcas(df_marcas[['Marca', 'Ingresos']])
             st.plotly_chart(fig_marcas, width='stretch')
         
         with col_m2:
@@ -1388,6 +1445,21 @@ with tab5:
                     "Ingresos": st.column_config.NumberColumn(format="$%.0f")
                 }
             )
+
+    st.subheader("🧾 Rendimiento por Cliente")
+    df_clientes_an = cubo.por_dimension(engine, "cliente", desde_an, hasta_an, **filtros_an).rename(columns={
+        "nombre": "Cliente", "productos": "Productos", "unidades": "Unidades", "ingresos": "Ingresos", "ganancia": "Ganancia"
+    })[["Cliente", "Productos", "Unidades", "Ingresos", "Ganancia"]]
+    if len(df_clientes_an) > 0:
+        st.dataframe(
+            df_clientes_an,
+            width='stretch',
+            hide_index=True,
+            column_config={
+                "Ingresos": st.column_config.NumberColumn(format="$%.0f"),
+                "Ganancia": st.column_config.NumberColumn(format="$%.0f")
+            }
+        )
     st.markdown("---")
     st.subheader("💱 Variación de Costos")  
 
@@ -1399,7 +1471,7 @@ with tab5:
         LIMIT 50
     """)    
 
-    with engine.connect() as conn:
+    with lectura("query_variacion") as conn:
         df_var = pd.read_sql(query_variacion, conn) 
 
     if len(df_var) > 0:
@@ -1460,23 +1532,33 @@ with tab5:
                     "variacion_porcentual": st.column_config.NumberColumn(format="%.1f%%")
                 }
             )
+
+
+# --- AUDITORÍA DE STOCK CON CHECKPOINTS ---
 # ==========================================================
 # TAB 6: AUDITORÍA (VERSIÓN FINAL CORREGIDA)
 # ==========================================================
-with tab6:
+def seccion_auditoria():
     st.title("🔍 Auditoría de Movimientos")
     st.info("💡 Esta sección cruza tus movimientos históricos con el stock real para detectar fugas o errores.")
 
-    # --- 1. FILTROS ---
-    col_f1, col_f2 = st.columns(2)
+    # --- 1. FILTROS (se resuelven en SQL, no en pandas) ---
+    col_f1, col_f2, col_f3 = st.columns([2, 2, 1])
     with col_f1:
-        dias_auditoria = st.selectbox("Analizar últimos días", [7, 15, 30, 60, 90, 365], index=2, key="dias_audit")
+        desde_a, hasta_a = filtro_fechas("audit")
+    tipos_disponibles = ['Todos'] + catalogo.cargar_tipos_movimiento(engine)
+    tipo_filtro = col_f2.selectbox("Filtrar por tipo", tipos_disponibles)
+    tam_a = col_f3.selectbox("Por página", TAMANIOS_PAGINA, index=3, key="tam_audit")
+
+    pag_a = estado_paginacion("audit", (desde_a, hasta_a, tipo_filtro, tam_a))
+    cond_a, params_a = condicion_cursor(pag_a["cursores"][-1], "im.fecha", "im.id_movimiento")
+    filtro_tipo = "AND im.tipo = :tipo" if tipo_filtro != 'Todos' else ""
 
-    # --- 2. TABLA DE MOVIMIENTOS CRUDOS ---
-    # Usamos f-string para inyectar los días de forma segura
+    # --- 2. TABLA DE MOVIMIENTOS CRUDOS (paginada por fecha, id) ---
     query_audit = text(f"""
         SELECT 
             im.id_movimiento AS "N° Mov",
+            im.fecha AS fecha_orden,
             TO_CHAR(im.fecha, 'DD/MM/YY HH24:MI') AS "Fecha/Hora",
             p.nombre AS "Producto",
             m.nombre AS "Marca",
@@ -1486,23 +1568,23 @@ with tab6:
         FROM inventario_movimientos im
         JOIN productos p ON im.id_producto = p.id_producto
         JOIN marcas m ON p.id_marca = m.id_marca
-        WHERE im.fecha >= CURRENT_DATE - INTERVAL '{dias_auditoria} days'
-        ORDER BY im.fecha DESC
-        LIMIT 500
+        WHERE im.fecha >= :desde AND im.fecha < CAST(:hasta AS date) + 1
+          {filtro_tipo}
+          {cond_a}
+        ORDER BY im.fecha DESC, im.id_movimiento DESC
+        LIMIT :limite
     """)
     
-    with engine.connect() as conn:
-        df_audit = pd.read_sql(query_audit, conn)
+    with lectura("query_audit") as conn:
+        df_audit = pd.read_sql(query_audit, conn, params={
+            "desde": desde_a, "hasta": hasta_a, "tipo": tipo_filtro, "limite": tam_a + 1, **params_a
+        })
+    df_audit, hay_mas_a, ultimo_a = cortar_pagina(df_audit, "N° Mov", "fecha_orden", tam_a)
     
     if not df_audit.empty:
-        # Filtro por tipo visual
-        with col_f2:
-            tipos_disponibles = ['Todos'] + df_audit['Tipo'].unique().tolist()
-            tipo_filtro = st.selectbox("Filtrar por tipo", tipos_disponibles)
-        
-        df_mostrar = df_audit if tipo_filtro == 'Todos' else df_audit[df_audit['Tipo'] == tipo_filtro]
+        df_mostrar = df_audit.drop(columns=["fecha_orden"])
         
-        # Métricas rápidas
+        # Métricas rápidas (de la página visible)
         col1, col2, col3 = st.columns(3)
         col1.metric("Registros", len(df_mostrar))
         col2.metric("Entradas", len(df_mostrar[df_mostrar['Cantidad'] > 0]))
@@ -1511,49 +1593,25 @@ with tab6:
         st.dataframe(df_mostrar, width='stretch', hide_index=True)
     else:
         st.warning("No hay movimientos en este período.")
+    controles_paginacion("audit", pag_a, hay_mas_a, ultimo_a)
+    exportador("audit", ["Movimientos de inventario", "Ventas (detalle)", "Compras (detalle)", "Historial de precios"])
 
     st.markdown("---")
 
     # --- 3. AUDITORÍA DE INTEGRIDAD (EL FIX IMPORTANTE) ---
     st.subheader("👮 Auditoría de Stock (Real vs. Calculado)")
-    st.caption("Comparamos lo que dice la Base de Datos (Físico + Concesión) contra la suma histórica de movimientos.")
+    st.caption("Comparamos lo que dice la Base de Datos (Físico + Concesión) contra la suma histórica de movimientos (checkpoint + lo posterior).")
+
+    with lectura("checkpoint_stock") as conn:
+        ultimo_checkpoint = conn.execute(text("SELECT MAX(creado) FROM stock_checkpoints")).scalar()
+    if ultimo_checkpoint is not None:
+        st.caption(f"📌 Último checkpoint: {ultimo_checkpoint:%d/%m/%Y %H:%M} — solo se suman los movimientos posteriores.")
 
     if st.button("🔄 Ejecutar Auditoría Profunda"):
-        with engine.connect() as conn:
-            # A) Traemos el STOCK REAL de la base (Lo que el sistema cree que hay hoy)
-            # ACÁ ESTÁ LA CLAVE: Traemos 'stock_concesion'
-            stock_real = pd.read_sql(text("""
-                SELECT 
-                    id_producto, 
-                    nombre, 
-                    stock_actual as "Físico", 
-                    stock_concesion as "Concesión"
-                FROM productos
-            """), conn)
-            
-            # B) Calculamos el STOCK HISTÓRICO (Suma de todos los movimientos desde el origen de los tiempos)
-            movimientos = pd.read_sql(text("""
-                SELECT 
-                    id_producto, 
-                    SUM(cantidad) as "Calculado"
-                FROM inventario_movimientos
-                GROUP BY id_producto
-            """), conn)
-        
-        # C) Unimos las tablas (Excel VLOOKUP style)
-        df_audit_final = pd.merge(stock_real, movimientos, on="id_producto", how="left")
-        
-        # Rellenamos con 0 si no hubo movimientos
-        df_audit_final['Calculado'] = df_audit_final['Calculado'].fillna(0).astype(int)
-        
-        # D) Lógica de Validación:
-        # El stock total real es la suma de lo que tengo en el galpón + lo que presté
-        df_audit_final['Total Real'] = df_audit_final['Físico'] + df_audit_final['Concesión']
-        
-        # La diferencia es el Real menos el Histórico
-        df_audit_final['Diferencia'] = df_audit_final['Total Real'] - df_audit_final['Calculado']
-        
-        # Filtramos solo los que dan mal
+        with engine.begin() as conn:
+            with rendimiento.etiqueta("auditoria_profunda"):
+                df_audit_final = servicios.auditar_stock(conn)
+
         df_problemas = df_audit_final[df_audit_final['Diferencia'] != 0].copy()
         
         if not df_problemas.empty:
@@ -1561,7 +1619,7 @@ with tab6:
             
             # Mostramos la tabla del terror
             st.dataframe(
-                df_problemas[['nombre', 'Físico', 'Concesión', 'Total Real', 'Calculado', 'Diferencia']],
+                df_problemas[['nombre', 'Físico', 'Concesión', 'Total Real', 'Calculado', 'Diferencia', 'Última verificación']],
                 width='stretch',
                 hide_index=True
             )
@@ -1569,17 +1627,25 @@ with tab6:
             **Guía de solución:**
             * Si **Diferencia < 0**: Falta mercadería (posible robo o venta no cargada).
             * Si **Diferencia > 0**: Sobra mercadería (posible compra no cargada o devolución mal hecha).
+            * **Última verificación** es la última auditoría en la que ese producto cerró bien: el error entró después.
             """)
         else:
             st.balloons()
             st.success("✅ ¡PERFECTO! La contabilidad de stock cierra exacta (0 errores).")
             st.write("El stock en depósito + el stock prestado coincide exactamente con el historial de movimientos.")
-            
-            
+
+        with st.expander("🕒 Última verificación por producto"):
+            st.dataframe(
+                df_audit_final[['nombre', 'Total Real', 'Calculado', 'Última verificación']],
+                width='stretch',
+                hide_index=True
+            )
+
+
     # ==========================================================
 # TAB 7: PANEL DE CONTROL Y ALTAS (PARA QUE CARGUEN ELLOS)
 # ==========================================================
-with tab7:
+def seccion_carga_datos():
     # Cambiamos el título y la descripción
     st.header("📂 Carga de Datos y Maestros") 
     st.markdown("Desde acá podés dar de alta Marcas, Clientes, Proveedores y Productos.")
@@ -1598,6 +1664,7 @@ with tab7:
                     try:
                         with engine.begin() as conn:
                             conn.execute(text("INSERT INTO marcas (nombre) VALUES (:n)"), {"n": nueva_marca})
+                        catalogo.invalidar("marcas")
                         st.success(f"✅ Marca '{nueva_marca}' creada.")
                         time.sleep(1) # Pequeña pausa para que se vea el mensaje
                         st.rerun()
@@ -1619,6 +1686,7 @@ with tab7:
                         with engine.begin() as conn:
                             conn.execute(text("INSERT INTO proveedores (nombre, telefono, email) VALUES (:n, :t, :e)"), 
                                        {"n": nom_prov, "t": tel_prov, "e": email_prov})
+                        catalogo.invalidar("proveedores")
                         st.success(f"✅ Proveedor '{nom_prov}' guardado.")
                         time.sleep(1)
                         st.rerun()
@@ -1638,6 +1706,7 @@ with tab7:
                         with engine.begin() as conn:
                             conn.execute(text("INSERT INTO clientes (razon_social, direccion, telefono) VALUES (:r, :d, :t)"), 
                                        {"r": razon_social, "d": domicilio, "t": telefono})
+                        catalogo.invalidar("clientes")
                         st.success(f"✅ Cliente '{razon_social}' creado.")
                         time.sleep(1)
                         st.rerun()
@@ -1650,9 +1719,9 @@ with tab7:
     st.subheader("4️⃣ Crear PRODUCTO NUEVO")
     st.info("Para crear un producto, necesitás haber creado la MARCA primero.")
     
-    # Traemos las marcas para el selector
-    with engine.connect() as conn:
-        df_marcas = pd.read_sql(text("SELECT id_marca, nombre FROM marcas ORDER BY nombre"), conn)
+    # Traemos las marcas para el selector (cacheadas)
+    df_marcas = catalogo.cargar_marcas(engine)
+    etiq_marcas = catalogo.etiquetas_marcas(engine)
     
     if df_marcas.empty:
         st.warning("⚠️ No podés cargar productos porque no hay MARCAS cargadas. Creá una marca arriba a la izquierda.")
@@ -1664,7 +1733,7 @@ with tab7:
             
             # Selector de Marca
             id_marca_sel = col_b.selectbox("Marca", df_marcas['id_marca'].tolist(), 
-                                         format_func=lambda x: df_marcas[df_marcas['id_marca']==x]['nombre'].values[0])
+                                         format_func=etiq_marcas.get)
             
             col_c, col_d, col_e = st.columns(3)
             precio_vta = col_c.number_input("Precio de Venta Unitario ($)", min_value=0.0)
@@ -1693,26 +1762,245 @@ with tab7:
                     try:
                         with engine.begin() as conn:
                             # 1. Insertamos el producto (usamos la variable calculada)
-                            conn.execute(text("""
+                            id_new = conn.execute(text("""
                                 INSERT INTO productos 
                                 (nombre, id_marca, precio_venta, precio_costo_promedio, stock_actual, unidades_por_caja, precio_venta_caja)
                                 VALUES (:nom, :m, :pv, :pc, :stk, :upc, :pvc)
+                                RETURNING id_producto
                             """), {
                                 "nom": nombre_prod, "m": id_marca_sel, "pv": precio_vta, 
                                 "pc": costo_ref, "stk": stock_ini, "upc": unid_caja, 
                                 "pvc": precio_caja_calculado  # <--- ACÁ VA EL CÁLCULO
-                            })
+                            }).scalar_one()
                             
-                            # 2. Movimiento inicial si hay stock
+                            # 2. Movimiento inicial si hay stock (con el id del RETURNING, no MAX)
                             if stock_ini > 0:
-                                id_new = conn.execute(text("SELECT MAX(id_producto) FROM productos")).fetchone()[0]
                                 conn.execute(text("""
                                     INSERT INTO inventario_movimientos (id_producto, tipo, cantidad, fecha)
                                     VALUES (:id, 'STOCK_INICIAL', :cant, NOW())
                                 """), {"id": id_new, "cant": stock_ini})
 
+                        catalogo.invalidar("productos")
                         st.success(f"✅ Producto '{nombre_prod}' creado. (Precio Caja autocalculado: ${precio_caja_calculado:,.2f})")
                         time.sleep(1.5) # Un poquito más de tiempo para que lean el precio calculado
                         st.rerun()
                     except Exception as e:
-                        st.error(f"Hubo un error al crear: {e}")
\ No newline at end of file
+                        st.error(f"Hubo un error al crear: {e}")
+
+    st.divider()
+
+    # --- IMPORTACIÓN MASIVA: CSV / EXCEL ---
+    st.subheader("5️⃣ Importación masiva (CSV / Excel)")
+    st.caption("Da de alta lo nuevo y actualiza lo existente (se busca por nombre, sin importar mayúsculas). "
+               "Primero se muestra una prueba: no se graba nada hasta confirmar.")
+
+    c_imp1, c_imp2 = st.columns([1, 2])
+    entidad = c_imp1.selectbox("¿Qué importás?", list(importar.ENTIDADES), key="imp_entidad")
+    c_imp1.download_button("⬇️ Plantilla CSV", importar.plantilla(entidad),
+                           file_name=f"plantilla_{entidad.lower()}.csv", mime="text/csv")
+    if entidad == "Productos":
+        c_imp1.caption("Las marcas que no existan se crean. Costo y stock inicial solo se usan en productos nuevos.")
+    archivo = c_imp2.file_uploader("Archivo", type=["csv", "xlsx"], key=f"imp_archivo_{entidad}")
+
+    if archivo is None:
+        return
+    try:
+        df_archivo = importar.leer_archivo(archivo, archivo.name)
+    except Exception as e:
+        st.error(f"No se pudo leer el archivo: {e}")
+        return
+
+    limpio, errores = importar.validar(entidad, df_archivo)
+    if not errores.empty:
+        st.error(f"❌ El archivo tiene {len(errores)} problema(s). Corregilo y volvé a subirlo.")
+        st.dataframe(errores, hide_index=True, width='stretch')
+        return
+
+    # La prueba se calcula una vez por archivo, no en cada rerun
+    clave_prueba = (entidad, archivo.file_id)
+    prueba = st.session_state.get("imp_prueba")
+    if prueba is None or prueba[0] != clave_prueba:
+        prueba = (clave_prueba, importar.previsualizar(engine, entidad, limpio))
+        st.session_state["imp_prueba"] = prueba
+    diff = prueba[1]
+
+    conteo = diff["Acción"].value_counts()
+    altas = int(conteo.get(importar.ACCIONES["alta"], 0))
+    cambios = int(conteo.get(importar.ACCIONES["cambio"], 0))
+    m1, m2, m3 = st.columns(3)
+    m1.metric("➕ Altas", altas)
+    m2.metric("✏️ Cambios", cambios)
+    m3.metric("＝ Sin cambios", len(diff) - altas - cambios)
+    if entidad == "Productos" and diff["Marca Nueva"].any():
+        nuevas = sorted(diff.loc[diff["Marca Nueva"], "Marca"].str.strip().unique())
+        st.info(f"Se van a crear {len(nuevas)} marca(s): {', '.join(nuevas[:20])}{'…' if len(nuevas) > 20 else ''}")
+    st.dataframe(diff, hide_index=True, width='stretch', height=300)
+
+    if st.button("✅ Aplicar importación", type="primary", width='stretch', disabled=altas + cambios == 0):
+        try:
+            res = importar.aplicar(engine, entidad, limpio)
+        except Exception as e:
+            st.error(f"Error al importar (no se grabó nada): {e}")
+        else:
+            tabla = importar.ENTIDADES[entidad]["tabla"]
+            catalogo.invalidar(*((tabla, "marcas") if entidad == "Productos" else (tabla,)))
+            st.session_state.pop("imp_prueba", None)
+            detalle = f"{res['altas']} alta(s), {res['cambios']} actualizado(s)"
+            if entidad == "Productos":
+                detalle += (f", {res['marcas_nuevas']} marca(s) nueva(s), {res['precios']} cambio(s) de precio"
+                            f" en el historial, {res['movimientos']} movimiento(s) de stock inicial")
+            st.success(f"✅ Importación terminada: {detalle}.")
+
+
+# ==========================================================
+# NAVEGACIÓN: SOLO CORRE LA SECCIÓN ACTIVA
+# ==========================================================
+SECCIONES = {
+    "📊 Dashboard": seccion_dashboard,
+    "💰 Registrar Venta": seccion_ventas,
+    "🚚 Cargar Compra": seccion_compras,
+    "🤝 Concesiones": seccion_concesiones,
+    "📈 Análisis": seccion_analisis,
+    "🔍 Auditoría": seccion_auditoria,
+    "📂 Carga de Datos": seccion_carga_datos,
+}
+
+# Los carritos viven en st.session_state, así que cambiar de sección no los pierde
+seccion_activa = barra_navegacion.radio(
+    "Sección",
+    list(SECCIONES.keys()),
+    horizontal=True,
+    key="seccion_activa",
+    label_visibility="collapsed"
+)
+rendimiento.marcar_seccion(seccion_activa)
+
+# Los carritos con ítems sostienen sus reservas mientras la sesión siga viva;
+# uno abandonado deja de renovar y sus reservas vencen solas
+for _carrito, _reserva in (("carrito_venta", "reserva_venta"), ("carrito_concesion", "reserva_concesion")):
+    _clave_renovado = f"{_reserva}_renovada"
+    if st.session_state[_carrito] and time.time() - st.session_state.get(_clave_renovado, 0) > reservas.RENOVAR_CADA:
+        try:
+            reservas.renovar(engine, st.session_state[_reserva])
+            st.session_state[_clave_renovado] = time.time()
+        except exc.OperationalError:
+            pass
+
+try:
+    SECCIONES[seccion_activa]()
+finally:
+    liberar_lectura()
+    rendimiento.cerrar_rerun(id_rerun, inicio_rerun)
+
+# Estado del pool de conexiones (para diagnosticar esperas en hora pico)
+with st.sidebar.expander("🔌 Conexiones a la base"):
+    stats_pool = conexion.estadisticas_pool(engine)
+    col_s1, col_s2 = st.columns(2)
+    col_s1.metric("En uso", stats_pool["en_uso"])
+    col_s2.metric("Libres", stats_pool["libres"])
+    col_s1.metric("Espera prom.", f"{stats_pool['espera_prom_ms']:.1f} ms")
+    col_s2.metric("Espera p95", f"{stats_pool['espera_p95_ms']:.1f} ms")
+    st.caption(
+        f"Pool: {stats_pool['tamanio']} fijas, overflow {stats_pool['overflow']} · "
+        f"{stats_pool['checkouts']} pedidos · espera máx. {stats_pool['espera_max_ms']:.0f} ms"
+    )
+    estado_avisos = notificaciones.estado()
+    if estado_avisos["conectado"]:
+        st.caption(f"🔔 Avisos de cambios: {estado_avisos['recibidos']} recibidos en este proceso.")
+    else:
+        st.caption(f"🔕 Sin escucha de avisos ({estado_avisos['error'] or 'conectando...'}): los caches se renuevan por TTL.")
+
+# Ventas y compras confirmadas que todavía no llegaron a la base
+estado_cola = cola.estado()
+if estado_cola["errores"]:
+    st.sidebar.error(f"❌ {estado_cola['errores']} operación(es) de la cola con error: revisalas en Ventas / Compras.")
+if estado_cola["pendientes"]:
+    detalle_cola = "" if estado_cola["conectado"] is not False else f" · sin conexión ({estado_cola['error']})"
+    st.sidebar.warning(
+        f"🕓 {estado_cola['pendientes']} en cola desde {estado_cola['pendiente_desde'].replace('T', ' ')}{detalle_cola}"
+    )
+
+
+# ==========================================================
+# ⏱️ PERFORMANCE (OCULTO: ?perf=1 EN LA URL + CLAVE DE ADMINISTRADOR)
+# ==========================================================
+def admin_rendimiento():
+    """Pide la clave [general] perf_password (distinta de la de la app) una vez por sesión"""
+    if st.session_state.get("perf_admin"):
+        return True
+    clave = st.secrets["general"].get("perf_password")
+    if not clave:
+        st.caption("Falta perf_password en [general] de los secrets.")
+        return False
+    ingresada = st.text_input("Clave de administrador", type="password", key="perf_clave")
+    if ingresada and hmac.compare_digest(ingresada.encode(), str(clave).encode()):
+        st.session_state["perf_admin"] = True
+        st.rerun()
+    elif ingresada:
+        st.error("⛔ Clave incorrecta.")
+    return False
+
+
+def _cambiar_jsonl():
+    # Solo cuando el admin toca el checkbox: abrir el panel no cambia el volcado
+    rendimiento.activar_jsonl("rendimiento.jsonl" if st.session_state.perf_jsonl else None)
+
+
+def panel_rendimiento():
+    consultas, reruns = rendimiento.registros()
+    st.caption(f"{len(consultas)} consultas y {len(reruns)} ejecuciones medidas en este proceso.")
+
+    if reruns:
+        df_r = pd.DataFrame(reruns)
+        col_r1, col_r2, col_r3 = st.columns(3)
+        col_r1.metric("Script p50", f"{df_r['duracion_ms'].quantile(0.5):.0f} ms")
+        col_r2.metric("Script p95", f"{df_r['duracion_ms'].quantile(0.95):.0f} ms")
+        col_r3.metric("Script máx.", f"{df_r['duracion_ms'].max():.0f} ms")
+        st.markdown("**Por sección**")
+        st.dataframe(
+            df_r.groupby('seccion')['duracion_ms']
+                .agg(Ejecuciones='count', p50=lambda x: x.quantile(0.5), p95=lambda x: x.quantile(0.95), Máx='max')
+                .round(1).reset_index().rename(columns={'seccion': 'Sección'}),
+            hide_index=True, width='stretch'
+        )
+
+    if consultas:
+        df_q = pd.DataFrame(consultas)
+        st.markdown("**Por consulta**")
+        resumen = (
+            df_q.groupby(['seccion', 'etiqueta'])
+                .agg(
+                    Veces=('duracion_ms', 'count'),
+                    p50=('duracion_ms', lambda x: x.quantile(0.5)),
+                    p95=('duracion_ms', lambda x: x.quantile(0.95)),
+                    Máx=('duracion_ms', 'max'),
+                    Total=('duracion_ms', 'sum'),
+                    Filas=('filas', 'mean'),
+                )
+                .round(1).sort_values('Total', ascending=False).reset_index()
+                .rename(columns={'seccion': 'Sección', 'etiqueta': 'Consulta'})
+        )
+        st.dataframe(resumen, hide_index=True, width='stretch')
+
+        top_n = st.number_input("Top N más lentas", min_value=5, max_value=100, value=10, step=5)
+        st.dataframe(
+            df_q.nlargest(int(top_n), 'duracion_ms')[['momento', 'rerun', 'seccion', 'etiqueta', 'duracion_ms', 'filas']],
+            hide_index=True, width='stretch',
+            column_config={"duracion_ms": st.column_config.NumberColumn("ms", format="%.1f")}
+        )
+
+        jsonl = pd.concat([df_q, pd.DataFrame(reruns)]).to_json(orient='records', lines=True, force_ascii=False)
+        st.download_button("⬇️ Descargar JSONL", jsonl, file_name="rendimiento.jsonl", mime="application/jsonl")
+
+    # Es de todo el proceso (todas las sesiones), no solo de esta
+    st.checkbox("Guardar cada medición en rendimiento.jsonl (en el servidor)", key="perf_jsonl",
+                value=rendimiento.jsonl_activo() is not None, on_change=_cambiar_jsonl)
+
+    if st.button("🧹 Limpiar mediciones"):
+        rendimiento.limpiar()
+        st.rerun()
+
+if st.query_params.get("perf") == "1":
+    with st.sidebar.expander("⏱️ Performance", expanded=True):
+        if admin_rendimiento():
+            panel_rendimiento()
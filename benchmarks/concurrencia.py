@@ -0,0 +1,174 @@
+"""
+Prueba de concurrencia de las reservas de stock (reservas.py) contra una
+base Postgres LOCAL.
+
+Simula N vendedores en hilos que arman carritos sobre unos pocos productos
+"calientes" con poco stock: cada carrito reserva, y después confirma la
+venta (servicios.vender_pedido: borra sus reservas y graba venta + detalle
+en una transacción) o lo abandona sin liberar nada. Al final verifica:
+
+    * no se vendió más que el stock inicial (stock_actual nunca < 0);
+    * stock_actual = inicial - vendido (ningún descuento perdido);
+    * pasado el TTL las reservas abandonadas no cuentan y la limpieza las
+      borra: el disponible vuelve a ser igual al stock.
+
+Y mide la latencia de reservar y de confirmar (p50/p95/máx.).
+
+Uso:
+    python -m benchmarks.concurrencia --url postgresql://localhost/galpon_bench \\
+        --vendedores 16 --carritos 40 --stock 150 --productos 3 --ttl 3
+Sale con código 1 si falla alguna verificación.
+"""
+import argparse
+import random
+import statistics
+import threading
+import time
+
+from sqlalchemy import create_engine, text
+
+import migraciones
+import reservas
+import servicios
+
+
+def preparar(engine, productos, stock):
+    """Crea cliente y productos de prueba con stock. Retorna (id_cliente, [id_producto])"""
+    migraciones.migrar(engine)
+    with engine.begin() as conn:
+        id_marca = conn.execute(text("INSERT INTO marcas (nombre) VALUES ('Prueba concurrencia') RETURNING id_marca")).scalar_one()
+        id_cliente = conn.execute(
+            text("INSERT INTO clientes (razon_social) VALUES ('Mostrador (prueba concurrencia)') RETURNING id_cliente")
+        ).scalar_one()
+        ids = conn.execute(text("""
+            INSERT INTO productos (nombre, id_marca, precio_venta, precio_costo_promedio, stock_actual)
+            SELECT 'Producto caliente ' || g, :marca, 100, 60, :stock
+            FROM generate_series(1, :n) g
+            RETURNING id_producto
+        """), {"marca": id_marca, "stock": stock, "n": productos}).scalars().all()
+    return id_cliente, sorted(ids)
+
+
+def vendedor(engine, id_cliente, ids, carritos, abandono, semilla, resultado):
+    rnd = random.Random(semilla)
+    for _ in range(carritos):
+        carrito = reservas.nuevo_carrito()
+        lineas = {}
+        for id_producto in rnd.sample(ids, rnd.randint(1, len(ids))):
+            unidades = rnd.randint(1, 4)
+            t0 = time.perf_counter()
+            reservo, _ = reservas.reservar(engine, carrito, id_producto, unidades)
+            resultado["reservar_ms"].append((time.perf_counter() - t0) * 1000)
+            if reservo:
+                lineas[id_producto] = lineas.get(id_producto, 0) + unidades
+            else:
+                resultado["rechazadas"] += 1
+        if not lineas:
+            continue
+        if rnd.random() < abandono:
+            resultado["abandonados"] += 1  # la sesión se cierra sin liberar
+            continue
+        t0 = time.perf_counter()
+        try:
+            with engine.begin() as conn:
+                # Misma venta que un pedido de la API, pero llevándose las reservas del carrito
+                servicios.vender_pedido(conn, {
+                    "id_cliente": id_cliente,
+                    "lineas": [{"id_producto": i, "cantidad": u} for i, u in lineas.items()],
+                    "metodo_pago": "Efectivo",
+                }, reserva=carrito)
+        except ValueError:
+            # Se le vencieron las reservas y otro se llevó el stock: no se vende
+            resultado["rechazadas"] += 1
+            continue
+        resultado["confirmar_ms"].append((time.perf_counter() - t0) * 1000)
+        for id_producto, unidades in lineas.items():
+            resultado["vendido"][id_producto] = resultado["vendido"].get(id_producto, 0) + unidades
+
+
+def resumen(nombre, muestras):
+    if not muestras:
+        return f"{nombre}: sin muestras"
+    orden = sorted(muestras)
+    p95 = orden[min(len(orden) - 1, int(len(orden) * 0.95))]
+    return f"{nombre}: {len(orden)} · p50 {statistics.median(orden):.1f} ms · p95 {p95:.1f} ms · máx. {orden[-1]:.1f} ms"
+
+
+def correr(url, vendedores, carritos, stock, productos, abandono, ttl):
+    """Corre la simulación y las verificaciones. Retorna la lista de fallas"""
+    reservas.TTL = ttl
+    engine = create_engine(url, pool_size=vendedores, max_overflow=4)
+    id_cliente, ids = preparar(engine, productos, stock)
+
+    resultados = [
+        {"reservar_ms": [], "confirmar_ms": [], "rechazadas": 0, "abandonados": 0, "vendido": {}}
+        for _ in range(vendedores)
+    ]
+    hilos = [
+        threading.Thread(target=vendedor, args=(engine, id_cliente, ids, carritos, abandono, i, resultados[i]))
+        for i in range(vendedores)
+    ]
+    inicio = time.perf_counter()
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    segundos = time.perf_counter() - inicio
+
+    vendido = {i: sum(r["vendido"].get(i, 0) for r in resultados) for i in ids}
+    print(f"{vendedores} vendedores x {carritos} carritos en {segundos:.1f} s "
+          f"({sum(len(r['confirmar_ms']) for r in resultados) / segundos:.1f} ventas/s)")
+    print(resumen("Reservar", [m for r in resultados for m in r["reservar_ms"]]))
+    print(resumen("Confirmar", [m for r in resultados for m in r["confirmar_ms"]]))
+    print(f"Reservas/confirmaciones rechazadas por falta de stock: {sum(r['rechazadas'] for r in resultados)} · "
+          f"carritos abandonados: {sum(r['abandonados'] for r in resultados)}")
+
+    fallas = []
+    with engine.connect() as conn:
+        stock_final = dict(conn.execute(
+            text("SELECT id_producto, stock_actual FROM productos WHERE id_producto = ANY(:ids)"), {"ids": ids}
+        ).all())
+    for i in ids:
+        print(f"  Producto {i}: inicial {stock}, vendido {vendido[i]}, final {stock_final[i]}")
+        if stock_final[i] < 0:
+            fallas.append(f"producto {i}: stock negativo ({stock_final[i]})")
+        if stock_final[i] != stock - vendido[i]:
+            fallas.append(f"producto {i}: stock {stock_final[i]} != {stock} - {vendido[i]}")
+
+    # Las reservas de los carritos abandonados vencen y se limpian solas
+    time.sleep(ttl + 1)
+    with engine.connect() as conn:
+        libre = reservas.disponibles(conn, ids)
+    if libre != stock_final:
+        fallas.append(f"vencido el TTL el disponible {libre} no coincide con el stock {stock_final}")
+    borradas = reservas.liberar_vencidas(engine)
+    with engine.connect() as conn:
+        quedan = conn.execute(
+            text("SELECT COUNT(*) FROM reservas_stock WHERE id_producto = ANY(:ids)"), {"ids": ids}
+        ).scalar_one()
+    print(f"Reservas vencidas borradas: {borradas} · quedan: {quedan}")
+    if quedan:
+        fallas.append(f"quedaron {quedan} reservas después de la limpieza")
+    return fallas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", required=True, help="URL de la base LOCAL de pruebas")
+    parser.add_argument("--vendedores", type=int, default=16)
+    parser.add_argument("--carritos", type=int, default=40, help="carritos por vendedor")
+    parser.add_argument("--stock", type=int, default=150, help="stock inicial de cada producto caliente")
+    parser.add_argument("--productos", type=int, default=3, help="cantidad de productos calientes")
+    parser.add_argument("--abandono", type=float, default=0.2, help="fracción de carritos que se abandonan")
+    parser.add_argument("--ttl", type=int, default=3, help="segundos de vida de una reserva en la prueba")
+    args = parser.parse_args()
+
+    fallas = correr(args.url, args.vendedores, args.carritos, args.stock, args.productos, args.abandono, args.ttl)
+    for falla in fallas:
+        print(f"❌ {falla}")
+    print("✅ Sin sobreventa ni descuentos perdidos." if not fallas else f"{len(fallas)} verificaciones fallaron.")
+    raise SystemExit(1 if fallas else 0)
+
+
+if __name__ == "__main__":
+    main()
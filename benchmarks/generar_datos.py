@@ -0,0 +1,230 @@
+"""
+Generador de datos sintéticos para una base Postgres LOCAL.
+
+Llena marcas, proveedores, clientes, productos, ventas/detalle_ventas,
+compras/detalle_compras, concesiones/detalle_concesiones e
+inventario_movimientos con volúmenes configurables. Todo se genera del lado
+del servidor con generate_series, así que un millón de líneas de venta tarda
+segundos, y con la misma --semilla se obtiene exactamente la misma base.
+
+El stock final de cada producto queda consistente con los movimientos
+(la Auditoría Profunda da 0 diferencias) y el resumen diario de ventas se
+recalcula al final.
+
+Uso:
+    python -m benchmarks.generar_datos --url postgresql://localhost/galpon_bench \\
+        --detalle-ventas 100000 --productos 4000 --reset
+
+Necesita permisos de superusuario en la base local: desactiva los triggers
+durante la carga (session_replication_role = replica).
+"""
+import argparse
+import time
+
+from sqlalchemy import create_engine, text
+
+import migraciones
+from mantenimiento import backfill_ventas
+
+TABLAS = [
+    "stock_checkpoints", "inventario_movimientos", "historial_precios", "detalle_concesiones", "concesiones",
+    "detalle_compras", "compras", "detalle_ventas", "ventas", "ventas_diarias_producto", "ventas_cubo",
+    "productos", "clientes", "proveedores", "marcas",
+]
+
+VOLUMENES_POR_DEFECTO = {
+    "marcas": 60,
+    "proveedores": 40,
+    "clientes": 400,
+    "productos": 4000,
+    "detalle_ventas": 100000,
+    "lineas_por_venta": 4,
+    "compras": 2000,
+    "lineas_por_compra": 8,
+    "concesiones": 300,
+    "lineas_por_concesion": 5,
+    "movimientos": 50000,
+    "dias": 365,
+}
+
+
+def generar(engine, semilla=0.42, reset=False, **volumenes):
+    """Carga la base con los volúmenes pedidos. Retorna los segundos que tardó"""
+    v = {**VOLUMENES_POR_DEFECTO, **{k: val for k, val in volumenes.items() if val is not None}}
+    v["ventas"] = max(1, v["detalle_ventas"] // v["lineas_por_venta"])
+    inicio = time.perf_counter()
+
+    migraciones.migrar(engine)
+    with engine.begin() as conn:
+        # Sin triggers: el stock y el resumen se calculan en bloque al final
+        conn.execute(text("SET LOCAL session_replication_role = replica"))
+        conn.execute(text("SELECT setseed(:s)"), {"s": semilla})
+        if reset:
+            conn.execute(text(f"TRUNCATE {', '.join(TABLAS)} RESTART IDENTITY CASCADE"))
+
+        # --- Maestros ---
+        conn.execute(text("INSERT INTO marcas (nombre) SELECT 'Marca ' || g FROM generate_series(1, :marcas) g"), v)
+        conn.execute(text("""
+            INSERT INTO proveedores (nombre, telefono, email)
+            SELECT 'Proveedor ' || g, '11-' || (4000 + g), 'prov' || g || '@mail.com'
+            FROM generate_series(1, :proveedores) g
+        """), v)
+        conn.execute(text("""
+            INSERT INTO clientes (razon_social, direccion, telefono)
+            SELECT 'Cliente ' || g, 'Calle ' || g, '11-' || (5000 + g)
+            FROM generate_series(1, :clientes) g
+        """), v)
+        conn.execute(text("""
+            INSERT INTO productos (nombre, id_marca, precio_costo_promedio, precio_venta,
+                                   precio_venta_caja, unidades_por_caja, stock_minimo)
+            SELECT nombre, id_marca, costo, ROUND(costo * margen, 2),
+                   ROUND(costo * margen, 2) * upc, upc, minimo
+            FROM (
+                SELECT 'Producto ' || LPAD(g::text, 6, '0') AS nombre,
+                       1 + FLOOR(random() * :marcas)::int AS id_marca,
+                       ROUND((50 + random() * 3000)::numeric, 2) AS costo,
+                       (1.15 + random() * 0.5)::numeric AS margen,
+                       (ARRAY[1, 6, 12, 24])[1 + FLOOR(random() * 4)::int] AS upc,
+                       FLOOR(random() * 30)::int AS minimo
+                FROM generate_series(1, :productos) g
+            ) x
+        """), v)
+
+        # --- Ventas: cabeceras repartidas en el período y líneas al azar ---
+        conn.execute(text("""
+            INSERT INTO ventas (id_cliente, fecha, total_venta, nro_factura, metodo_pago)
+            SELECT 1 + FLOOR(random() * :clientes)::int,
+                   NOW() - random() * :dias * INTERVAL '1 day',
+                   0,
+                   CASE WHEN random() < 0.5 THEN 'A-' || g END,
+                   (ARRAY['Efectivo', 'Transferencia', 'Cta. Cte.', 'Otro'])[1 + FLOOR(random() * 4)::int]
+            FROM generate_series(1, :ventas) g
+        """), v)
+        conn.execute(text("""
+            INSERT INTO detalle_ventas (id_venta, id_producto, formato_venta, cantidad_formato, precio_unitario_historico,
+                                        unidades_reales, costo_unitario)
+            SELECT x.id_venta, x.id_producto, x.formato, x.cantidad, p.precio_venta,
+                   x.cantidad * CASE WHEN x.formato = 'Caja' THEN p.unidades_por_caja ELSE 1 END,
+                   p.precio_costo_promedio
+            FROM (
+                SELECT 1 + FLOOR(random() * :ventas)::int AS id_venta,
+                       1 + FLOOR(random() * :productos)::int AS id_producto,
+                       CASE WHEN random() < 0.15 THEN 'Caja' ELSE 'Unidad' END AS formato,
+                       1 + FLOOR(random() * 6)::int AS cantidad
+                FROM generate_series(1, :detalle_ventas)
+            ) x
+            JOIN productos p ON p.id_producto = x.id_producto
+        """), v)
+        conn.execute(text("""
+            UPDATE ventas v SET total_venta = t.total
+            FROM (
+                SELECT id_venta, SUM(unidades_reales * precio_unitario_historico) AS total
+                FROM detalle_ventas
+                GROUP BY id_venta
+            ) t
+            WHERE v.id_venta = t.id_venta
+        """))
+
+        # --- Compras ---
+        conn.execute(text("""
+            INSERT INTO compras (id_proveedor, fecha, total_compra, costo_flete, nro_factura)
+            SELECT 1 + FLOOR(random() * :proveedores)::int,
+                   NOW() - random() * :dias * INTERVAL '1 day',
+                   0,
+                   ROUND((random() * 20000)::numeric, 2),
+                   'R-' || g
+            FROM generate_series(1, :compras) g
+        """), v)
+        conn.execute(text("""
+            INSERT INTO detalle_compras (id_compra, id_producto, cantidad_unidades, precio_compra_neto)
+            SELECT x.id_compra, x.id_producto, x.cantidad, ROUND(p.precio_costo_promedio * (0.9 + random() * 0.2), 2)
+            FROM (
+                SELECT 1 + FLOOR(random() * :compras)::int AS id_compra,
+                       1 + FLOOR(random() * :productos)::int AS id_producto,
+                       12 + FLOOR(random() * 120)::int AS cantidad
+                FROM generate_series(1, :compras * :lineas_por_compra)
+            ) x
+            JOIN productos p ON p.id_producto = x.id_producto
+        """), v)
+        conn.execute(text("""
+            UPDATE compras c SET total_compra = c.costo_flete + t.neto
+            FROM (
+                SELECT id_compra, SUM(cantidad_unidades * precio_compra_neto) AS neto
+                FROM detalle_compras GROUP BY id_compra
+            ) t
+            WHERE c.id_compra = t.id_compra
+        """))
+        conn.execute(text("SELECT fn_prorratear_flete(NULL)"))
+
+        # --- Concesiones (las recientes siguen activas) ---
+        conn.execute(text("""
+            INSERT INTO concesiones (id_cliente, fecha, estado)
+            SELECT 1 + FLOOR(random() * :clientes)::int, NOW() - random() * 60 * INTERVAL '1 day', 'ACTIVA'
+            FROM generate_series(1, :concesiones)
+        """), v)
+        conn.execute(text("""
+            INSERT INTO detalle_concesiones (id_concesion, id_producto, cantidad)
+            SELECT 1 + FLOOR(random() * :concesiones)::int,
+                   1 + FLOOR(random() * :productos)::int,
+                   1 + FLOOR(random() * 12)::int
+            FROM generate_series(1, :concesiones * :lineas_por_concesion)
+        """), v)
+
+        # --- Movimientos: stock inicial de cada producto + ruido en el período ---
+        conn.execute(text("""
+            INSERT INTO inventario_movimientos (id_producto, tipo, cantidad, fecha)
+            SELECT id_producto, 'STOCK_INICIAL', 2000 + FLOOR(random() * 3000)::int, NOW() - :dias * INTERVAL '1 day'
+            FROM productos
+        """), v)
+        conn.execute(text("""
+            INSERT INTO inventario_movimientos (id_producto, tipo, cantidad, fecha)
+            SELECT id_producto, tipo, CASE WHEN tipo LIKE 'VENTA%' OR tipo = 'ANULACION_COMPRA' THEN -q ELSE q END, fecha
+            FROM (
+                SELECT 1 + FLOOR(random() * :productos)::int AS id_producto,
+                       (ARRAY['VENTA', 'VENTA', 'VENTA', 'COMPRA', 'ANULACION_VENTA', 'ANULACION_COMPRA'])[1 + FLOOR(random() * 6)::int] AS tipo,
+                       1 + FLOOR(random() * 10)::int AS q,
+                       NOW() - random() * :dias * INTERVAL '1 day' AS fecha
+                FROM generate_series(1, :movimientos)
+            ) x
+        """), v)
+
+        # --- Stock consistente con los movimientos (Físico + Concesión = Calculado) ---
+        conn.execute(text("""
+            UPDATE productos p
+            SET stock_concesion = COALESCE(c.cant, 0),
+                stock_actual = m.total - COALESCE(c.cant, 0)
+            FROM (SELECT id_producto, SUM(cantidad) AS total FROM inventario_movimientos GROUP BY id_producto) m
+            LEFT JOIN (SELECT id_producto, SUM(cantidad) AS cant FROM detalle_concesiones GROUP BY id_producto) c
+                   ON c.id_producto = m.id_producto
+            WHERE p.id_producto = m.id_producto
+        """))
+
+    backfill_ventas(engine)
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("ANALYZE"))
+    return time.perf_counter() - inicio
+
+
+def agregar_argumentos(parser, excluir=()):
+    """Argumentos de volumen (los comparte la suite de benchmarks)"""
+    for clave, valor in VOLUMENES_POR_DEFECTO.items():
+        if clave in excluir:
+            continue
+        parser.add_argument(f"--{clave.replace('_', '-')}", type=int, default=None, help=f"(por defecto {valor})")
+    parser.add_argument("--semilla", type=float, default=0.42, help="semilla de random() entre -1 y 1")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", required=True, help="URL de la base LOCAL (postgresql://...)")
+    parser.add_argument("--reset", action="store_true", help="vacía todas las tablas antes de generar")
+    agregar_argumentos(parser)
+    args = parser.parse_args()
+
+    volumenes = {clave: getattr(args, clave) for clave in VOLUMENES_POR_DEFECTO}
+    segundos = generar(create_engine(args.url), semilla=args.semilla, reset=args.reset, **volumenes)
+    print(f"✅ Base generada en {segundos:.1f} s.")
+
+
+if __name__ == "__main__":
+    main()
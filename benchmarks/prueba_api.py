@@ -0,0 +1,127 @@
+"""
+Prueba de punta a punta de la API JSON (api.py) contra una base Postgres
+LOCAL.
+
+Levanta el servidor en un hilo (puerto libre), crea cliente y productos de
+prueba y verifica con pedidos HTTP reales:
+
+    * /api/salud responde sin token y el resto pide token;
+    * búsqueda de productos y consulta de stock;
+    * un pedido repetido con la misma Idempotency-Key devuelve la misma venta
+      y el stock baja una sola vez;
+    * un pedido que supera el disponible se rechaza (422) sin tocar el stock;
+    * N pedidos simultáneos de 1 unidad sobre un producto con S unidades
+      venden exactamente S y el stock no queda negativo.
+
+Uso:
+    python -m benchmarks.prueba_api --url postgresql://localhost/galpon_bench [--simultaneos 40]
+Sale con código 1 si falla alguna verificación.
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine, text
+
+import api
+from benchmarks.concurrencia import preparar
+
+TOKEN = "prueba"
+
+
+def pedir(base, metodo, ruta, cuerpo=None, token=TOKEN, clave=None):
+    """(código HTTP, JSON de respuesta)"""
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    if clave:
+        headers["Idempotency-Key"] = clave
+    datos = json.dumps(cuerpo).encode() if cuerpo is not None else None
+    req = urllib.request.Request(base + ruta, data=datos, headers=headers, method=metodo)
+    try:
+        with urllib.request.urlopen(req, timeout=30) as r:
+            return r.status, json.loads(r.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def stock_de(engine, id_producto):
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT stock_actual FROM productos WHERE id_producto = :id"),
+                            {"id": id_producto}).scalar_one()
+
+
+def correr(url, simultaneos, stock):
+    """Corre las verificaciones. Retorna la lista de fallas"""
+    engine = create_engine(url, pool_size=10, max_overflow=20)
+    id_cliente, (id_normal, id_caliente) = preparar(engine, 2, stock)
+    servidor = api.crear_servidor(engine, TOKEN, "127.0.0.1", 0)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{servidor.server_address[1]}/api"
+    fallas = []
+
+    def verificar(condicion, mensaje):
+        print(f"{'✅' if condicion else '❌'} {mensaje}")
+        if not condicion:
+            fallas.append(mensaje)
+
+    codigo, _ = pedir(base, "GET", "/salud", token=None)
+    verificar(codigo == 200, "salud sin token")
+    codigo, _ = pedir(base, "GET", "/clientes", token="otro")
+    verificar(codigo == 401, "token inválido rechazado")
+
+    codigo, productos = pedir(base, "GET", "/productos?q=caliente&limite=500")
+    verificar(codigo == 200 and {id_normal, id_caliente} <= {p["id_producto"] for p in productos},
+              "búsqueda encuentra los productos de prueba")
+
+    pedido = {"id_cliente": id_cliente, "lineas": [{"id_producto": id_normal, "formato": "Unidad", "cantidad": 3}]}
+    clave = str(uuid.uuid4())
+    codigo_1, r1 = pedir(base, "POST", "/pedidos", pedido, clave=clave)
+    codigo_2, r2 = pedir(base, "POST", "/pedidos", pedido, clave=clave)
+    verificar(codigo_1 == 201 and codigo_2 == 200 and r1["id_venta"] == r2["id_venta"] and r2["repetido"],
+              f"reintento con la misma clave devuelve la misma venta ({r1.get('id_venta')})")
+    verificar(stock_de(engine, id_normal) == stock - 3, "el stock bajó una sola vez")
+
+    codigo, stock_api = pedir(base, "GET", f"/stock?ids={id_normal}")
+    verificar(codigo == 200 and stock_api[0]["disponible"] == stock - 3, "stock por API coincide con la base")
+
+    demasiado = {"id_cliente": id_cliente, "lineas": [{"id_producto": id_normal, "cantidad": stock}]}
+    codigo, _ = pedir(base, "POST", "/pedidos", demasiado, clave=str(uuid.uuid4()))
+    verificar(codigo == 422 and stock_de(engine, id_normal) == stock - 3, "pedido sin stock rechazado (422)")
+
+    # Más pedidos que unidades, todos a la vez, sobre el mismo producto
+    unidad = {"id_cliente": id_cliente, "lineas": [{"id_producto": id_caliente, "cantidad": 1}]}
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=simultaneos) as ejecutor:
+        codigos = list(ejecutor.map(
+            lambda _: pedir(base, "POST", "/pedidos", unidad, clave=str(uuid.uuid4()))[0],
+            range(stock + simultaneos),
+        ))
+    segundos = time.perf_counter() - inicio
+    vendidos = codigos.count(201)
+    print(f"   {len(codigos)} pedidos en {segundos:.1f} s: {vendidos} vendidos, {codigos.count(422)} sin stock")
+    verificar(vendidos == stock and stock_de(engine, id_caliente) == 0, "sin sobreventa con pedidos simultáneos")
+
+    servidor.shutdown()
+    return fallas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", required=True, help="URL de la base LOCAL de pruebas")
+    parser.add_argument("--simultaneos", type=int, default=40, help="pedidos en paralelo")
+    parser.add_argument("--stock", type=int, default=60, help="stock inicial de los productos de prueba")
+    args = parser.parse_args()
+
+    fallas = correr(args.url, args.simultaneos, args.stock)
+    print("✅ API OK." if not fallas else f"{len(fallas)} verificaciones fallaron.")
+    raise SystemExit(1 if fallas else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark de los format_func de los selectores de productos.
+
+Compara el patrón viejo (filtrar el DataFrame por cada opción) contra el
+índice id -> etiqueta de catalogo.py, para catálogos de 1k/10k/50k productos.
+No necesita base de datos: arma un catálogo sintético en memoria.
+
+Uso:
+    python -m benchmarks.selectores [--tamanios 1000 10000 50000] [--muestra 300]
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from catalogo import armar_etiquetas
+
+
+def catalogo_sintetico(n):
+    """DataFrame con la misma forma que catalogo.cargar_productos"""
+    rng = np.random.default_rng(42)
+    return pd.DataFrame({
+        "id_producto": np.arange(1, n + 1),
+        "nombre": [f"Producto {i:05d}" for i in range(1, n + 1)],
+        "marca": rng.choice([f"Marca {i}" for i in range(200)], size=n),
+    })
+
+
+def render_viejo(prods, opciones):
+    """format_func original: dos máscaras booleanas por opción"""
+    formato = lambda x: f"{prods[prods['id_producto']==x]['nombre'].values[0]} ({prods[prods['id_producto']==x]['marca'].values[0]})"
+    return [formato(x) for x in opciones]
+
+
+def render_nuevo(prods, opciones):
+    """format_func con índice (incluye el costo de armar el índice)"""
+    etiquetas = armar_etiquetas(prods['id_producto'], prods['nombre'] + " (" + prods['marca'] + ")")
+    return [etiquetas.get(x) for x in opciones]
+
+
+def medir(n, muestra):
+    prods = catalogo_sintetico(n)
+    opciones = prods['id_producto'].tolist()
+
+    # El patrón viejo es O(n²): medimos una muestra de opciones y extrapolamos
+    sub = opciones[:min(muestra, n)]
+    t0 = time.perf_counter()
+    render_viejo(prods, sub)
+    t_viejo = (time.perf_counter() - t0) * n / len(sub)
+
+    t0 = time.perf_counter()
+    render_nuevo(prods, opciones)
+    t_nuevo = time.perf_counter() - t0
+
+    return t_viejo, t_nuevo
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanios", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--muestra", type=int, default=300, help="opciones medidas con el método viejo")
+    args = parser.parse_args()
+
+    print(f"{'Productos':>10} | {'Antes (s)':>10} | {'Después (s)':>11} | {'Mejora':>8}")
+    print("-" * 49)
+    for n in args.tamanios:
+        t_viejo, t_nuevo = medir(n, args.muestra)
+        print(f"{n:>10,} | {t_viejo:>10.3f} | {t_nuevo:>11.4f} | {t_viejo / t_nuevo:>7.0f}x")
+    print("\n'Antes' se extrapola desde la muestra: el render completo tarda demasiado.")
+
+
+if __name__ == "__main__":
+    main()
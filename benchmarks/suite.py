@@ -0,0 +1,153 @@
+"""
+Suite de benchmarks de punta a punta de app_claude.py.
+
+Para cada escala (cantidad de líneas de venta) genera una base sintética
+local, corre cada sección de la app con streamlit.testing (AppTest) y mide:
+tiempo total del script, tiempo en consultas (vía rendimiento.py) y el resto
+(pandas + armado de la página). Escribe un reporte JSON comparable entre
+corridas.
+
+Uso:
+    python -m benchmarks.suite --url postgresql://localhost/galpon_bench \\
+        --escalas 10000 100000 1000000 --salida bench.json
+    python -m benchmarks.suite --url ... --comparar bench_anterior.json
+
+⚠️ Vacía la base indicada en --url: usar SOLO una base local de pruebas.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import time
+from datetime import datetime
+from pathlib import Path
+
+import streamlit as st
+from sqlalchemy import create_engine, make_url
+from streamlit.testing.v1 import AppTest
+
+import rendimiento
+from benchmarks.generar_datos import VOLUMENES_POR_DEFECTO, agregar_argumentos, generar
+
+APP = str(Path(__file__).resolve().parent.parent / "app_claude.py")
+
+
+def preparar_app(url):
+    """AppTest ya logueado y apuntando a la base de la URL"""
+    u = make_url(url)
+    at = AppTest.from_file(APP, default_timeout=600)
+    at.secrets["general"] = {"admin_password": "bench"}
+    at.secrets["postgres"] = {
+        "user": u.username or "", "password": u.password or "", "host": u.host or "localhost",
+        "port": u.port or 5432, "database": u.database,
+    }
+    at.session_state["password_correct"] = True
+    return at
+
+
+def correr_seccion(at, seccion):
+    """Una ejecución de la sección. Retorna (ms del script, {consulta: ms})"""
+    rendimiento.limpiar()
+    at.radio(key="seccion_activa").set_value(seccion).run()
+    if at.exception:
+        raise RuntimeError(f"{seccion}: {at.exception[0].message}")
+    consultas, reruns = rendimiento.registros()
+    por_consulta = {}
+    for c in consultas:
+        por_consulta[c["etiqueta"]] = por_consulta.get(c["etiqueta"], 0.0) + c["duracion_ms"]
+    return reruns[-1]["duracion_ms"], por_consulta
+
+
+def medir_escala(url, repeticiones):
+    """Mide todas las secciones: una corrida en frío (sin cache) y N en caliente"""
+    at = preparar_app(url)
+    at.run()
+    secciones = at.radio(key="seccion_activa").options
+    resultado = {}
+    for seccion in secciones:
+        st.cache_data.clear()
+        frio_ms, _ = correr_seccion(at, seccion)
+        tiempos, consultas = [], {}
+        for _ in range(repeticiones):
+            ms, por_consulta = correr_seccion(at, seccion)
+            tiempos.append(ms)
+            for etiqueta, ms_c in por_consulta.items():
+                consultas.setdefault(etiqueta, []).append(ms_c)
+        consultas_p50 = {e: statistics.median(v) for e, v in consultas.items()}
+        p50 = statistics.median(tiempos)
+        en_consultas = sum(consultas_p50.values())
+        resultado[seccion] = {
+            "frio_ms": round(frio_ms, 1),
+            "p50_ms": round(p50, 1),
+            "max_ms": round(max(tiempos), 1),
+            "consultas_ms": round(en_consultas, 1),
+            "resto_ms": round(max(p50 - en_consultas, 0), 1),
+            "consultas": {e: round(ms, 2) for e, ms in sorted(consultas_p50.items(), key=lambda x: -x[1])},
+        }
+    return resultado
+
+
+def comparar(actual, anterior, umbral):
+    """Imprime la variación de p50 por escala y sección. Retorna True si hay regresiones"""
+    hay_regresion = False
+    for escala, datos in actual["escalas"].items():
+        previo = anterior.get("escalas", {}).get(escala)
+        if not previo:
+            continue
+        print(f"\n=== {int(escala):,} líneas de venta ===")
+        for seccion, med in datos["secciones"].items():
+            antes = previo["secciones"].get(seccion)
+            if not antes:
+                continue
+            cambio = (med["p50_ms"] - antes["p50_ms"]) / antes["p50_ms"] * 100 if antes["p50_ms"] else 0
+            marca = "🔴" if cambio > umbral else ("🟢" if cambio < -umbral else "  ")
+            hay_regresion |= cambio > umbral
+            print(f"{marca} {seccion:<22} {antes['p50_ms']:>9.1f} -> {med['p50_ms']:>9.1f} ms ({cambio:+.0f}%)")
+    return hay_regresion
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", required=True, help="URL de la base LOCAL de pruebas")
+    parser.add_argument("--escalas", type=int, nargs="+", default=[10000, 100000, 1000000],
+                        help="cantidades de líneas de venta a medir")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--salida", default="bench.json")
+    parser.add_argument("--comparar", help="reporte JSON anterior para detectar regresiones")
+    parser.add_argument("--umbral", type=float, default=15.0, help="%% de empeoramiento que se marca como regresión")
+    agregar_argumentos(parser, excluir=("detalle_ventas",))  # lo fija --escalas
+    args = parser.parse_args()
+
+    volumenes = {clave: getattr(args, clave) for clave in VOLUMENES_POR_DEFECTO if clave != "detalle_ventas"}
+    engine = create_engine(args.url)
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+
+    reporte = {"fecha": datetime.now().isoformat(timespec="seconds"), "commit": commit,
+               "repeticiones": args.repeticiones, "escalas": {}}
+    for escala in args.escalas:
+        print(f"⏳ Generando {escala:,} líneas de venta...")
+        segundos = generar(engine, semilla=args.semilla, reset=True, detalle_ventas=escala, **volumenes)
+        print(f"⏳ Midiendo secciones ({segundos:.0f} s de generación)...")
+        inicio = time.perf_counter()
+        reporte["escalas"][str(escala)] = {
+            "generacion_s": round(segundos, 1),
+            "secciones": medir_escala(args.url, args.repeticiones),
+            "medicion_s": round(time.perf_counter() - inicio, 1),
+        }
+        for seccion, med in reporte["escalas"][str(escala)]["secciones"].items():
+            print(f"   {seccion:<22} p50 {med['p50_ms']:>9.1f} ms  (consultas {med['consultas_ms']:.1f} ms)")
+
+    Path(args.salida).write_text(json.dumps(reporte, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"✅ Reporte en {args.salida}")
+
+    if args.comparar:
+        anterior = json.loads(Path(args.comparar).read_text(encoding="utf-8"))
+        if comparar(reporte, anterior, args.umbral):
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
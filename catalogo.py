@@ -0,0 +1,164 @@
+"""
+Catálogos maestros (productos, marcas, clientes, proveedores) con cache TTL.
+
+Cada catálogo tiene su propia entrada de cache: una escritura invalida solo
+lo que tocó (ej: una compra limpia productos pero no clientes) en vez de
+tirar todo con st.cache_data.clear().
+
+Si al recargar la base no responde, se sirve lo último que se cargó bien
+(en memoria del proceso): el mostrador sigue vendiendo contra la cola local.
+"""
+import functools
+import threading
+
+import streamlit as st
+import pandas as pd
+from sqlalchemy import exc, text
+
+# El stock cambia con cada venta/compra; el resto casi no se mueve
+TTL_PRODUCTOS = 60
+TTL_MAESTROS = 600
+
+_lock = threading.Lock()
+_ultimo_bueno = {}  # (función, argumentos) -> último resultado
+
+
+def _con_respaldo(cargador):
+    """Envuelve un cargador cacheado: sin conexión devuelve el último resultado bueno"""
+    @functools.wraps(cargador)
+    def cargar(_engine, *args):
+        clave = (cargador.__name__, args)
+        try:
+            valor = cargador(_engine, *args)
+        except (exc.OperationalError, exc.InterfaceError):
+            with _lock:
+                respaldo = _ultimo_bueno.get(clave)
+            if respaldo is None:
+                raise
+            # Copia: st.cache_data también entrega copias, nadie pisa el respaldo
+            return respaldo.copy()
+        with _lock:
+            _ultimo_bueno[clave] = valor
+        return valor
+
+    cargar.clear = cargador.clear
+    return cargar
+
+
+@_con_respaldo
+@st.cache_data(ttl=TTL_PRODUCTOS, show_spinner=False)
+def cargar_productos(_engine):
+    """Productos con su marca, precios y stock (ordenados por nombre)"""
+    with _engine.connect() as conn:
+        return pd.read_sql(text("""
+            SELECT p.id_producto, p.nombre, p.id_marca, m.nombre as marca,
+                   p.precio_venta, p.precio_venta_caja, p.stock_actual,
+                   p.unidades_por_caja, p.precio_costo_promedio
+            FROM productos p
+            JOIN marcas m ON p.id_marca = m.id_marca
+            ORDER BY p.nombre
+        """), conn)
+
+
+@_con_respaldo
+@st.cache_data(ttl=TTL_MAESTROS, show_spinner=False)
+def cargar_clientes(_engine):
+    """Clientes ordenados por razón social"""
+    with _engine.connect() as conn:
+        return pd.read_sql(text("SELECT id_cliente, razon_social FROM clientes ORDER BY razon_social"), conn)
+
+
+@_con_respaldo
+@st.cache_data(ttl=TTL_MAESTROS, show_spinner=False)
+def cargar_proveedores(_engine):
+    """Proveedores ordenados por nombre"""
+    with _engine.connect() as conn:
+        return pd.read_sql(text("SELECT id_proveedor, nombre FROM proveedores ORDER BY nombre"), conn)
+
+
+@_con_respaldo
+@st.cache_data(ttl=TTL_MAESTROS, show_spinner=False)
+def cargar_marcas(_engine):
+    """Marcas ordenadas por nombre"""
+    with _engine.connect() as conn:
+        return pd.read_sql(text("SELECT id_marca, nombre FROM marcas ORDER BY nombre"), conn)
+
+
+@_con_respaldo
+@st.cache_data(ttl=TTL_MAESTROS, show_spinner=False)
+def cargar_tipos_movimiento(_engine):
+    """Tipos de movimiento de inventario que existen en la base"""
+    with _engine.connect() as conn:
+        df = pd.read_sql(text("SELECT DISTINCT tipo FROM inventario_movimientos ORDER BY tipo"), conn)
+    return df['tipo'].tolist()
+
+
+# --- ÍNDICES id -> ETIQUETA PARA LOS SELECTORES ---
+# st.selectbox llama a format_func una vez por opción: si cada llamada filtra
+# el DataFrame entero, dibujar el desplegable es O(n²). Con un dict es O(n).
+
+def armar_etiquetas(ids, etiquetas):
+    """Arma un dict id -> etiqueta a partir de dos columnas alineadas"""
+    return dict(zip(pd.Series(ids).tolist(), pd.Series(etiquetas).astype(str).tolist()))
+
+
+@_con_respaldo
+@st.cache_data(ttl=TTL_PRODUCTOS, show_spinner=False)
+def etiquetas_productos(_engine):
+    """id_producto -> 'Nombre (Marca)'"""
+    df = cargar_productos(_engine)
+    return armar_etiquetas(df['id_producto'], df['nombre'] + " (" + df['marca'] + ")")
+
+
+@_con_respaldo
+@st.cache_data(ttl=TTL_MAESTROS, show_spinner=False)
+def etiquetas_clientes(_engine):
+    """id_cliente -> razón social"""
+    df = cargar_clientes(_engine)
+    return armar_etiquetas(df['id_cliente'], df['razon_social'])
+
+
+@_con_respaldo
+@st.cache_data(ttl=TTL_MAESTROS, show_spinner=False)
+def etiquetas_proveedores(_engine):
+    """id_proveedor -> nombre"""
+    df = cargar_proveedores(_engine)
+    return armar_etiquetas(df['id_proveedor'], df['nombre'])
+
+
+@_con_respaldo
+@st.cache_data(ttl=TTL_MAESTROS, show_spinner=False)
+def etiquetas_marcas(_engine):
+    """id_marca -> nombre"""
+    df = cargar_marcas(_engine)
+    return armar_etiquetas(df['id_marca'], df['nombre'])
+
+
+# Qué funciones cacheadas depende de cada tabla
+_CATALOGOS = {
+    "productos": [cargar_productos, etiquetas_productos],
+    "clientes": [cargar_clientes, etiquetas_clientes],
+    "proveedores": [cargar_proveedores, etiquetas_proveedores],
+    # productos trae el nombre de la marca
+    "marcas": [cargar_marcas, etiquetas_marcas, cargar_productos, etiquetas_productos],
+    # Sin catálogo propio: la usan los KPIs y el tablero (ver tablero.py)
+    "ventas_diarias_producto": [],
+}
+
+
+def registrar(tablas, *funciones):
+    """Suma funciones cacheadas de otros módulos a la invalidación de esas tablas"""
+    for tabla in tablas:
+        _CATALOGOS[tabla].extend(funciones)
+
+
+def tablas_cacheadas():
+    """Tablas que tienen alguna función cacheada que depende de ellas"""
+    return list(_CATALOGOS)
+
+
+def invalidar(*tablas):
+    """Limpia solo las entradas de cache de los catálogos indicados"""
+    for tabla in tablas:
+        for funcion in _CATALOGOS[tabla]:
+            funcion.clear()
@@ -0,0 +1,313 @@
+"""
+Cola local de ventas y compras (write-ahead en SQLite).
+
+Confirmar una venta o una compra ya no espera a Postgres: la operación se
+escribe en un diario SQLite local (modo WAL, synchronous=FULL: sobrevive a
+un corte de luz) y se confirma al instante. Un hilo por proceso la replica
+a Postgres en lotes, en orden de llegada: un lote = una transacción, cada
+operación en su SAVEPOINT, así que una operación con datos inválidos no
+tumba a las demás.
+
+Cada operación lleva una clave (uuid) que se graba en operaciones_aplicadas
+(sql/010) dentro de la MISMA transacción que la venta/compra. Si el proceso
+se cae entre el COMMIT de Postgres y la marca local, al reintentar la clave
+ya está y solo se copia el id remoto: nunca se graba dos veces.
+
+Estados: pendiente -> sincronizada | error (datos que Postgres rechaza; se
+puede reintentar o descartar). Si la base no responde la operación sigue
+pendiente y se reintenta sola.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import exc, text
+
+import catalogo
+import rendimiento
+
+ARCHIVO = os.environ.get("GALPON_COLA", str(Path(__file__).resolve().parent / "cola_operaciones.db"))
+TAMANIO_LOTE = 50
+ESPERA = 2              # segundos entre vueltas si no hay nada nuevo
+ESPERA_RECONEXION = 5   # si Postgres no responde
+DIAS_HISTORIAL = 30     # las sincronizadas más viejas se borran del diario
+
+TIPOS = {"venta": "Venta", "compra": "Compra"}
+ESTADOS = {
+    "pendiente": "🕓 En cola",
+    "sincronizada": "✅ Sincronizada",
+    "error": "❌ Error",
+    "descartada": "🗑️ Descartada",
+}
+
+_lock = threading.Lock()
+_hay_nuevas = threading.Event()
+_estado = {"hilo": None, "conectado": None, "error": None, "ultima": None}
+
+
+def _abrir():
+    conn = sqlite3.connect(ARCHIVO, timeout=10, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=FULL")
+    return conn
+
+
+def preparar():
+    """Crea el diario si no existe"""
+    conn = _abrir()
+    try:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS operaciones (
+                id            INTEGER PRIMARY KEY AUTOINCREMENT,
+                clave         TEXT NOT NULL UNIQUE,
+                tipo          TEXT NOT NULL,
+                datos         TEXT NOT NULL,
+                creada        TEXT NOT NULL,
+                estado        TEXT NOT NULL DEFAULT 'pendiente',
+                intentos      INTEGER NOT NULL DEFAULT 0,
+                error         TEXT,
+                id_remoto     INTEGER,
+                sincronizada  TEXT
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS operaciones_estado ON operaciones (estado, id)")
+    finally:
+        conn.close()
+
+
+def _a_json(x):
+    # Los carritos traen enteros/flotantes de numpy (vienen de DataFrames)
+    return x.item() if hasattr(x, "item") else str(x)
+
+
+def encolar(tipo, datos):
+    """Guarda la operación en el diario local y retorna su clave"""
+    clave = str(uuid.uuid4())
+    conn = _abrir()
+    try:
+        conn.execute(
+            "INSERT INTO operaciones (clave, tipo, datos, creada) VALUES (?, ?, ?, ?)",
+            (clave, tipo, json.dumps(datos, default=_a_json), datetime.now().isoformat(timespec="seconds")),
+        )
+    finally:
+        conn.close()
+    _hay_nuevas.set()
+    return clave
+
+
+def _pendientes(limite):
+    conn = _abrir()
+    try:
+        return conn.execute(
+            "SELECT id, clave, tipo, datos FROM operaciones WHERE estado = 'pendiente' ORDER BY id LIMIT ?",
+            (limite,),
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def _marcar(resultados):
+    """resultados: [(clave, estado, id_remoto, error)]"""
+    ahora = datetime.now().isoformat(timespec="seconds")
+    conn = _abrir()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany("""
+            UPDATE operaciones
+            SET estado = ?, id_remoto = ?, error = ?, intentos = intentos + 1,
+                sincronizada = CASE WHEN ? = 'sincronizada' THEN ? END
+            WHERE clave = ?
+        """, [(estado, id_remoto, error, estado, ahora, clave) for clave, estado, id_remoto, error in resultados])
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+
+def _transitorio(e):
+    """Errores de conexión/timeout: la operación queda pendiente"""
+    return isinstance(e, (exc.OperationalError, exc.InterfaceError)) or getattr(e, "connection_invalidated", False)
+
+
+def aplicar_una_vez(conn, clave, tipo, aplicador, datos):
+    """Graba la operación solo si su clave no está en operaciones_aplicadas.
+
+    Corre dentro de la transacción de quien llama. Retorna (id, era_nueva):
+    si la clave ya estaba devuelve el id grabado la primera vez.
+    """
+    nueva = conn.execute(text("""
+        INSERT INTO operaciones_aplicadas (clave, tipo) VALUES (CAST(:clave AS uuid), :tipo)
+        ON CONFLICT (clave) DO NOTHING
+        RETURNING clave
+    """), {"clave": clave, "tipo": tipo}).first()
+    if nueva is None:
+        # Ya se grabó en una vuelta anterior (o en otro proceso)
+        return conn.execute(
+            text("SELECT id_remoto FROM operaciones_aplicadas WHERE clave = CAST(:clave AS uuid)"),
+            {"clave": clave},
+        ).scalar_one(), False
+    id_remoto = aplicador(conn, datos)
+    conn.execute(
+        text("UPDATE operaciones_aplicadas SET id_remoto = :id WHERE clave = CAST(:clave AS uuid)"),
+        {"id": id_remoto, "clave": clave},
+    )
+    return id_remoto, True
+
+
+def _aplicar_lote(engine, aplicadores, lote):
+    """Replica el lote en una transacción; cada operación en su SAVEPOINT"""
+    resultados = []
+    with engine.begin() as conn, rendimiento.etiqueta("cola: replicar lote"):
+        for op in lote:
+            try:
+                with conn.begin_nested():
+                    id_remoto, _ = aplicar_una_vez(
+                        conn, op["clave"], op["tipo"], aplicadores[op["tipo"]], json.loads(op["datos"])
+                    )
+                resultados.append((op["clave"], "sincronizada", id_remoto, None))
+            except Exception as e:
+                if _transitorio(e):
+                    raise
+                resultados.append((op["clave"], "error", None, str(getattr(e, "orig", None) or e)))
+    return resultados
+
+
+def vaciar(engine, aplicadores):
+    """Una vuelta del replicador: procesa un lote. Retorna cuántas operaciones intentó"""
+    lote = _pendientes(TAMANIO_LOTE)
+    if not lote:
+        return 0
+    resultados = _aplicar_lote(engine, aplicadores, lote)
+    _marcar(resultados)
+    if any(estado == "sincronizada" for _, estado, _, _ in resultados):
+        catalogo.invalidar("productos")
+    with _lock:
+        _estado.update(conectado=True, error=None, ultima=datetime.now().isoformat(timespec="seconds"))
+    return len(lote)
+
+
+def _limpiar_viejas():
+    limite = (datetime.now() - timedelta(days=DIAS_HISTORIAL)).isoformat(timespec="seconds")
+    conn = _abrir()
+    try:
+        conn.execute("DELETE FROM operaciones WHERE estado IN ('sincronizada', 'descartada') AND creada < ?", (limite,))
+    finally:
+        conn.close()
+
+
+def _replicar(engine, aplicadores):
+    _limpiar_viejas()
+    while True:
+        try:
+            if vaciar(engine, aplicadores) == TAMANIO_LOTE:
+                continue  # quedan más: sin esperar
+        except Exception as e:
+            with _lock:
+                _estado.update(conectado=False, error=str(e))
+            time.sleep(ESPERA_RECONEXION)
+            continue
+        _hay_nuevas.wait(ESPERA)
+        _hay_nuevas.clear()
+
+
+def iniciar(engine, aplicadores):
+    """Arranca el replicador (uno por proceso). aplicadores: {tipo: f(conn, datos) -> id}"""
+    with _lock:
+        if _estado["hilo"] is not None:
+            return
+        preparar()
+        hilo = threading.Thread(target=_replicar, args=(engine, aplicadores), name="cola-replicador", daemon=True)
+        _estado["hilo"] = hilo
+    hilo.start()
+
+
+# --- CONSULTAS PARA LA APP ---
+
+def estado():
+    """Conteo por estado y situación del replicador (para el panel lateral)"""
+    conn = _abrir()
+    try:
+        conteo = dict(conn.execute("SELECT estado, COUNT(*) FROM operaciones GROUP BY estado").fetchall())
+        mas_vieja = conn.execute("SELECT MIN(creada) FROM operaciones WHERE estado = 'pendiente'").fetchone()[0]
+    finally:
+        conn.close()
+    with _lock:
+        return {
+            "pendientes": conteo.get("pendiente", 0),
+            "errores": conteo.get("error", 0),
+            "sincronizadas": conteo.get("sincronizada", 0),
+            "pendiente_desde": mas_vieja,
+            "conectado": _estado["conectado"],
+            "error": _estado["error"],
+            "ultima": _estado["ultima"],
+        }
+
+
+def recientes(tipo, limite=20):
+    """Últimas operaciones del tipo, con su estado de sincronización"""
+    conn = _abrir()
+    try:
+        filas = conn.execute("""
+            SELECT clave, creada, estado, intentos, error, id_remoto, datos
+            FROM operaciones
+            WHERE tipo = ? AND estado <> 'descartada'
+            ORDER BY id DESC
+            LIMIT ?
+        """, (tipo, limite)).fetchall()
+    finally:
+        conn.close()
+    return [
+        {
+            "clave": f["clave"],
+            "Creada": f["creada"].replace("T", " "),
+            "Estado": ESTADOS[f["estado"]],
+            "N°": f["id_remoto"],
+            "Total": json.loads(f["datos"]).get("total"),
+            "Intentos": f["intentos"],
+            "Error": f["error"],
+        }
+        for f in filas
+    ]
+
+
+def en_transito():
+    """{id_producto: unidades} que todavía no llegaron a Postgres (ventas restan, compras suman)"""
+    conn = _abrir()
+    try:
+        filas = conn.execute("SELECT tipo, datos FROM operaciones WHERE estado = 'pendiente'").fetchall()
+    finally:
+        conn.close()
+    saldo = {}
+    for f in filas:
+        datos = json.loads(f["datos"])
+        for item in datos["items"]:
+            if f["tipo"] == "venta":
+                delta = -int(item["UnidadesTotales"])
+            else:
+                delta = int(item["Cantidad"])
+            saldo[item["id_producto"]] = saldo.get(item["id_producto"], 0) + delta
+    return saldo
+
+
+def reintentar(clave):
+    """Vuelve a poner en cola una operación con error"""
+    conn = _abrir()
+    try:
+        conn.execute("UPDATE operaciones SET estado = 'pendiente', error = NULL WHERE clave = ? AND estado = 'error'", (clave,))
+    finally:
+        conn.close()
+    _hay_nuevas.set()
+
+
+def descartar(clave):
+    """Da por perdida una operación con error (no se replica más)"""
+    conn = _abrir()
+    try:
+        conn.execute("UPDATE operaciones SET estado = 'descartada' WHERE clave = ? AND estado = 'error'", (clave,))
+    finally:
+        conn.close()
@@ -0,0 +1,108 @@
+"""
+Creación del engine de Postgres a partir de la sección [postgres] de los secrets.
+
+Además de user/password/host/port/database, acepta (todas opcionales):
+
+    pool_size = 5                 # conexiones fijas en el pool
+    max_overflow = 10             # extra en hora pico
+    pool_timeout = 30             # segundos esperando una conexión libre
+    pool_recycle = 1800           # segundos antes de reciclar una conexión
+    statement_timeout_ms = 15000  # corta consultas colgadas del lado del servidor
+    connect_timeout = 5           # segundos para conectar (sin red falla rápido)
+    application_name = "el-galpon"
+"""
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
+
+CONFIG_POR_DEFECTO = {
+    "pool_size": 5,
+    "max_overflow": 10,
+    "pool_timeout": 30,
+    "pool_recycle": 1800,
+    "statement_timeout_ms": 15000,
+    "connect_timeout": 5,
+    "application_name": "el-galpon",
+}
+
+
+class PoolMedido(QueuePool):
+    """QueuePool que registra cuánto se espera para obtener cada conexión"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Pool.recreate() arma un pool nuevo después de un reinicio de la base:
+        # cada instancia lleva sus propias métricas, creadas antes del primer
+        # checkout (si se crearan ahí, dos hilos podrían pisarse el dict)
+        self._stats_espera = {
+            "lock": threading.Lock(),
+            "checkouts": 0,
+            "espera_max": 0.0,
+            "esperas": deque(maxlen=1000),
+        }
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            espera = time.perf_counter() - inicio
+            stats = self._stats_espera
+            with stats["lock"]:
+                stats["checkouts"] += 1
+                stats["esperas"].append(espera)
+                stats["espera_max"] = max(stats["espera_max"], espera)
+
+
+def crear_engine(c):
+    """Engine con pool dimensionado, pre-ping, reciclado y statement_timeout"""
+    opciones = {clave: c.get(clave, valor) for clave, valor in CONFIG_POR_DEFECTO.items()}
+    return create_engine(
+        f"postgresql://{c['user']}:{c['password']}@{c['host']}:{c['port']}/{c['database']}",
+        poolclass=PoolMedido,
+        pool_size=int(opciones["pool_size"]),
+        max_overflow=int(opciones["max_overflow"]),
+        pool_timeout=float(opciones["pool_timeout"]),
+        pool_recycle=int(opciones["pool_recycle"]),
+        pool_pre_ping=True,  # descarta conexiones muertas (ej: después de reiniciar Postgres)
+        connect_args={
+            "application_name": opciones["application_name"],
+            # Sin esto, con el host caído cada conexión espera el timeout TCP del
+            # sistema (minutos) y el mostrador queda colgado en vez de usar la cola
+            "connect_timeout": int(opciones["connect_timeout"]),
+            "options": f"-c statement_timeout={int(opciones['statement_timeout_ms'])}",
+            # Keepalives TCP: una conexión que se corta en silencio (red, NAT)
+            # da error en ~1 minuto en vez de quedar colgada (ej: el LISTEN)
+            "keepalives": 1,
+            "keepalives_idle": 30,
+            "keepalives_interval": 10,
+            "keepalives_count": 3,
+            # Lo mismo con datos enviados sin respuesta (ej: el pre-ping contra
+            # un host que se cayó): error a los 10 s en vez de los ~15 min de TCP
+            "tcp_user_timeout": 10000,
+        },
+    )
+
+
+def estadisticas_pool(engine):
+    """Foto del pool: conexiones en uso/libres y tiempos de espera (en ms)"""
+    pool = engine.pool
+    stats = pool._stats_espera
+    with stats["lock"]:
+        esperas = sorted(stats["esperas"])
+        checkouts = stats["checkouts"]
+        espera_max = stats["espera_max"]
+    p95 = esperas[min(len(esperas) - 1, int(len(esperas) * 0.95))] if esperas else 0.0
+    return {
+        "tamanio": pool.size(),
+        "en_uso": pool.checkedout(),
+        "libres": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "checkouts": checkouts,
+        "espera_prom_ms": (sum(esperas) / len(esperas) * 1000) if esperas else 0.0,
+        "espera_p95_ms": p95 * 1000,
+        "espera_max_ms": espera_max * 1000,
+    }
@@ -0,0 +1,110 @@
+"""
+Consultas de Análisis y Reportes sobre el cubo ventas_cubo (día x producto x cliente).
+
+Cualquier rango de fechas, con filtros de marca/cliente/producto y agrupado
+por día, semana o mes, se resuelve agregando celdas del cubo: el costo
+depende del rango pedido y no de cuánto historial crudo haya en
+detalle_ventas. Los resultados se mantienen en el cache del proceso y se
+recalculan en segundo plano cuando entra una venta (ver refresco.py).
+"""
+from datetime import timedelta
+
+import pandas as pd
+from sqlalchemy import text
+
+import catalogo
+import refresco
+import rendimiento
+
+GRANOS = {"Día": "day", "Semana": "week", "Mes": "month"}
+
+COMPARACIONES = ["Período anterior", "Mismo período del año anterior", "Sin comparación"]
+
+# Dimensión -> (columna para agrupar, etiqueta)
+DIMENSIONES = {
+    "producto": ("c.id_producto", "p.nombre"),
+    "marca": ("p.id_marca", "m.nombre"),
+    "cliente": ("c.id_cliente", "cl.razon_social"),
+}
+
+# Filtros opcionales: NULL = sin filtro
+_FROM_FILTRADO = """
+    FROM ventas_cubo c
+    JOIN productos p ON p.id_producto = c.id_producto
+    JOIN marcas m ON m.id_marca = p.id_marca
+    JOIN clientes cl ON cl.id_cliente = c.id_cliente
+    WHERE c.fecha BETWEEN :desde AND :hasta
+      AND (CAST(:marcas AS int[]) IS NULL OR p.id_marca = ANY(CAST(:marcas AS int[])))
+      AND (CAST(:clientes AS int[]) IS NULL OR c.id_cliente = ANY(CAST(:clientes AS int[])))
+      AND (CAST(:productos AS int[]) IS NULL OR c.id_producto = ANY(CAST(:productos AS int[])))
+"""
+
+
+def periodo_comparacion(desde, hasta, comparacion):
+    """(desde, hasta) del período contra el que se compara, o None"""
+    if comparacion == "Período anterior":
+        largo = hasta - desde + timedelta(days=1)
+        return desde - largo, hasta - largo
+    if comparacion == "Mismo período del año anterior":
+        return (pd.Timestamp(desde) - pd.DateOffset(years=1)).date(), (pd.Timestamp(hasta) - pd.DateOffset(years=1)).date()
+    return None
+
+
+def _params(desde, hasta, marcas, clientes, productos):
+    return {
+        "desde": desde, "hasta": hasta,
+        "marcas": list(marcas) or None,
+        "clientes": list(clientes) or None,
+        "productos": list(productos) or None,
+    }
+
+
+@refresco.mantener(intervalo=catalogo.TTL_MAESTROS)
+def por_dimension(_engine, dimension, desde, hasta, marcas=(), clientes=(), productos=()):
+    """Unidades, ingresos, costos y ganancia agrupados por producto, marca o cliente"""
+    clave, etiqueta = DIMENSIONES[dimension]
+    with _engine.connect() as conn, rendimiento.etiqueta(f"cubo_{dimension}"):
+        return pd.read_sql(text(f"""
+            SELECT {clave} AS id, {etiqueta} AS nombre,
+                   COUNT(DISTINCT c.id_producto) AS productos,
+                   SUM(c.unidades_reales)::float8 AS unidades,
+                   SUM(c.ingresos)::float8 AS ingresos,
+                   SUM(c.costo)::float8 AS costos,
+                   SUM(c.ingresos - c.costo)::float8 AS ganancia
+            {_FROM_FILTRADO}
+            GROUP BY {clave}, {etiqueta}
+            HAVING SUM(c.unidades_reales) > 0
+            ORDER BY ganancia DESC
+        """), conn, params=_params(desde, hasta, marcas, clientes, productos))
+
+
+@refresco.mantener(intervalo=catalogo.TTL_MAESTROS)
+def serie(_engine, grano, desde, hasta, marcas=(), clientes=(), productos=()):
+    """Ingresos, costos y líneas por día/semana/mes (los períodos sin ventas no aparecen)"""
+    with _engine.connect() as conn, rendimiento.etiqueta("cubo_serie"):
+        return pd.read_sql(text(f"""
+            SELECT DATE_TRUNC(:grano, c.fecha::timestamp)::date AS periodo,
+                   SUM(c.ingresos)::float8 AS ingresos,
+                   SUM(c.costo)::float8 AS costos,
+                   SUM(c.lineas)::int AS lineas
+            {_FROM_FILTRADO}
+            GROUP BY 1
+            ORDER BY 1
+        """), conn, params={"grano": GRANOS[grano], **_params(desde, hasta, marcas, clientes, productos)})
+
+
+@refresco.mantener(intervalo=catalogo.TTL_MAESTROS)
+def operaciones(_engine, desde, hasta, clientes=()):
+    """Cantidad de ventas (cabeceras) del rango: no se puede sumar desde el cubo"""
+    with _engine.connect() as conn, rendimiento.etiqueta("cubo_operaciones"):
+        return conn.execute(text("""
+            SELECT COUNT(*) FROM ventas
+            WHERE fecha >= :desde AND fecha < CAST(:hasta AS date) + 1
+              AND (CAST(:clientes AS int[]) IS NULL OR id_cliente = ANY(CAST(:clientes AS int[])))
+        """), {"desde": desde, "hasta": hasta, "clientes": list(clientes) or None}).scalar()
+
+
+# Cada venta toca ventas_diarias_producto en la misma transacción que el
+# cubo, así que su aviso alcanza para limpiar estas consultas
+catalogo.registrar(["ventas_diarias_producto", "productos", "marcas", "clientes"], por_dimension, serie)
+catalogo.registrar(["ventas_diarias_producto"], operaciones)
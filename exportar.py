@@ -0,0 +1,166 @@
+"""
+Exportación de ventas, compras, movimientos e historial de precios a
+CSV / Excel / Parquet, en streaming.
+
+La consulta corre con un cursor del lado del servidor (stream_results) y se
+lee de a TAMANIO_LOTE filas: cada lote se escribe al archivo y se descarta,
+así que la memoria no depende del rango de fechas. Lo usan la app (sección
+Auditoría) y `mantenimiento.py exportar`.
+"""
+import csv
+import os
+import tempfile
+
+import pandas as pd
+from sqlalchemy import text
+
+import rendimiento
+
+TAMANIO_LOTE = 20000
+FILAS_POR_HOJA_XLSX = 1_000_000  # Excel admite 1.048.576 filas por hoja
+
+FORMATOS = {"CSV": ".csv", "Excel": ".xlsx", "Parquet": ".parquet"}
+
+# Conjunto -> consulta por rango de fechas (orden estable: fecha, id)
+CONJUNTOS = {
+    "Ventas (detalle)": """
+        SELECT v.id_venta AS "N° Venta", v.fecha AS "Fecha", c.razon_social AS "Cliente",
+               v.nro_factura AS "Factura", v.metodo_pago AS "Pago", v.total_venta AS "Total Venta",
+               p.nombre AS "Producto", m.nombre AS "Marca", dv.formato_venta AS "Formato",
+               dv.cantidad_formato AS "Cantidad", dv.unidades_reales AS "Unidades",
+               dv.precio_unitario_historico AS "Precio Unit.", dv.costo_unitario AS "Costo Unit.",
+               dv.es_concesion AS "Concesión", dv.descripcion AS "Descripción"
+        FROM ventas v
+        JOIN clientes c ON c.id_cliente = v.id_cliente
+        JOIN detalle_ventas dv ON dv.id_venta = v.id_venta
+        JOIN productos p ON p.id_producto = dv.id_producto
+        JOIN marcas m ON m.id_marca = p.id_marca
+        WHERE v.fecha >= :desde AND v.fecha < CAST(:hasta AS date) + 1
+        ORDER BY v.fecha, v.id_venta, dv.id_detalle
+    """,
+    "Compras (detalle)": """
+        SELECT comp.id_compra AS "N° Compra", comp.fecha AS "Fecha", pr.nombre AS "Proveedor",
+               comp.nro_factura AS "Factura", comp.costo_flete AS "Flete", comp.total_compra AS "Total Compra",
+               p.nombre AS "Producto", m.nombre AS "Marca", dc.cantidad_unidades AS "Unidades",
+               dc.precio_compra_neto AS "Costo Neto"
+        FROM compras comp
+        JOIN proveedores pr ON pr.id_proveedor = comp.id_proveedor
+        JOIN detalle_compras dc ON dc.id_compra = comp.id_compra
+        JOIN productos p ON p.id_producto = dc.id_producto
+        JOIN marcas m ON m.id_marca = p.id_marca
+        WHERE comp.fecha >= :desde AND comp.fecha < CAST(:hasta AS date) + 1
+        ORDER BY comp.fecha, comp.id_compra, dc.id_detalle
+    """,
+    "Movimientos de inventario": """
+        SELECT im.id_movimiento AS "N° Mov", im.fecha AS "Fecha", p.nombre AS "Producto",
+               m.nombre AS "Marca", im.tipo AS "Tipo", im.cantidad AS "Cantidad"
+        FROM inventario_movimientos im
+        JOIN productos p ON p.id_producto = im.id_producto
+        JOIN marcas m ON m.id_marca = p.id_marca
+        WHERE im.fecha >= :desde AND im.fecha < CAST(:hasta AS date) + 1
+        ORDER BY im.fecha, im.id_movimiento
+    """,
+    "Historial de precios": """
+        SELECT hp.fecha AS "Fecha", p.nombre AS "Producto", m.nombre AS "Marca",
+               hp.precio_anterior AS "Precio Anterior", hp.precio_nuevo AS "Precio Nuevo"
+        FROM historial_precios hp
+        JOIN productos p ON p.id_producto = hp.id_producto
+        JOIN marcas m ON m.id_marca = p.id_marca
+        WHERE hp.fecha >= :desde AND hp.fecha < CAST(:hasta AS date) + 1
+        ORDER BY hp.fecha, hp.id_historial
+    """,
+}
+
+
+def _lotes(engine, conjunto, desde, hasta, tamanio=TAMANIO_LOTE):
+    """Primero (columnas, descripción del cursor); después listas de filas, leyendo con cursor del servidor"""
+    with engine.connect() as conn, rendimiento.etiqueta(f"exportar {conjunto}"):
+        res = conn.execution_options(stream_results=True, yield_per=tamanio).execute(
+            text(CONJUNTOS[conjunto]), {"desde": desde, "hasta": hasta}
+        )
+        yield list(res.keys()), res.cursor.description
+        for particion in res.partitions():
+            yield particion
+
+
+def _escribir_csv(lotes, columnas, descripcion, ruta):
+    # utf-8-sig + ';' para que Excel en castellano lo abra directo
+    with open(ruta, "w", newline="", encoding="utf-8-sig") as f:
+        escritor = csv.writer(f, delimiter=";")
+        escritor.writerow(columnas)
+        filas = 0
+        for lote in lotes:
+            escritor.writerows(lote)
+            filas += len(lote)
+    return filas
+
+
+def _escribir_xlsx(lotes, columnas, descripcion, ruta):
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise RuntimeError("Para exportar a Excel hace falta instalar openpyxl (pip install openpyxl).")
+    # write_only: las filas se vuelcan al archivo a medida que se agregan
+    libro = Workbook(write_only=True)
+    hoja, en_hoja, filas = None, FILAS_POR_HOJA_XLSX, 0
+    for lote in lotes:
+        for fila in lote:
+            if en_hoja >= FILAS_POR_HOJA_XLSX:
+                hoja = libro.create_sheet(f"Datos {len(libro.worksheets) + 1}")
+                hoja.append(columnas)
+                en_hoja = 0
+            hoja.append(list(fila))
+            en_hoja += 1
+        filas += len(lote)
+    if hoja is None:
+        libro.create_sheet("Datos 1").append(columnas)
+    libro.save(ruta)
+    return filas
+
+
+def _esquema_parquet(pa, columnas, descripcion):
+    """Tipos fijos a partir de los OID de Postgres: no dependen de lo que traiga cada lote"""
+    tipos = {16: pa.bool_(), 20: pa.int64(), 21: pa.int16(), 23: pa.int32(), 700: pa.float32(),
+             701: pa.float64(), 1082: pa.date32(), 1114: pa.timestamp("us"), 1184: pa.timestamp("us", tz="UTC")}
+    campos = []
+    for nombre, col in zip(columnas, descripcion):
+        if col.type_code == 1700:
+            # numeric(p, s) conserva la escala; un numeric calculado (sin escala) va como float
+            tipo = pa.decimal128(38, col.scale) if col.scale is not None else pa.float64()
+        else:
+            tipo = tipos.get(col.type_code, pa.string())
+        campos.append(pa.field(nombre, tipo))
+    return pa.schema(campos)
+
+
+def _escribir_parquet(lotes, columnas, descripcion, ruta):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Para exportar a Parquet hace falta instalar pyarrow (pip install pyarrow).")
+    esquema = _esquema_parquet(pa, columnas, descripcion)
+    filas = 0
+    with pq.ParquetWriter(ruta, esquema, compression="zstd") as escritor:
+        for lote in lotes:
+            datos = pd.DataFrame.from_records(lote, columns=columnas)
+            escritor.write_table(pa.Table.from_pandas(datos, schema=esquema, preserve_index=False))
+            filas += len(lote)
+    return filas
+
+
+_ESCRITORES = {"CSV": _escribir_csv, "Excel": _escribir_xlsx, "Parquet": _escribir_parquet}
+
+
+def exportar(engine, conjunto, desde, hasta, formato, ruta=None):
+    """Escribe el conjunto en el formato pedido. Retorna (ruta, filas escritas)"""
+    if ruta is None:
+        fd, ruta = tempfile.mkstemp(prefix="galpon_", suffix=FORMATOS[formato])
+        os.close(fd)
+    lotes = _lotes(engine, conjunto, desde, hasta)
+    columnas, descripcion = next(lotes)
+    try:
+        filas = _ESCRITORES[formato](lotes, columnas, descripcion, ruta)
+    finally:
+        lotes.close()
+    return ruta, filas
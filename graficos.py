@@ -0,0 +1,151 @@
+"""
+Figuras de Plotly del Dashboard y de Análisis y Reportes, cacheadas.
+
+Cada figura se arma una vez por combinación de datos y parámetros:
+st.cache_data hashea los DataFrames que recibe, así que si el rerun trae
+los mismos datos (lo normal al tocar un filtro de otra sección) no se
+vuelve a correr plotly express. Además cada gráfico manda al navegador una
+cantidad acotada de puntos: las series largas se reducen con LTTB y las
+tortas agrupan la cola en "Otras".
+"""
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import streamlit as st
+
+MAX_PUNTOS_SERIE = 400
+MAX_PORCIONES = 12
+MAX_FIGURAS = 64  # por función: alcanza para las combinaciones de filtros de una jornada
+
+
+def indices_lttb(y, max_puntos=MAX_PUNTOS_SERIE):
+    """Índices a conservar con Largest-Triangle-Three-Buckets: reduce la serie
+    a max_puntos manteniendo picos y valles (el eje x se toma como posición)"""
+    n = len(y)
+    if n <= max_puntos or max_puntos < 3:
+        return np.arange(n)
+    y = np.asarray(y, dtype=float)
+    x = np.arange(n, dtype=float)
+    bordes = np.linspace(1, n - 1, max_puntos - 1).astype(int)
+    elegidos = [0]
+    for i in range(max_puntos - 2):
+        ini, fin = bordes[i], bordes[i + 1]
+        # Promedio del balde siguiente (o el último punto)
+        sig_ini, sig_fin = fin, bordes[i + 2] if i + 2 < len(bordes) else n
+        prom_x, prom_y = x[sig_ini:sig_fin].mean(), y[sig_ini:sig_fin].mean()
+        a = elegidos[-1]
+        areas = np.abs((x[a] - prom_x) * (y[ini:fin] - y[a]) - (x[a] - x[ini:fin]) * (prom_y - y[a]))
+        elegidos.append(ini + int(np.argmax(areas)))
+    elegidos.append(n - 1)
+    return np.array(elegidos)
+
+
+def reducir_serie(df, columna, max_puntos=MAX_PUNTOS_SERIE):
+    """Filas de df que alcanzan para dibujar 'columna' sin perder la forma"""
+    return df.iloc[indices_lttb(df[columna].to_numpy(), max_puntos)]
+
+
+def agrupar_cola(df, valor, etiqueta, maximo=MAX_PORCIONES):
+    """Las 'maximo - 1' filas más grandes y el resto sumado como 'Otras'"""
+    if len(df) <= maximo:
+        return df
+    orden = df.sort_values(valor, ascending=False)
+    resto = pd.DataFrame({etiqueta: ["Otras"], valor: [orden[valor].iloc[maximo - 1:].sum()]})
+    return pd.concat([orden.head(maximo - 1)[[etiqueta, valor]], resto], ignore_index=True)
+
+
+# --- DASHBOARD ---
+
+@st.cache_data(max_entries=MAX_FIGURAS, show_spinner=False)
+def top_ventas(df_top):
+    """Barras del Top 10 por venta de 30 días"""
+    fig = px.bar(
+        df_top,
+        x='Producto',
+        y='Venta 30d',
+        color=df_top['Marca'].astype(str),
+        labels={'color': 'Marca'},
+        title="🏆 Top 10 Productos (últimos 30 días)",
+        template="plotly_white"
+    )
+    fig.update_layout(showlegend=True, height=400)
+    return fig
+
+
+@st.cache_data(max_entries=MAX_FIGURAS, show_spinner=False)
+def distribucion_margenes(df_hist):
+    """Histograma ya agrupado (desde, hasta, productos): una barra por intervalo"""
+    fig = px.bar(
+        df_hist,
+        x=(df_hist['desde'] + df_hist['hasta']) / 2,
+        y='productos',
+        labels={'x': 'Margen %', 'productos': 'Productos'},
+        title="📊 Distribución de Márgenes",
+        template="plotly_white"
+    )
+    fig.update_traces(width=(df_hist['hasta'] - df_hist['desde']).tolist())
+    fig.update_layout(height=400, bargap=0)
+    return fig
+
+
+# --- ANÁLISIS Y REPORTES ---
+
+@st.cache_data(max_entries=MAX_FIGURAS, show_spinner=False)
+def barras_margen(df, y, titulo):
+    """Barras por producto coloreadas por margen (top de ganancia / margen bajo)"""
+    fig = px.bar(
+        df,
+        x='Producto',
+        y=y,
+        color='Margen %',
+        title=titulo,
+        template="plotly_white",
+        color_continuous_scale='RdYlGn'
+    )
+    fig.update_layout(height=400)
+    return fig
+
+
+@st.cache_data(max_entries=MAX_FIGURAS, show_spinner=False)
+def evolucion(df_evol, grano, df_comparacion=None, corrimiento=None, comparacion=None):
+    """Serie de ingresos (y la del período de comparación corrida al mismo eje)"""
+    df_evol = reducir_serie(df_evol, 'ingresos')
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=df_evol['periodo'],
+        y=df_evol['ingresos'],
+        mode='lines+markers' if len(df_evol) <= 120 else 'lines',
+        name='Ventas',
+        line=dict(color='#2E86AB', width=3),
+        fill='tozeroy'
+    ))
+    if df_comparacion is not None and len(df_comparacion) > 0:
+        df_comparacion = reducir_serie(df_comparacion, 'ingresos')
+        fig.add_trace(go.Scatter(
+            x=pd.to_datetime(df_comparacion['periodo']) + corrimiento,
+            y=df_comparacion['ingresos'],
+            mode='lines',
+            name=comparacion,
+            line=dict(color='#A23B72', width=2, dash='dash')
+        ))
+    fig.update_layout(
+        title=f"Ventas por {grano.lower()}",
+        xaxis_title="Fecha",
+        yaxis_title="Ventas ($)",
+        template="plotly_white",
+        height=400
+    )
+    return fig
+
+
+@st.cache_data(max_entries=MAX_FIGURAS, show_spinner=False)
+def torta_marcas(df_marcas):
+    """Ingresos por marca; las marcas chicas van juntas en 'Otras'"""
+    return px.pie(
+        agrupar_cola(df_marcas, 'Ingresos', 'Marca'),
+        values='Ingresos',
+        names='Marca',
+        title='Distribución de Ingresos por Marca',
+        template='plotly_white'
+    )
@@ -0,0 +1,332 @@
+"""
+Importación masiva de maestros (marcas, proveedores, clientes, productos)
+desde CSV / Excel.
+
+El archivo se valida en pandas, se copia con COPY a una tabla temporal
+(stg_<tabla>, se borra sola al terminar la transacción) y se cruza contra
+la tabla real con statements por conjunto: una sola pasada para el
+diff de prueba y otra para el alta/actualización (upsert por nombre, sin
+distinguir mayúsculas). Los productos nuevos con stock inicial generan su
+movimiento STOCK_INICIAL en el mismo statement, con los ids del RETURNING.
+"""
+import io
+
+import pandas as pd
+from sqlalchemy import text
+
+import rendimiento
+
+# Entidad -> tabla, id, columna clave, columnas (nombre -> tipo),
+# obligatorias, columnas que se actualizan si el registro ya existe
+ENTIDADES = {
+    "Marcas": {
+        "tabla": "marcas", "id": "id_marca", "clave": "nombre",
+        "columnas": {"nombre": "texto"},
+        "obligatorias": ["nombre"],
+        "actualiza": [],
+    },
+    "Proveedores": {
+        "tabla": "proveedores", "id": "id_proveedor", "clave": "nombre",
+        "columnas": {"nombre": "texto", "telefono": "texto", "email": "texto"},
+        "obligatorias": ["nombre"],
+        "actualiza": ["telefono", "email"],
+    },
+    "Clientes": {
+        "tabla": "clientes", "id": "id_cliente", "clave": "razon_social",
+        "columnas": {"razon_social": "texto", "direccion": "texto", "telefono": "texto"},
+        "obligatorias": ["razon_social"],
+        "actualiza": ["direccion", "telefono"],
+    },
+    # costo y stock_inicial solo se usan en el alta: en un producto existente
+    # el costo promedio lo mueven las compras y el stock los movimientos
+    "Productos": {
+        "tabla": "productos", "id": "id_producto", "clave": "nombre",
+        "columnas": {"nombre": "texto", "marca": "texto", "precio_venta": "importe", "costo": "importe",
+                     "stock_inicial": "entero", "unidades_por_caja": "entero", "stock_minimo": "entero"},
+        "obligatorias": ["nombre", "marca", "precio_venta"],
+        "actualiza": ["precio_venta", "unidades_por_caja", "stock_minimo"],
+    },
+}
+
+_TIPOS_SQL = {"texto": "text", "importe": "numeric", "entero": "integer"}
+
+ACCIONES = {"alta": "➕ Alta", "cambio": "✏️ Cambia", "igual": "＝ Sin cambios"}
+
+
+def plantilla(entidad):
+    """CSV vacío con los encabezados esperados"""
+    return (",".join(ENTIDADES[entidad]["columnas"]) + "\n").encode("utf-8-sig")
+
+
+def leer_archivo(archivo, nombre):
+    """DataFrame (todo como texto) a partir de un CSV o XLSX subido"""
+    if nombre.lower().endswith((".xlsx", ".xls")):
+        try:
+            df = pd.read_excel(archivo, dtype=str)
+        except ImportError:
+            raise RuntimeError("Para leer Excel hace falta instalar openpyxl (pip install openpyxl).")
+    else:
+        # sep=None detecta ',' o ';' (el CSV de Excel en castellano usa ';')
+        df = pd.read_csv(archivo, dtype=str, sep=None, engine="python", encoding="utf-8-sig")
+    df.columns = [str(c).strip().lower().replace(" ", "_") for c in df.columns]
+    return df
+
+
+def _a_numero(serie):
+    # Acepta "1.234,50" y "$ 1234.5": si hay coma, el punto es de miles
+    s = serie.str.replace("$", "", regex=False).str.strip()
+    con_coma = s.str.contains(",", na=False)
+    s = s.where(~con_coma, s.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+    return pd.to_numeric(s, errors="coerce")
+
+
+def validar(entidad, df):
+    """(filas limpias, errores). Las celdas vacías quedan en None: en el alta toman
+    el valor por defecto y en una actualización conservan el valor actual"""
+    esp = ENTIDADES[entidad]
+    errores = []
+    faltan = [c for c in esp["obligatorias"] if c not in df.columns]
+    if faltan:
+        errores.append({"Fila": None, "Columna": ", ".join(faltan), "Problema": "Falta la columna en el archivo"})
+        return None, pd.DataFrame(errores)
+
+    limpio = pd.DataFrame({"fila": df.index + 2})  # +2: encabezado y base 1, como en la planilla
+    for col, tipo in esp["columnas"].items():
+        crudo = df[col].fillna("").astype(str).str.strip() if col in df.columns else pd.Series("", index=df.index)
+        vacio = crudo == ""
+        if tipo == "texto":
+            valores = crudo.where(~vacio, None)
+        else:
+            valores = _a_numero(crudo.where(~vacio, None))
+            invalido = valores.isna() & ~vacio
+            if tipo == "entero":
+                invalido |= valores.notna() & (valores % 1 != 0)
+            minimo = 1 if col == "unidades_por_caja" else 0
+            invalido |= valores < minimo
+            for fila in limpio["fila"][invalido]:
+                errores.append({"Fila": fila, "Columna": col,
+                                "Problema": f"Valor inválido: {'entero' if tipo == 'entero' else 'número'} >= {minimo}"})
+            valores = valores.where(~invalido)
+            if tipo == "entero":
+                valores = valores.astype("Int64")
+        if col in esp["obligatorias"]:
+            for fila in limpio["fila"][vacio]:
+                errores.append({"Fila": fila, "Columna": col, "Problema": "Dato obligatorio vacío"})
+        limpio[col] = valores.values
+
+    if entidad == "Productos":
+        for fila in limpio["fila"][limpio["precio_venta"] == 0]:
+            errores.append({"Fila": fila, "Columna": "precio_venta", "Problema": "El precio está en $0"})
+        claves = limpio["nombre"].str.lower() + "|" + limpio["marca"].str.lower()
+    else:
+        claves = limpio[esp["clave"]].str.lower()
+    for fila in limpio["fila"][claves.notna() & claves.duplicated(keep="first")]:
+        errores.append({"Fila": fila, "Columna": esp["clave"], "Problema": "Repetido dentro del archivo"})
+
+    return limpio, pd.DataFrame(errores, columns=["Fila", "Columna", "Problema"])
+
+
+def _copiar(conn, entidad, limpio):
+    """Crea stg_<tabla> y la llena con COPY (una sola ida y vuelta para todo el archivo)"""
+    esp = ENTIDADES[entidad]
+    staging = f"stg_{esp['tabla']}"
+    columnas = list(esp["columnas"])
+    definicion = ", ".join(f"{c} {_TIPOS_SQL[t]}" for c, t in esp["columnas"].items())
+    conn.execute(text(f"CREATE TEMP TABLE {staging} (fila integer, {definicion}) ON COMMIT DROP"))
+    buffer = io.StringIO()
+    limpio[["fila"] + columnas].to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    with conn.connection.cursor() as cur:
+        # En FORMAT csv el campo vacío sin comillas es NULL
+        cur.copy_expert(f"COPY {staging} (fila, {', '.join(columnas)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    return staging
+
+
+def _existentes(esp):
+    # Si ya hay nombres repetidos en la base se toma el de id más bajo
+    return f"""
+        SELECT DISTINCT ON (lower(btrim({esp['clave']}))) *, lower(btrim({esp['clave']})) AS k
+        FROM {esp['tabla']}
+        ORDER BY lower(btrim({esp['clave']})), {esp['id']}
+    """
+
+
+_MARCAS = """
+    SELECT DISTINCT ON (lower(btrim(nombre))) id_marca, lower(btrim(nombre)) AS k
+    FROM marcas
+    ORDER BY lower(btrim(nombre)), id_marca
+"""
+
+_PRODUCTOS = """
+    SELECT DISTINCT ON (lower(btrim(nombre)), id_marca) *, lower(btrim(nombre)) AS k
+    FROM productos
+    ORDER BY lower(btrim(nombre)), id_marca, id_producto
+"""
+
+
+def _cruce(entidad, staging):
+    """CTEs e (existentes) y r (cada fila del archivo con el id existente, o NULL)"""
+    esp = ENTIDADES[entidad]
+    if entidad == "Productos":
+        return f"""
+            m AS ({_MARCAS}),
+            e AS ({_PRODUCTOS}),
+            r AS (
+                SELECT s.*, m.id_marca, e.id_producto AS id_existente
+                FROM {staging} s
+                LEFT JOIN m ON m.k = lower(s.marca)
+                LEFT JOIN e ON e.k = lower(s.nombre) AND e.id_marca = m.id_marca
+            )
+        """
+    return f"""
+        e AS ({_existentes(esp)}),
+        r AS (
+            SELECT s.*, e.{esp['id']} AS id_existente
+            FROM {staging} s
+            LEFT JOIN e ON e.k = lower(s.{esp['clave']})
+        )
+    """
+
+
+def _distinto(cols, nuevo, actual):
+    """Condición 'algún campo cambia' (celda vacía = conserva el actual)"""
+    if not cols:
+        return "FALSE"
+    nuevos = ", ".join(f"COALESCE({nuevo}.{c}, {actual}.{c})" for c in cols)
+    actuales = ", ".join(f"{actual}.{c}" for c in cols)
+    return f"ROW({nuevos}) IS DISTINCT FROM ROW({actuales})"
+
+
+def previsualizar(engine, entidad, limpio):
+    """Diff de prueba: qué fila da de alta, cuál cambia y qué campos. No escribe nada"""
+    esp = ENTIDADES[entidad]
+    cols = esp["actualiza"]
+    detalle = ", ".join(
+        f"CASE WHEN r.{c} IS NOT NULL AND r.{c} IS DISTINCT FROM e.{c} "
+        f"THEN format('%s: %s → %s', '{c}', COALESCE(e.{c}::text, '—'), r.{c}) END"
+        for c in cols
+    ) or "NULL"
+    extra = ""
+    if entidad == "Productos":
+        extra = """,
+            r.marca AS "Marca",
+            r.id_marca IS NULL AS "Marca Nueva",
+            CASE WHEN r.id_existente IS NULL THEN COALESCE(r.stock_inicial, 0) END AS "Stock Inicial"
+        """
+    with engine.connect() as conn, rendimiento.etiqueta(f"importar {entidad} (prueba)"):
+        tx = conn.begin()
+        try:
+            staging = _copiar(conn, entidad, limpio)
+            diff = pd.read_sql(text(f"""
+                WITH {_cruce(entidad, staging)}
+                SELECT r.fila AS "Fila", r.{esp['clave']} AS "Nombre"{extra},
+                       CASE WHEN r.id_existente IS NULL THEN 'alta'
+                            WHEN {_distinto(cols, 'r', 'e')} THEN 'cambio'
+                            ELSE 'igual' END AS "Acción",
+                       concat_ws(' | ', {detalle}) AS "Detalle"
+                FROM r
+                LEFT JOIN e ON e.{esp['id']} = r.id_existente
+                ORDER BY r.fila
+            """), conn)
+        finally:
+            tx.rollback()
+    diff["Acción"] = diff["Acción"].map(ACCIONES)
+    return diff
+
+
+def _aplicar_maestro(conn, entidad, staging):
+    esp = ENTIDADES[entidad]
+    cols = esp["actualiza"]
+    insertar = [esp["clave"]] + cols
+    cambios = "SELECT 1 WHERE FALSE"
+    if cols:
+        cambios = f"""
+            UPDATE {esp['tabla']} t
+            SET {', '.join(f'{c} = COALESCE(r.{c}, t.{c})' for c in cols)}
+            FROM r
+            WHERE t.{esp['id']} = r.id_existente AND {_distinto(cols, 'r', 't')}
+            RETURNING t.{esp['id']}
+        """
+    fila = conn.execute(text(f"""
+        WITH {_cruce(entidad, staging)},
+        cambios AS ({cambios}),
+        altas AS (
+            INSERT INTO {esp['tabla']} ({', '.join(insertar)})
+            SELECT {', '.join(insertar)} FROM r WHERE r.id_existente IS NULL ORDER BY r.fila
+            RETURNING {esp['id']}
+        )
+        SELECT (SELECT COUNT(*) FROM altas) AS altas, (SELECT COUNT(*) FROM cambios) AS cambios
+    """)).mappings().one()
+    return {"altas": fila["altas"], "cambios": fila["cambios"]}
+
+
+def _aplicar_productos(conn, staging):
+    # 1. Marcas que no existen (una por nombre, con la grafía de la primera fila)
+    marcas_nuevas = conn.execute(text(f"""
+        INSERT INTO marcas (nombre)
+        SELECT DISTINCT ON (lower(s.marca)) s.marca
+        FROM {staging} s
+        WHERE NOT EXISTS (SELECT 1 FROM marcas m WHERE lower(btrim(m.nombre)) = lower(s.marca))
+        ORDER BY lower(s.marca), s.fila
+        RETURNING id_marca
+    """)).rowcount
+
+    # 2. Cambios + historial de precios + altas + movimientos de stock inicial
+    cols = ENTIDADES["Productos"]["actualiza"]
+    fila = conn.execute(text(f"""
+        WITH {_cruce('Productos', staging)},
+        cambios AS (
+            UPDATE productos p
+            SET precio_venta      = COALESCE(r.precio_venta, p.precio_venta),
+                unidades_por_caja = COALESCE(r.unidades_por_caja, p.unidades_por_caja),
+                stock_minimo      = COALESCE(r.stock_minimo, p.stock_minimo),
+                precio_venta_caja = COALESCE(r.precio_venta, p.precio_venta)
+                                    * COALESCE(r.unidades_por_caja, p.unidades_por_caja)
+            FROM r
+            WHERE p.id_producto = r.id_existente AND {_distinto(cols, 'r', 'p')}
+            RETURNING p.id_producto
+        ),
+        historial AS (
+            INSERT INTO historial_precios (id_producto, precio_anterior, precio_nuevo)
+            SELECT r.id_existente, e.precio_venta, r.precio_venta
+            FROM r
+            JOIN e ON e.id_producto = r.id_existente
+            WHERE r.precio_venta IS DISTINCT FROM e.precio_venta
+            RETURNING 1
+        ),
+        altas AS (
+            INSERT INTO productos (nombre, id_marca, precio_venta, precio_venta_caja, precio_costo_promedio,
+                                   stock_actual, unidades_por_caja, stock_minimo)
+            SELECT r.nombre, r.id_marca, r.precio_venta,
+                   r.precio_venta * COALESCE(r.unidades_por_caja, 1),
+                   COALESCE(r.costo, 0), COALESCE(r.stock_inicial, 0),
+                   COALESCE(r.unidades_por_caja, 1), COALESCE(r.stock_minimo, 0)
+            FROM r
+            WHERE r.id_existente IS NULL
+            ORDER BY r.fila
+            RETURNING id_producto, stock_actual
+        ),
+        movimientos AS (
+            INSERT INTO inventario_movimientos (id_producto, tipo, cantidad, fecha)
+            SELECT id_producto, 'STOCK_INICIAL', stock_actual, NOW()
+            FROM altas
+            WHERE stock_actual > 0
+            RETURNING 1
+        )
+        SELECT (SELECT COUNT(*) FROM altas) AS altas,
+               (SELECT COUNT(*) FROM cambios) AS cambios,
+               (SELECT COUNT(*) FROM historial) AS precios,
+               (SELECT COUNT(*) FROM movimientos) AS movimientos
+    """)).mappings().one()
+    return {"marcas_nuevas": marcas_nuevas, **fila}
+
+
+def aplicar(engine, entidad, limpio):
+    """Upsert de todo el archivo en una transacción. Retorna los conteos por tipo de cambio"""
+    with engine.begin() as conn, rendimiento.etiqueta(f"importar {entidad}"):
+        # Dos importaciones a la vez podrían dar de alta el mismo nombre dos veces
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('galpon_importar_maestros'))"))
+        staging = _copiar(conn, entidad, limpio)
+        if entidad == "Productos":
+            return _aplicar_productos(conn, staging)
+        return _aplicar_maestro(conn, entidad, staging)
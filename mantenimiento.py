@@ -0,0 +1,157 @@
+"""
+Comandos de mantenimiento de la base (se corren a mano, fuera de Streamlit).
+
+Uso:
+    python mantenimiento.py migrar [--hasta N]
+    python mantenimiento.py estado-migraciones
+    python mantenimiento.py verificar-planes
+    python mantenimiento.py backfill-ventas [--desde 2024-01-01]
+    python mantenimiento.py checkpoint-stock
+    python mantenimiento.py liberar-reservas
+    python mantenimiento.py recalcular-costos [--compras 120 121]
+    python mantenimiento.py exportar "Ventas (detalle)" 2025-01-01 2025-12-31 ventas_2025.parquet
+
+Lee la conexión de .streamlit/secrets.toml, igual que la app.
+"""
+import argparse
+import tomllib
+from pathlib import Path
+
+from sqlalchemy import text
+
+import conexion
+import exportar
+import migraciones
+import reservas
+
+RAIZ = Path(__file__).resolve().parent
+
+
+def engine_desde_secrets(ruta=RAIZ / ".streamlit" / "secrets.toml"):
+    """Crea el engine con la sección [postgres] de los secrets de Streamlit"""
+    with open(ruta, "rb") as f:
+        c = tomllib.load(f)["postgres"]
+    # Los comandos de mantenimiento pueden tardar: sin statement_timeout
+    return conexion.crear_engine({**c, "statement_timeout_ms": 0, "application_name": "el-galpon-mantenimiento"})
+
+
+def backfill_ventas(engine, desde=None):
+    """Recalcula el resumen diario y el cubo desde detalle_ventas. Retorna las filas del resumen"""
+    filtro = "WHERE v.fecha >= :desde" if desde else ""
+    filtro_resumen = "WHERE fecha >= :desde" if desde else ""
+    params = {"desde": desde} if desde else {}
+    with engine.begin() as conn:
+        # Bloqueamos altas/bajas de ventas mientras recalculamos, así los
+        # triggers no suman sobre filas que estamos por reemplazar
+        conn.execute(text("LOCK TABLE detalle_ventas IN SHARE MODE"))
+        conn.execute(text(f"DELETE FROM ventas_cubo {filtro_resumen}"), params)
+        conn.execute(text(f"""
+            INSERT INTO ventas_cubo (fecha, id_producto, id_cliente, unidades_reales, ingresos, costo, lineas)
+            SELECT v.fecha::date,
+                   dv.id_producto,
+                   v.id_cliente,
+                   SUM(dv.unidades_reales),
+                   SUM(dv.unidades_reales * dv.precio_unitario_historico),
+                   SUM(dv.unidades_reales * dv.costo_unitario),
+                   COUNT(*)
+            FROM detalle_ventas dv
+            JOIN ventas v ON dv.id_venta = v.id_venta
+            {filtro}
+            GROUP BY v.fecha::date, dv.id_producto, v.id_cliente
+        """), params)
+        conn.execute(text(f"DELETE FROM ventas_diarias_producto {filtro_resumen}"), params)
+        res = conn.execute(text(f"""
+            INSERT INTO ventas_diarias_producto (fecha, id_producto, unidades_reales, ingresos, costo)
+            SELECT v.fecha::date,
+                   dv.id_producto,
+                   SUM(dv.unidades_reales),
+                   SUM(dv.unidades_reales * dv.precio_unitario_historico),
+                   SUM(dv.unidades_reales * dv.costo_unitario)
+            FROM detalle_ventas dv
+            JOIN ventas v ON dv.id_venta = v.id_venta
+            {filtro}
+            GROUP BY v.fecha::date, dv.id_producto
+        """), params)
+        return res.rowcount
+
+
+def recalcular_costos(engine, compras=None):
+    """Vuelve a prorratear el flete y rearma el costo promedio. Retorna (líneas, productos) cambiados"""
+    with engine.begin() as conn:
+        # Las compras nuevas esperan: el promedio se rearma sobre un historial quieto
+        conn.execute(text("LOCK TABLE detalle_compras IN SHARE MODE"))
+        lineas = conn.execute(text("SELECT fn_prorratear_flete(CAST(:compras AS int[]))"),
+                              {"compras": compras or None}).scalar()
+        productos = conn.execute(text("SELECT fn_recalcular_costo_promedio()")).scalar()
+    return lineas, productos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_migrar = sub.add_parser("migrar", help="aplica las migraciones pendientes de sql/")
+    p_migrar.add_argument("--hasta", type=int, help="última versión a aplicar")
+
+    sub.add_parser("estado-migraciones", help="lista las migraciones y si están aplicadas")
+    sub.add_parser("verificar-planes", help="EXPLAIN de las consultas de la app; marca los Seq Scan")
+
+    p_backfill = sub.add_parser("backfill-ventas", help="recalcula ventas_diarias_producto y ventas_cubo desde el detalle")
+    p_backfill.add_argument("--desde", help="fecha YYYY-MM-DD (por defecto, todo el historial)")
+
+    sub.add_parser("checkpoint-stock", help="avanza los checkpoints de stock de la Auditoría Profunda (para cron)")
+    sub.add_parser("liberar-reservas", help="borra las reservas de stock vencidas de carritos abandonados (para cron)")
+
+    p_costos = sub.add_parser("recalcular-costos",
+                              help="reprorratea el flete y rearma el costo promedio de todos los productos")
+    p_costos.add_argument("--compras", type=int, nargs="+",
+                          help="N° de compra corregidos (por defecto se reprorratean todas)")
+
+    p_exportar = sub.add_parser("exportar", help="exporta un rango a CSV/Excel/Parquet (según la extensión)")
+    p_exportar.add_argument("conjunto", choices=list(exportar.CONJUNTOS))
+    p_exportar.add_argument("desde", help="fecha YYYY-MM-DD")
+    p_exportar.add_argument("hasta", help="fecha YYYY-MM-DD (inclusive)")
+    p_exportar.add_argument("archivo", help="ruta de salida: .csv, .xlsx o .parquet")
+
+    args = parser.parse_args()
+    engine = engine_desde_secrets()
+
+    if args.comando == "migrar":
+        nuevas = migraciones.migrar(engine, args.hasta)
+        for version, nombre, avisos in nuevas:
+            print(f"✅ {version:03d} {nombre}")
+            for aviso in avisos:
+                print(f"   ⚠️ {aviso}")
+        print(f"{len(nuevas)} migraciones aplicadas.")
+    elif args.comando == "estado-migraciones":
+        aplicadas = migraciones.versiones_aplicadas(engine)
+        for version, nombre, _ in migraciones.listar_migraciones():
+            print(f"{'✅' if version in aplicadas else '⏳'} {version:03d} {nombre}")
+    elif args.comando == "verificar-planes":
+        hallazgos = migraciones.verificar_planes(engine)
+        for consulta, tabla, filas in hallazgos:
+            print(f"⚠️ {consulta}: Seq Scan sobre {tabla} (~{filas} filas estimadas)")
+        print("✅ Sin Seq Scan en tablas grandes." if not hallazgos else f"{len(hallazgos)} Seq Scan encontrados.")
+        raise SystemExit(1 if hallazgos else 0)
+    elif args.comando == "backfill-ventas":
+        filas = backfill_ventas(engine, args.desde)
+        print(f"✅ Resumen y cubo recalculados: {filas} filas (día x producto).")
+    elif args.comando == "checkpoint-stock":
+        with engine.begin() as conn:
+            hasta = conn.execute(text("SELECT fn_avanzar_checkpoint_stock()")).scalar()
+        print(f"✅ Checkpoint de stock hasta el movimiento N° {hasta or 0}.")
+    elif args.comando == "liberar-reservas":
+        print(f"✅ {reservas.liberar_vencidas(engine)} reservas vencidas borradas.")
+    elif args.comando == "recalcular-costos":
+        lineas, productos = recalcular_costos(engine, args.compras)
+        print(f"✅ {lineas} líneas de compra reprorrateadas, {productos} costos promedio actualizados.")
+    elif args.comando == "exportar":
+        formato = {ext: nombre for nombre, ext in exportar.FORMATOS.items()}.get(Path(args.archivo).suffix.lower())
+        if formato is None:
+            parser.error("el archivo tiene que terminar en .csv, .xlsx o .parquet")
+        _, filas = exportar.exportar(engine, args.conjunto, args.desde, args.hasta, formato, args.archivo)
+        print(f"✅ {filas} filas exportadas a {args.archivo}.")
+
+
+if __name__ == "__main__":
+    main()
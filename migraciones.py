@@ -0,0 +1,160 @@
+"""
+Migraciones versionadas del esquema y verificación de planes de consulta.
+
+Cada archivo sql/NNN_nombre.sql es una migración; se aplican en orden de
+versión, cada una en su transacción, y quedan registradas en la tabla
+schema_migraciones para no repetirlas.
+"""
+import re
+from pathlib import Path
+
+from sqlalchemy import text
+
+CARPETA_SQL = Path(__file__).resolve().parent / "sql"
+
+
+def listar_migraciones(carpeta=CARPETA_SQL):
+    """[(version, nombre, ruta)] ordenadas por versión"""
+    migraciones = []
+    for ruta in carpeta.glob("*.sql"):
+        m = re.match(r"(\d+)_(.+)\.sql$", ruta.name)
+        if m:
+            migraciones.append((int(m.group(1)), m.group(2), ruta))
+    return sorted(migraciones)
+
+
+def ejecutar_archivo_sql(conn, ruta):
+    """Corre un .sql completo (varios statements, funciones plpgsql) tal cual.
+    Retorna los RAISE NOTICE que dejó (ej: triggers reemplazados)"""
+    dbapi = conn.connection.dbapi_connection
+    del dbapi.notices[:]
+    with dbapi.cursor() as cur:
+        cur.execute(Path(ruta).read_text(encoding="utf-8"))
+    return [aviso.strip().removeprefix("NOTICE:").strip() for aviso in dbapi.notices]
+
+
+def _crear_tabla_control(conn):
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migraciones (
+            version  integer PRIMARY KEY,
+            nombre   text NOT NULL,
+            aplicada timestamptz NOT NULL DEFAULT NOW()
+        )
+    """))
+
+
+def versiones_aplicadas(engine):
+    """Versiones ya registradas en schema_migraciones"""
+    with engine.begin() as conn:
+        _crear_tabla_control(conn)
+        return {fila[0] for fila in conn.execute(text("SELECT version FROM schema_migraciones"))}
+
+
+def migrar(engine, hasta=None):
+    """Aplica las migraciones pendientes (hasta la versión indicada).
+    Retorna las aplicadas: [(version, nombre, avisos)]"""
+    aplicadas = versiones_aplicadas(engine)
+    nuevas = []
+    for version, nombre, ruta in listar_migraciones():
+        if version in aplicadas or (hasta is not None and version > hasta):
+            continue
+        with engine.begin() as conn:
+            avisos = ejecutar_archivo_sql(conn, ruta)
+            conn.execute(
+                text("INSERT INTO schema_migraciones (version, nombre) VALUES (:v, :n)"),
+                {"v": version, "n": nombre}
+            )
+        nuevas.append((version, nombre, avisos))
+    return nuevas
+
+
+# --- VERIFICACIÓN DE PLANES ---
+# Las consultas calientes de la app, con parámetros representativos. Si se
+# cambia una consulta en app_claude.py, actualizarla también acá.
+CONSULTAS_APP = {
+    "obtener_kpis": ("""
+        SELECT SUM(ingresos), SUM(costo) FROM ventas_diarias_producto
+        WHERE fecha >= CURRENT_DATE - 30
+    """, {}),
+    "productos_criticos": ("""
+        SELECT COUNT(*) FROM productos WHERE stock_actual <= stock_minimo
+    """, {}),
+    "query_master": ("""
+        SELECT id_producto, SUM(unidades_reales) FROM ventas_diarias_producto
+        WHERE fecha >= CURRENT_DATE - 30 GROUP BY id_producto
+    """, {}),
+    "query_hist_v": ("""
+        WITH pagina AS (
+            SELECT v.id_venta, v.fecha FROM ventas v
+            WHERE v.fecha >= CURRENT_DATE - 30 AND v.fecha < CURRENT_DATE + 1
+            ORDER BY v.fecha DESC, v.id_venta DESC LIMIT 51
+        )
+        SELECT * FROM pagina v JOIN detalle_ventas dv ON v.id_venta = dv.id_venta
+    """, {}),
+    "query_hist_v_cliente": ("""
+        SELECT v.id_venta FROM ventas v
+        WHERE v.id_cliente = 1 AND v.fecha >= CURRENT_DATE - 30 AND v.fecha < CURRENT_DATE + 1
+        ORDER BY v.fecha DESC, v.id_venta DESC LIMIT 51
+    """, {}),
+    "query_hist_c": ("""
+        WITH pagina AS (
+            SELECT comp.id_compra, comp.fecha FROM compras comp
+            WHERE comp.fecha >= CURRENT_DATE - 90 AND comp.fecha < CURRENT_DATE + 1
+            ORDER BY comp.fecha DESC, comp.id_compra DESC LIMIT 51
+        )
+        SELECT * FROM pagina comp JOIN detalle_compras dc ON comp.id_compra = dc.id_compra
+    """, {}),
+    "query_audit": ("""
+        SELECT im.id_movimiento FROM inventario_movimientos im
+        WHERE im.fecha >= CURRENT_DATE - 365 AND im.fecha < CURRENT_DATE + 1
+        ORDER BY im.fecha DESC, im.id_movimiento DESC LIMIT 251
+    """, {}),
+    "auditoria_profunda": ("""
+        SELECT im.id_producto, SUM(im.cantidad) FROM inventario_movimientos im
+        WHERE im.transaccion >= (SELECT COALESCE(MIN(transaccion_hasta), '0') FROM stock_checkpoints)
+        GROUP BY im.id_producto
+    """, {}),
+    "query_estado_conc": ("""
+        SELECT dc.id_producto, dc.cantidad FROM detalle_concesiones dc
+        JOIN concesiones conc ON dc.id_concesion = conc.id_concesion
+        WHERE conc.estado = 'ACTIVA'
+    """, {}),
+    "query_items_cli": ("""
+        SELECT dc.id_detalle FROM detalle_concesiones dc
+        JOIN concesiones c ON dc.id_concesion = c.id_concesion
+        WHERE c.id_cliente = 1 AND c.estado = 'ACTIVA'
+    """, {}),
+    "cubo_producto": ("""
+        SELECT c.id_producto, SUM(c.ingresos) FROM ventas_cubo c
+        WHERE c.fecha BETWEEN CURRENT_DATE - 30 AND CURRENT_DATE GROUP BY c.id_producto
+    """, {}),
+    "cubo_cliente": ("""
+        SELECT c.id_producto, SUM(c.ingresos) FROM ventas_cubo c
+        WHERE c.id_cliente = 1 AND c.fecha BETWEEN CURRENT_DATE - 365 AND CURRENT_DATE GROUP BY c.id_producto
+    """, {}),
+    "cubo_operaciones": ("""
+        SELECT COUNT(*) FROM ventas WHERE fecha >= CURRENT_DATE - 30 AND fecha < CURRENT_DATE + 1
+    """, {}),
+}
+
+# Tablas maestras chicas: un Seq Scan ahí es lo más barato y no se marca
+TABLAS_CHICAS = {"marcas", "clientes", "proveedores", "schema_migraciones"}
+
+
+def _nodos(plan):
+    yield plan
+    for hijo in plan.get("Plans", []):
+        yield from _nodos(hijo)
+
+
+def verificar_planes(engine, consultas=None):
+    """EXPLAIN de cada consulta de la app. Retorna [(consulta, tabla, filas estimadas)] con Seq Scan"""
+    consultas = consultas or CONSULTAS_APP
+    hallazgos = []
+    with engine.connect() as conn:
+        for nombre, (sql, params) in consultas.items():
+            plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"), params).scalar()[0]["Plan"]
+            for nodo in _nodos(plan):
+                if nodo["Node Type"] == "Seq Scan" and nodo.get("Relation Name") not in TABLAS_CHICAS:
+                    hallazgos.append((nombre, nodo.get("Relation Name"), nodo.get("Plan Rows")))
+    return hallazgos
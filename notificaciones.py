@@ -0,0 +1,101 @@
+"""
+Invalidación de cache entre sesiones con LISTEN/NOTIFY de Postgres.
+
+Los triggers de sql/005_notificaciones.sql avisan por el canal
+'galpon_cambios' qué tabla (y qué ids) cambió. Un hilo por proceso de
+Streamlit escucha el canal con una conexión propia (fuera del pool) y limpia
+solo los caches de esa tabla vía catalogo.invalidar(): si otra sesión vende,
+la próxima ejecución de cada sesión ya ve el stock nuevo, sin esperar el TTL
+y sin tirar todo el cache.
+"""
+import json
+import select
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import catalogo
+
+CANAL = "galpon_cambios"
+ESPERA_RECONEXION = 5  # segundos entre reintentos si se cae la conexión
+ESPERA_AVISOS = 60     # sin avisos en este tiempo se prueba la conexión
+
+_lock = threading.Lock()
+_estado = {"hilo": None, "conectado": False, "recibidos": 0, "error": None}
+_ultimos = deque(maxlen=50)
+
+
+def procesar(payload):
+    """Aplica un aviso: invalida los caches de la tabla que cambió"""
+    aviso = json.loads(payload)
+    tabla = aviso.get("tabla")
+    if tabla in catalogo.tablas_cacheadas():
+        catalogo.invalidar(tabla)
+    with _lock:
+        _estado["recibidos"] += 1
+        _ultimos.append({
+            "momento": datetime.now().isoformat(timespec="seconds"),
+            "tabla": tabla,
+            "ids": aviso.get("ids"),
+        })
+
+
+def _escuchar(engine):
+    while True:
+        conn = None
+        try:
+            # Conexión dedicada: se saca del pool para no ocupar un lugar
+            conn = engine.raw_connection()
+            conn.detach()
+            dbapi = conn.dbapi_connection
+            dbapi.autocommit = True
+            with dbapi.cursor() as cur:
+                cur.execute(f"LISTEN {CANAL}")
+            with _lock:
+                _estado.update(conectado=True, error=None)
+            # Lo que cambió mientras no escuchábamos se perdió: limpiamos todo una vez
+            for tabla in catalogo.tablas_cacheadas():
+                catalogo.invalidar(tabla)
+
+            while True:
+                if select.select([dbapi], [], [], ESPERA_AVISOS) == ([], [], []):
+                    # Sin avisos: comprobamos que la conexión siga viva. Si se
+                    # cayó en silencio esto falla y se reconecta (con LISTEN)
+                    # (los avisos que lleguen con la respuesta se procesan abajo)
+                    with dbapi.cursor() as cur:
+                        cur.execute("SELECT 1")
+                else:
+                    dbapi.poll()
+                while dbapi.notifies:
+                    procesar(dbapi.notifies.pop(0).payload)
+        except Exception as e:
+            with _lock:
+                _estado.update(conectado=False, error=str(e))
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            time.sleep(ESPERA_RECONEXION)
+
+
+def iniciar(engine):
+    """Arranca el hilo que escucha los avisos (uno por proceso)"""
+    with _lock:
+        if _estado["hilo"] is not None:
+            return
+        hilo = threading.Thread(target=_escuchar, args=(engine,), name="escucha-notify", daemon=True)
+        _estado["hilo"] = hilo
+    hilo.start()
+
+
+def estado():
+    """Copia del estado del hilo y los últimos avisos (para el panel lateral)"""
+    with _lock:
+        return {
+            "conectado": _estado["conectado"],
+            "recibidos": _estado["recibidos"],
+            "error": _estado["error"],
+            "ultimos": list(_ultimos),
+        }
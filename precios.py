@@ -0,0 +1,117 @@
+"""
+Remarcación masiva de precios de venta.
+
+La regla (porcentaje, monto fijo o costo + margen, con redondeo) está dos
+veces y tiene que dar lo mismo: en pandas para la vista previa sobre el
+catálogo cacheado, y en SQL para grabar. Al grabar se recalcula sobre el
+precio vigente en la base (no sobre el cache), en un solo statement que
+actualiza productos, recalcula precio_venta_caja y deja el historial.
+"""
+import numpy as np
+import pandas as pd
+import streamlit as st
+from sqlalchemy import text
+
+import catalogo
+import rendimiento
+
+MODOS = {
+    "Porcentaje (%)": "porcentaje",
+    "Monto fijo ($)": "fijo",
+    "Costo + margen (%)": "margen",
+}
+
+REDONDEOS = [0.01, 1, 10, 50, 100]
+
+# Margen sobre el precio de venta, igual que 'Margen %' del tablero:
+# precio = costo / (1 - margen/100)
+_NUEVO_SQL = """
+    GREATEST(ROUND(
+        CASE CAST(:modo AS text)
+            WHEN 'porcentaje' THEN p.precio_venta * (1 + CAST(:valor AS numeric) / 100)
+            WHEN 'fijo'       THEN p.precio_venta + CAST(:valor AS numeric)
+            WHEN 'margen'     THEN p.precio_costo_promedio / (1 - CAST(:valor AS numeric) / 100)
+        END / CAST(:paso AS numeric)
+    ) * CAST(:paso AS numeric), 0)
+"""
+
+
+@st.cache_data(ttl=catalogo.TTL_MAESTROS, show_spinner=False)
+def productos_de_proveedor(_engine, id_proveedor):
+    """Ids de los productos que alguna vez se le compraron al proveedor"""
+    with _engine.connect() as conn:
+        return set(conn.execute(text("""
+            SELECT DISTINCT dc.id_producto
+            FROM detalle_compras dc
+            JOIN compras c ON c.id_compra = dc.id_compra
+            WHERE c.id_proveedor = :prov
+        """), {"prov": id_proveedor}).scalars())
+
+
+def validar_regla(modo, valor):
+    """Mensaje de error o None"""
+    if modo == "margen" and not 0 <= valor < 100:
+        return "El margen tiene que estar entre 0% y 99%."
+    if modo == "porcentaje" and valor <= -100:
+        return "Un descuento de 100% o más deja el precio en cero."
+    return None
+
+
+def previsualizar(df, modo, valor, paso):
+    """Precio y margen actuales vs. nuevos, vectorizado sobre el catálogo filtrado"""
+    precio = df["precio_venta"].astype(float).to_numpy()
+    costo = df["precio_costo_promedio"].astype(float).to_numpy()
+    if modo == "porcentaje":
+        nuevo = precio * (1 + valor / 100)
+    elif modo == "fijo":
+        nuevo = precio + valor
+    else:
+        nuevo = costo / (1 - valor / 100)
+    # ROUND de Postgres redondea .5 hacia arriba (np.round iría al par)
+    nuevo = np.maximum(np.floor(nuevo / paso + 0.5) * paso, 0).round(2)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        margen_actual = np.where(precio != 0, (precio - costo) / precio * 100, np.nan)
+        margen_nuevo = np.where(nuevo != 0, (nuevo - costo) / nuevo * 100, np.nan)
+        variacion = np.where(precio != 0, (nuevo - precio) / precio * 100, np.nan)
+    return pd.DataFrame({
+        "id_producto": df["id_producto"].to_numpy(),
+        "Producto": df["nombre"].to_numpy(),
+        "Marca": df["marca"].to_numpy(),
+        "Costo": costo,
+        "Precio Actual": precio,
+        "Precio Nuevo": nuevo,
+        "Variación %": variacion.round(1),
+        "Margen Actual %": margen_actual.round(1),
+        "Margen Nuevo %": margen_nuevo.round(1),
+        "Caja Nueva": nuevo * df["unidades_por_caja"].to_numpy(),
+    })
+
+
+def aplicar(engine, ids, modo, valor, paso):
+    """Remarca los productos en un statement. Retorna cuántos cambiaron de precio"""
+    with engine.begin() as conn, rendimiento.etiqueta("remarcar precios"):
+        return conn.execute(text(f"""
+            WITH objetivo AS (
+                SELECT p.id_producto, p.precio_venta AS anterior, {_NUEVO_SQL} AS nuevo
+                FROM productos p
+                WHERE p.id_producto = ANY(CAST(:ids AS int[]))
+                FOR UPDATE
+            ),
+            cambios AS (
+                UPDATE productos p
+                SET precio_venta      = o.nuevo,
+                    precio_venta_caja = o.nuevo * p.unidades_por_caja
+                FROM objetivo o
+                WHERE p.id_producto = o.id_producto
+                  AND o.nuevo <> o.anterior
+                RETURNING p.id_producto, o.anterior, o.nuevo
+            )
+            INSERT INTO historial_precios (id_producto, precio_anterior, precio_nuevo)
+            SELECT id_producto, anterior, nuevo FROM cambios
+        """), {"ids": [int(i) for i in ids], "modo": modo, "valor": valor, "paso": paso}).rowcount
+
+
+# Una compra mueve el stock de productos (y eso avisa): alcanza para
+# refrescar la lista de productos por proveedor
+catalogo.registrar(["productos"], productos_de_proveedor)
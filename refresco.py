@@ -0,0 +1,187 @@
+"""
+Cache del proceso con refresco en segundo plano (stale-while-revalidate).
+
+Para las consultas pesadas del Dashboard, Concesiones y Análisis: la
+primera lectura espera el resultado, y de ahí en más se devuelve al
+instante lo último calculado mientras un hilo lo recalcula cuando vence
+(intervalo de cada función) o cuando una escritura/aviso NOTIFY lo marca
+como vencido (catalogo.invalidar llama a .clear(), que NO borra: marca).
+
+Single-flight: si diez sesiones piden lo mismo a la vez corre UNA
+consulta y las diez esperan ese resultado. Un hilo programador mantiene
+tibias las entradas que alguien leyó en los últimos RETENER segundos; las
+que nadie mira dejan de refrescarse y se descartan.
+
+Lo que se devuelve es compartido entre sesiones: no modificarlo en el lugar.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+RETENER = 600          # segundos sin lecturas antes de descartar una entrada
+MAX_ENTRADAS = 64      # por función (rangos de fechas x filtros)
+CHEQUEO = 1.0          # cada cuánto mira el programador qué venció
+ESPERA_ERROR = 30      # tras un error, segundos antes de reintentar
+
+_ejecutor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="refresco")
+_lock = threading.RLock()
+_funciones = []
+_programador = {"hilo": None}
+
+
+class _Entrada:
+    __slots__ = ("argumentos", "valor", "calculado", "leido", "vencida", "futuro", "error", "reintento", "generacion")
+
+    def __init__(self, argumentos):
+        self.argumentos = argumentos
+        self.valor = None
+        self.calculado = None  # time.time() del último resultado bueno
+        self.leido = time.time()
+        self.vencida = False
+        self.futuro = None
+        self.error = None
+        self.reintento = 0
+        self.generacion = 0  # sube con cada clear(): un cálculo que arrancó antes no la deja al día
+
+
+def _clave(args, kwargs):
+    # El primer argumento es el engine: no forma parte de la clave
+    def congelar(x):
+        return tuple(x) if isinstance(x, (list, set)) else x
+    return tuple(congelar(a) for a in args[1:]), tuple(sorted((k, congelar(v)) for k, v in kwargs.items()))
+
+
+class Mantenido:
+    """Envuelve una función cargar(engine, ...) con cache de proceso y refresco en segundo plano"""
+
+    def __init__(self, funcion, intervalo, max_entradas=MAX_ENTRADAS):
+        self.funcion = funcion
+        self.intervalo = intervalo
+        self.max_entradas = max_entradas
+        self.entradas = OrderedDict()
+        self.__name__ = funcion.__name__
+        self.__doc__ = funcion.__doc__
+
+    def _calcular(self, clave, entrada, args, kwargs):
+        with _lock:
+            generacion = entrada.generacion
+        try:
+            valor = self.funcion(*args, **kwargs)
+        except Exception as e:
+            with _lock:
+                entrada.futuro = None
+                entrada.error = str(e)
+                entrada.reintento = time.time() + ESPERA_ERROR
+                if entrada.calculado is None:
+                    self.entradas.pop(clave, None)  # la próxima lectura reintenta
+            raise
+        with _lock:
+            entrada.valor, entrada.calculado = valor, time.time()
+            entrada.vencida = entrada.generacion != generacion
+            entrada.futuro, entrada.error = None, None
+        return valor
+
+    def _lanzar(self, clave, entrada, args, kwargs):
+        """Encola el recálculo si no hay uno en vuelo (llamar con _lock tomado)"""
+        if entrada.futuro is None:
+            entrada.futuro = _ejecutor.submit(self._calcular, clave, entrada, args, kwargs)
+        return entrada.futuro
+
+    def _vencida(self, entrada, ahora):
+        if ahora < entrada.reintento:
+            return False
+        return entrada.vencida or ahora - entrada.calculado > self.intervalo
+
+    def con_momento(self, *args, **kwargs):
+        """(valor, time.time() en que se calculó)"""
+        _iniciar_programador()
+        clave = _clave(args, kwargs)
+        ahora = time.time()
+        with _lock:
+            entrada = self.entradas.get(clave)
+            if entrada is None:
+                entrada = self.entradas[clave] = _Entrada((args, kwargs))
+                while len(self.entradas) > self.max_entradas:
+                    self.entradas.popitem(last=False)
+            self.entradas.move_to_end(clave)
+            entrada.leido = ahora
+            if entrada.calculado is None:
+                esperar = self._lanzar(clave, entrada, args, kwargs)
+            else:
+                if self._vencida(entrada, ahora):
+                    self._lanzar(clave, entrada, args, kwargs)
+                return entrada.valor, entrada.calculado
+        # Primera vez: todos los que llegaron juntos esperan la misma consulta
+        return esperar.result(), entrada.calculado
+
+    def __call__(self, *args, **kwargs):
+        return self.con_momento(*args, **kwargs)[0]
+
+    def estado(self, *args, **kwargs):
+        """(segundos desde el cálculo, se está recalculando, último error) o None"""
+        with _lock:
+            entrada = self.entradas.get(_clave(args, kwargs))
+            if entrada is None or entrada.calculado is None:
+                return None
+            return time.time() - entrada.calculado, entrada.futuro is not None, entrada.error
+
+    def clear(self):
+        """Marca todo como vencido: se sigue mostrando lo último hasta que llega lo nuevo"""
+        with _lock:
+            for entrada in self.entradas.values():
+                entrada.vencida = True
+                entrada.generacion += 1
+
+    def _mantener(self, ahora):
+        with _lock:
+            for clave, entrada in list(self.entradas.items()):
+                if ahora - entrada.leido > RETENER:
+                    if entrada.futuro is None:
+                        del self.entradas[clave]
+                elif entrada.calculado is not None and entrada.futuro is None and self._vencida(entrada, ahora):
+                    args, kwargs = entrada.argumentos
+                    self._lanzar(clave, entrada, args, kwargs)
+
+
+def mantener(intervalo):
+    """Decorador: @refresco.mantener(intervalo=60) sobre def cargar(_engine, ...)"""
+    def decorar(funcion):
+        mantenido = Mantenido(funcion, intervalo)
+        with _lock:
+            _funciones.append(mantenido)
+        return mantenido
+    return decorar
+
+
+def _bucle():
+    while True:
+        time.sleep(CHEQUEO)
+        ahora = time.time()
+        for mantenido in list(_funciones):
+            mantenido._mantener(ahora)
+
+
+def _iniciar_programador():
+    if _programador["hilo"] is not None:
+        return
+    with _lock:
+        if _programador["hilo"] is None:
+            hilo = threading.Thread(target=_bucle, name="refresco-programador", daemon=True)
+            _programador["hilo"] = hilo
+            hilo.start()
+
+
+def texto_edad(mantenido, *args, **kwargs):
+    """'Calculado hace N s' (+ 'actualizando…') para mostrar al lado del resultado"""
+    estado = mantenido.estado(*args, **kwargs)
+    if estado is None:
+        return ""
+    edad, actualizando, error = estado
+    edad = f"{edad:.0f} s" if edad < 120 else f"{edad / 60:.0f} min"
+    texto = f"🕒 Calculado hace {edad}"
+    if actualizando:
+        texto += " · actualizando…"
+    elif error:
+        texto += " · ⚠️ no se pudo actualizar"
+    return texto
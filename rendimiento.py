@@ -0,0 +1,164 @@
+"""
+Medición de tiempos de consultas y de cada ejecución del script.
+
+Se cuelga de los eventos before/after_cursor_execute de SQLAlchemy, así que
+mide TODAS las consultas (también las de catalogo.py) sin tocar cada
+pd.read_sql. Cada registro guarda etiqueta, duración, filas y el id de la
+ejecución (rerun) que la disparó.
+
+El volcado a JSONL no escribe en el hilo de la consulta: los registros van a
+una cola y un hilo escritor los agrega al archivo en tandas.
+"""
+import contextvars
+import json
+import queue
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import event
+
+MAX_REGISTROS = 5000
+ESPERA_ESCRITOR = 1  # segundos que junta registros el escritor antes de ir al disco
+
+_lock = threading.Lock()
+_consultas = deque(maxlen=MAX_REGISTROS)
+_reruns = deque(maxlen=MAX_REGISTROS)
+_destino_jsonl = {"ruta": None, "escritor": None}
+_por_escribir = queue.SimpleQueue()  # (ruta, registro)
+
+# Contexto de la ejecución actual (Streamlit corre cada sesión en su hilo)
+_rerun_actual = contextvars.ContextVar("rerun_actual", default=None)
+_seccion_actual = contextvars.ContextVar("seccion_actual", default="-")
+_etiqueta_actual = contextvars.ContextVar("etiqueta_actual", default=None)
+
+
+def _resumen_sql(statement, largo=80):
+    """Primeras palabras de la consulta, en una línea, para usar de etiqueta"""
+    sql = re.sub(r"--[^\n]*", " ", statement)
+    return re.sub(r"\s+", " ", sql).strip()[:largo]
+
+
+def _guardar(destino, registro):
+    with _lock:
+        destino.append(registro)
+        ruta = _destino_jsonl["ruta"]
+    if ruta:
+        _por_escribir.put((ruta, registro))
+
+
+def _escribir():
+    # Un archivo abierto por tanda (no por consulta), fuera de _lock
+    while True:
+        tanda = [_por_escribir.get()]
+        time.sleep(ESPERA_ESCRITOR)
+        while True:
+            try:
+                tanda.append(_por_escribir.get_nowait())
+            except queue.Empty:
+                break
+        por_ruta = {}
+        for ruta, registro in tanda:
+            por_ruta.setdefault(ruta, []).append(json.dumps(registro, ensure_ascii=False, default=str) + "\n")
+        for ruta, lineas in por_ruta.items():
+            try:
+                with open(ruta, "a", encoding="utf-8") as f:
+                    f.writelines(lineas)
+            except OSError:
+                pass  # medir nunca tumba la app
+
+
+def instrumentar(engine):
+    """Engancha los eventos de medición al engine (una sola vez)"""
+    if getattr(engine, "_instrumentado", False):
+        return
+    engine._instrumentado = True
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _antes(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("inicios_consulta", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _despues(conn, cursor, statement, parameters, context, executemany):
+        inicio = conn.info["inicios_consulta"].pop()
+        _guardar(_consultas, {
+            "tipo": "consulta",
+            "momento": datetime.now().isoformat(timespec="seconds"),
+            "rerun": _rerun_actual.get(),
+            "seccion": _seccion_actual.get(),
+            "etiqueta": _etiqueta_actual.get() or _resumen_sql(statement),
+            "duracion_ms": (time.perf_counter() - inicio) * 1000,
+            "filas": cursor.rowcount,
+        })
+
+    @event.listens_for(engine, "handle_error")
+    def _error(contexto):
+        # La consulta falló: descartamos su marca de inicio
+        if contexto.connection is not None and contexto.connection.info.get("inicios_consulta"):
+            contexto.connection.info["inicios_consulta"].pop()
+
+
+@contextmanager
+def etiqueta(nombre):
+    """Pone un nombre legible a las consultas que corren dentro del bloque"""
+    token = _etiqueta_actual.set(nombre)
+    try:
+        yield
+    finally:
+        _etiqueta_actual.reset(token)
+
+
+def iniciar_rerun():
+    """Marca el comienzo de una ejecución del script. Retorna (id, inicio)"""
+    id_rerun = uuid.uuid4().hex[:8]
+    _rerun_actual.set(id_rerun)
+    _seccion_actual.set("-")
+    return id_rerun, time.perf_counter()
+
+
+def marcar_seccion(nombre):
+    """Indica qué sección está corriendo (se guarda en cada consulta)"""
+    _seccion_actual.set(nombre)
+
+
+def cerrar_rerun(id_rerun, inicio):
+    """Registra el tiempo total de la ejecución"""
+    _guardar(_reruns, {
+        "tipo": "rerun",
+        "momento": datetime.now().isoformat(timespec="seconds"),
+        "rerun": id_rerun,
+        "seccion": _seccion_actual.get(),
+        "duracion_ms": (time.perf_counter() - inicio) * 1000,
+    })
+
+
+def activar_jsonl(ruta):
+    """Empieza (ruta) o deja de (None) agregar cada registro a un archivo JSONL"""
+    with _lock:
+        _destino_jsonl["ruta"] = ruta
+        if ruta and _destino_jsonl["escritor"] is None:
+            escritor = threading.Thread(target=_escribir, name="rendimiento-jsonl", daemon=True)
+            _destino_jsonl["escritor"] = escritor
+            escritor.start()
+
+
+def jsonl_activo():
+    """Ruta a la que se está volcando (None si no se vuelca)"""
+    with _lock:
+        return _destino_jsonl["ruta"]
+
+
+def registros():
+    """Copia de lo medido: (consultas, reruns) como listas de dicts"""
+    with _lock:
+        return list(_consultas), list(_reruns)
+
+
+def limpiar():
+    with _lock:
+        _consultas.clear()
+        _reruns.clear()
@@ -0,0 +1,123 @@
+"""
+Reservas de stock para varios vendedores a la vez (sql/011).
+
+Cada carrito (de Ventas o de Concesiones) tiene un id propio; agregar un
+producto deja una reserva con vencimiento y el disponible que ven los demás
+es stock_actual menos las reservas vigentes. El chequeo "hay disponible"
++ alta de la reserva se serializa con un advisory lock POR PRODUCTO que
+dura lo que dura ese INSERT: nunca se bloquea la fila de productos, así que
+reservar no espera a las ventas que se están grabando ni al revés.
+
+Mientras la sesión sigue viva el carrito renueva sus reservas; si se
+abandona, vencen solas (TTL) y dejan de contar. Confirmar borra las
+reservas del carrito en la misma transacción que graba la operación; el
+descuento de stock lo hacen los triggers, en bloque.
+"""
+import uuid
+
+from sqlalchemy import text
+
+TTL = 600              # segundos que dura una reserva sin renovar
+RENOVAR_CADA = 120     # la sesión renueva sus reservas cada tantos segundos
+
+
+def nuevo_carrito():
+    """Id para las reservas de un carrito"""
+    return str(uuid.uuid4())
+
+
+def _bloquear(conn, ids):
+    # En orden de id: dos carritos con los mismos productos no se cruzan
+    conn.execute(text("""
+        SELECT pg_advisory_xact_lock(hashtext('galpon_reservas'), s.id)
+        FROM (SELECT DISTINCT id FROM unnest(CAST(:ids AS int[])) AS id ORDER BY id OFFSET 0) s
+    """), {"ids": [int(i) for i in ids]})
+
+
+def disponibles(conn, ids):
+    """{id_producto: stock_actual - reservas vigentes} (incluye las del propio carrito)"""
+    filas = conn.execute(text("""
+        SELECT p.id_producto,
+               p.stock_actual - COALESCE((
+                   SELECT SUM(r.cantidad)
+                   FROM reservas_stock r
+                   WHERE r.id_producto = p.id_producto AND r.vence > NOW()
+               ), 0) AS libre
+        FROM productos p
+        WHERE p.id_producto = ANY(CAST(:ids AS int[]))
+    """), {"ids": [int(i) for i in ids]})
+    return {id_producto: int(libre) for id_producto, libre in filas}
+
+
+def reservar(engine, carrito, id_producto, unidades):
+    """Reserva si alcanza el disponible. Retorna (reservó, disponible que queda)"""
+    with engine.begin() as conn:
+        _bloquear(conn, [id_producto])
+        libre = disponibles(conn, [id_producto]).get(int(id_producto), 0)
+        if libre < unidades:
+            return False, libre
+        conn.execute(text("""
+            INSERT INTO reservas_stock (carrito, id_producto, cantidad, vence)
+            VALUES (CAST(:carrito AS uuid), :id, :cant, NOW() + make_interval(secs => :ttl))
+        """), {"carrito": carrito, "id": int(id_producto), "cant": int(unidades), "ttl": TTL})
+    return True, libre - unidades
+
+
+def renovar(engine, carrito, segundos=TTL):
+    """Extiende el vencimiento de las reservas del carrito. Retorna cuántas renovó"""
+    with engine.begin() as conn:
+        return conn.execute(text("""
+            UPDATE reservas_stock SET vence = NOW() + make_interval(secs => :seg)
+            WHERE carrito = CAST(:carrito AS uuid)
+        """), {"carrito": carrito, "seg": segundos}).rowcount
+
+
+def liberar(engine, carrito):
+    """Borra las reservas del carrito (se vació a mano)"""
+    with engine.begin() as conn:
+        return conn.execute(
+            text("DELETE FROM reservas_stock WHERE carrito = CAST(:carrito AS uuid)"), {"carrito": carrito}
+        ).rowcount
+
+
+def consumir(conn, carrito, pedido=None):
+    """Borra las reservas del carrito dentro de la transacción que graba la operación.
+
+    pedido ({id_producto: unidades}): además verifica que lo que no quedó
+    cubierto por reservas vigentes siga disponible; si no, ValueError.
+    Sin carrito (pedido que llega sin reservas previas) solo se verifica.
+    """
+    reservado = {} if carrito is None else dict(conn.execute(text("""
+        WITH mias AS (
+            SELECT id_reserva FROM reservas_stock
+            WHERE carrito = CAST(:carrito AS uuid)
+            FOR UPDATE SKIP LOCKED
+        ), borradas AS (
+            DELETE FROM reservas_stock r
+            USING mias m
+            WHERE r.id_reserva = m.id_reserva
+            RETURNING r.id_producto, r.cantidad, r.vence
+        )
+        SELECT id_producto, SUM(cantidad) FILTER (WHERE vence > NOW())
+        FROM borradas
+        GROUP BY id_producto
+    """), {"carrito": carrito}).all())
+    if not pedido:
+        return reservado
+
+    # Solo se mira el producto al que le faltó reserva (vencida o nunca tomada)
+    faltan = [i for i, u in pedido.items() if u > (reservado.get(i) or 0)]
+    if faltan:
+        _bloquear(conn, faltan)
+        libre = disponibles(conn, faltan)
+        # Las reservas propias ya se borraron: el disponible tiene que cubrir todo el pedido
+        cortos = [i for i in faltan if libre.get(i, 0) < pedido[i]]
+        if cortos:
+            raise ValueError(f"Ya no hay stock disponible para {len(cortos)} producto(s) del carrito (ids {cortos}).")
+    return reservado
+
+
+def liberar_vencidas(engine):
+    """Borra las reservas vencidas (las que no cuentan igual). Retorna cuántas"""
+    with engine.begin() as conn:
+        return conn.execute(text("SELECT fn_liberar_reservas_vencidas()")).scalar()
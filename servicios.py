@@ -0,0 +1,376 @@
+"""
+Operaciones del negocio, sin Streamlit.
+
+Todo lo que escribe en la base (ventas, compras, concesiones, liquidaciones,
+anulaciones, precios) y la auditoría de stock vive acá: lo usan la app
+(app_claude.py), el replicador de la cola local (cola.py) y la API JSON
+(api.py). Cada función recibe la conexión de una transacción abierta por
+quien llama (engine.begin()) y no hace commit: así se pueden combinar
+varias en una misma transacción.
+"""
+import pandas as pd
+from sqlalchemy import text
+
+import reservas
+
+# --- ESCRITURAS EN LOTE ---
+# Cabecera + todas las líneas viajan en UN solo statement (CTE con INSERT ...
+# SELECT FROM unnest): un round trip a Postgres sin importar cuántos ítems
+# tenga el carrito. Los triggers de stock corren del lado del servidor.
+
+def registrar_venta(conn, id_cliente, total, nro_factura, metodo_pago, items, descripcion, fecha=None):
+    """Inserta la venta y su detalle en un solo viaje. Retorna el id_venta"""
+    res = conn.execute(text("""
+        WITH cabecera AS (
+            INSERT INTO ventas (id_cliente, total_venta, nro_factura, metodo_pago, fecha)
+            VALUES (:id_c, :total, :fac, :pago, COALESCE(CAST(:fecha AS timestamp), NOW()))
+            RETURNING id_venta
+        ), detalle AS (
+            INSERT INTO detalle_ventas (
+                id_venta, id_producto, formato_venta, cantidad_formato,
+                precio_unitario_historico, descripcion, unidades_reales, costo_unitario
+            )
+            SELECT cab.id_venta, d.id_producto, d.formato, d.cantidad, d.precio, :desc, d.unidades, d.costo
+            FROM cabecera cab,
+                 unnest(CAST(:ids AS int[]), CAST(:formatos AS text[]),
+                        CAST(:cantidades AS int[]), CAST(:precios AS numeric[]),
+                        CAST(:unidades AS int[]), CAST(:costos AS numeric[]))
+                    AS d(id_producto, formato, cantidad, precio, unidades, costo)
+        )
+        SELECT id_venta FROM cabecera
+    """), {
+        "id_c": id_cliente,
+        "total": float(total),
+        "fac": nro_factura,
+        "pago": metodo_pago,
+        "fecha": fecha,
+        "desc": descripcion,
+        "ids": [int(i['id_producto']) for i in items],
+        "formatos": [i['Formato'] for i in items],
+        "cantidades": [int(i['Cantidad']) for i in items],
+        "precios": [float(i['PrecioUnidad']) for i in items],
+        # Hechos de la línea tal como los calculó el carrito (unidades reales y costo unitario)
+        "unidades": [int(i['UnidadesTotales']) for i in items],
+        "costos": [float(i['Costo']) / int(i['UnidadesTotales']) for i in items],
+    })
+    return res.fetchone()[0]
+
+
+def registrar_compra(conn, id_proveedor, total, flete, nro_factura, items, fecha=None):
+    """Inserta la compra y su detalle (con el flete ya prorrateado por línea) en un solo viaje. Retorna el id_compra"""
+    res = conn.execute(text("""
+        WITH cabecera AS (
+            INSERT INTO compras (id_proveedor, total_compra, costo_flete, nro_factura, fecha)
+            VALUES (:id_p, :total, :flete, :fac, COALESCE(CAST(:fecha AS timestamp), NOW()))
+            RETURNING id_compra
+        ), lineas AS (
+            -- Flete prorrateado por valor neto de la línea (misma regla que fn_prorratear_flete)
+            SELECT d.*,
+                   CAST(:flete AS numeric) * CASE
+                       WHEN SUM(d.cantidad * d.precio) OVER () > 0
+                       THEN d.cantidad * d.precio / SUM(d.cantidad * d.precio) OVER ()
+                       ELSE d.cantidad / NULLIF(SUM(d.cantidad) OVER (), 0)::numeric
+                   END AS flete
+            FROM unnest(CAST(:ids AS int[]), CAST(:cantidades AS int[]), CAST(:precios AS numeric[]))
+                    AS d(id_producto, cantidad, precio)
+        ), detalle AS (
+            INSERT INTO detalle_compras (
+                id_compra, id_producto, cantidad_unidades, precio_compra_neto, flete_asignado, costo_real
+            )
+            SELECT cab.id_compra, l.id_producto, l.cantidad, l.precio, l.flete,
+                   l.precio + COALESCE(l.flete / NULLIF(l.cantidad, 0), 0)
+            FROM cabecera cab, lineas l
+        )
+        SELECT id_compra FROM cabecera
+    """), {
+        "id_p": id_proveedor,
+        "total": float(total),
+        "flete": float(flete),
+        "fac": nro_factura,
+        "fecha": fecha,
+        "ids": [int(i['id_producto']) for i in items],
+        "cantidades": [int(i['Cantidad']) for i in items],
+        "precios": [float(i['Costo Neto']) for i in items],
+    })
+    return res.fetchone()[0]
+
+
+def registrar_concesion(conn, id_cliente, items):
+    """Inserta la entrega en concesión y su detalle en un solo viaje. Retorna el id_concesion"""
+    res = conn.execute(text("""
+        WITH cabecera AS (
+            INSERT INTO concesiones (id_cliente) VALUES (:id_c)
+            RETURNING id_concesion
+        ), detalle AS (
+            INSERT INTO detalle_concesiones (id_concesion, id_producto, cantidad)
+            SELECT cab.id_concesion, d.id_producto, d.cantidad
+            FROM cabecera cab,
+                 unnest(CAST(:ids AS int[]), CAST(:cantidades AS int[])) AS d(id_producto, cantidad)
+        )
+        SELECT id_concesion FROM cabecera
+    """), {
+        "id_c": id_cliente,
+        "ids": [int(i['id']) for i in items],
+        "cantidades": [int(i['cantidad']) for i in items],
+    })
+    return res.fetchone()[0]
+
+
+def liquidar_concesion(conn, id_cliente, lineas):
+    """Cobra y devuelve todo lo indicado de un local en un solo viaje. Retorna el id_venta (o None)"""
+    # lineas: [{id_detalle, id_producto, cobrar, devolver, precio}]. Lo cobrado
+    # es UNA venta con muchas líneas (es_concesion: el trigger baja stock_concesion)
+    # y lo devuelto pasa de concesión a físico con un UPDATE agrupado.
+    # El movimiento DEVOLUCION_CONCESION depende de la convención instalada:
+    # con los triggers de la app (003/013) el total propio no cambia al
+    # devolver y no va; con triggers propios de la base se registra como antes.
+    res = conn.execute(text("""
+        WITH lineas AS (
+            SELECT *
+            FROM unnest(CAST(:detalles AS int[]), CAST(:ids AS int[]), CAST(:cobrar AS int[]),
+                        CAST(:devolver AS int[]), CAST(:precios AS numeric[]))
+                AS l(id_detalle, id_producto, cobrar, devolver, precio)
+            WHERE l.cobrar + l.devolver > 0
+        ), cabecera AS (
+            INSERT INTO ventas (id_cliente, total_venta, nro_factura)
+            SELECT :id_c, SUM(cobrar * precio), 'CONCESION'
+            FROM lineas
+            HAVING SUM(cobrar) > 0
+            RETURNING id_venta
+        ), venta AS (
+            INSERT INTO detalle_ventas (
+                id_venta, id_producto, formato_venta, cantidad_formato, precio_unitario_historico,
+                descripcion, es_concesion, unidades_reales, costo_unitario
+            )
+            SELECT cab.id_venta, l.id_producto, 'Unidad', l.cobrar, l.precio,
+                   'Liquidación de concesión', TRUE, l.cobrar, p.precio_costo_promedio
+            FROM cabecera cab, lineas l
+            JOIN productos p ON p.id_producto = l.id_producto
+            WHERE l.cobrar > 0
+        ), devolucion AS (
+            UPDATE productos p
+            SET stock_concesion = p.stock_concesion - x.unidades,
+                stock_actual    = p.stock_actual    + x.unidades
+            FROM (
+                SELECT id_producto, SUM(devolver) AS unidades
+                FROM lineas WHERE devolver > 0 GROUP BY id_producto
+            ) x
+            WHERE p.id_producto = x.id_producto
+        ), movimiento_devolucion AS (
+            INSERT INTO inventario_movimientos (id_producto, tipo, cantidad, fecha)
+            SELECT id_producto, 'DEVOLUCION_CONCESION', SUM(devolver), NOW()
+            FROM lineas
+            WHERE devolver > 0
+              AND NOT EXISTS (
+                  SELECT 1 FROM pg_trigger t
+                  WHERE t.tgrelid = 'detalle_concesiones'::regclass
+                    AND t.tgname = 'trg_stock_concesion_alta'
+              )
+            GROUP BY id_producto
+        ), saldados AS (
+            DELETE FROM detalle_concesiones dc
+            USING lineas l
+            WHERE dc.id_detalle = l.id_detalle AND dc.cantidad = l.cobrar + l.devolver
+            RETURNING dc.id_detalle
+        ), parciales AS (
+            UPDATE detalle_concesiones dc
+            SET cantidad = dc.cantidad - (l.cobrar + l.devolver)
+            FROM lineas l
+            WHERE dc.id_detalle = l.id_detalle AND dc.cantidad > l.cobrar + l.devolver
+            RETURNING dc.id_detalle
+        )
+        SELECT (SELECT id_venta FROM cabecera),
+               (SELECT COUNT(*) FROM saldados) + (SELECT COUNT(*) FROM parciales),
+               (SELECT COUNT(*) FROM lineas)
+    """), {
+        "id_c": id_cliente,
+        "detalles": [int(l['id_detalle']) for l in lineas],
+        "ids": [int(l['id_producto']) for l in lineas],
+        "cobrar": [int(l['cobrar']) for l in lineas],
+        "devolver": [int(l['devolver']) for l in lineas],
+        "precios": [float(l['precio']) for l in lineas],
+    })
+    id_venta, tocadas, esperadas = res.fetchone()
+    if tocadas != esperadas:
+        # Alguien cambió la concesión mientras se cargaba: el rollback deshace todo
+        raise ValueError("Las cantidades de la concesión cambiaron. Recargá la página y volvé a intentar.")
+
+    # Limpieza de cabeceras vacías, solo de este cliente (índice parcial de activas)
+    conn.execute(text("""
+        DELETE FROM concesiones c
+        WHERE c.id_cliente = :id_c AND c.estado = 'ACTIVA'
+          AND NOT EXISTS (SELECT 1 FROM detalle_concesiones dc WHERE dc.id_concesion = c.id_concesion)
+    """), {"id_c": id_cliente})
+    return id_venta
+
+
+# --- COLA LOCAL DE VENTAS Y COMPRAS ---
+# Confirmar escribe en el diario SQLite de cola.py y vuelve al instante; el
+# replicador (un hilo por proceso) las graba con estas mismas funciones,
+# con la fecha y hora en que se confirmaron en el mostrador.
+
+def replicar_venta(conn, d):
+    """Graba una venta de la cola (y se lleva las reservas de su carrito)"""
+    # Lo que no cubren reservas vigentes (vencidas, o agregado sin base) se
+    # verifica contra el disponible: si no alcanza, ValueError y la operación
+    # queda en error en la cola en vez de dejar el stock negativo
+    pedido = {}
+    for item in d["items"]:
+        pedido[int(item["id_producto"])] = pedido.get(int(item["id_producto"]), 0) + int(item["UnidadesTotales"])
+    reservas.consumir(conn, d.get("reserva"), pedido)
+    return registrar_venta(conn, d["id_cliente"], d["total"], d["nro_factura"], d["metodo_pago"],
+                           d["items"], d["descripcion"], d["fecha"])
+
+
+def replicar_compra(conn, d):
+    """Graba una compra de la cola"""
+    return registrar_compra(conn, d["id_proveedor"], d["total"], d["flete"], d["nro_factura"],
+                            d["items"], d["fecha"])
+
+
+APLICADORES = {"venta": replicar_venta, "compra": replicar_compra}
+
+
+# --- ANULACIONES Y PRECIOS ---
+
+def anular_venta(conn, id_venta):
+    """Borra la venta; los triggers devuelven el stock y descuentan el resumen"""
+    conn.execute(text("DELETE FROM detalle_ventas WHERE id_venta = :id"), {"id": int(id_venta)})
+    conn.execute(text("DELETE FROM ventas WHERE id_venta = :id"), {"id": int(id_venta)})
+
+
+def anular_compra(conn, id_compra):
+    """Borra la compra; el trigger resta del promedio el costo_real guardado en cada línea"""
+    conn.execute(text("DELETE FROM detalle_compras WHERE id_compra = :id"), {"id": int(id_compra)})
+    conn.execute(text("DELETE FROM compras WHERE id_compra = :id"), {"id": int(id_compra)})
+
+
+def actualizar_precio(conn, id_producto, nuevo):
+    """Cambia el precio de venta (y el de la caja) y lo deja en el historial.
+    Retorna el precio anterior, o None si no cambió"""
+    return conn.execute(text("""
+        WITH anterior AS (
+            SELECT id_producto, precio_venta FROM productos
+            WHERE id_producto = :idp
+            FOR UPDATE
+        ), cambio AS (
+            UPDATE productos p
+            SET precio_venta = :np, precio_venta_caja = :np * p.unidades_por_caja
+            FROM anterior a
+            WHERE p.id_producto = a.id_producto AND a.precio_venta <> :np
+            RETURNING p.id_producto, a.precio_venta AS precio_anterior
+        ), historial AS (
+            INSERT INTO historial_precios (id_producto, precio_anterior, precio_nuevo)
+            SELECT id_producto, precio_anterior, :np FROM cambio
+        )
+        SELECT precio_anterior FROM cambio
+    """), {"idp": int(id_producto), "np": float(nuevo)}).scalar()
+
+
+# --- PEDIDOS DE LA API (sin carrito armado en la app) ---
+
+def armar_items(conn, lineas):
+    """Convierte [{id_producto, formato, cantidad}] en ítems con la forma del
+    carrito de Ventas, con precio y costo de la base. ValueError si algo no cierra"""
+    if not lineas:
+        raise ValueError("El pedido no tiene líneas.")
+    ids = [int(l["id_producto"]) for l in lineas]
+    productos = {fila.id_producto: fila for fila in conn.execute(text("""
+        SELECT p.id_producto, p.nombre, m.nombre AS marca, p.precio_venta,
+               p.precio_costo_promedio, p.unidades_por_caja
+        FROM productos p
+        JOIN marcas m ON m.id_marca = p.id_marca
+        WHERE p.id_producto = ANY(CAST(:ids AS int[]))
+    """), {"ids": ids})}
+    items = []
+    for l in lineas:
+        p = productos.get(int(l["id_producto"]))
+        if p is None:
+            raise ValueError(f"No existe el producto {l['id_producto']}.")
+        formato = l.get("formato", "Unidad")
+        if formato not in ("Unidad", "Caja"):
+            raise ValueError(f"Formato '{formato}' inválido: tiene que ser Unidad o Caja.")
+        cantidad = int(l["cantidad"])
+        if cantidad <= 0:
+            raise ValueError(f"Cantidad inválida para el producto {p.id_producto}.")
+        unidades = cantidad * (p.unidades_por_caja if formato == "Caja" else 1)
+        precio = float(p.precio_venta)
+        items.append({
+            "id_producto": p.id_producto,
+            "Producto": f"{p.nombre} ({p.marca})",
+            "Formato": formato,
+            "Cantidad": cantidad,
+            "PrecioUnidad": precio,
+            "UnidadesTotales": unidades,
+            "Subtotal": unidades * precio,
+            "Costo": unidades * float(p.precio_costo_promedio),
+        })
+    return items
+
+
+def vender_pedido(conn, d, reserva=None):
+    """Venta de un pedido de la API: verifica el disponible (respetando las reservas de
+    los carritos) y graba en la misma transacción. Retorna el id_venta.
+
+    reserva: carrito propio cuyas reservas se lleva la venta. No sale de los
+    datos del pedido: un cliente de la API no puede consumir reservas ajenas.
+    """
+    items = armar_items(conn, d["lineas"])
+    pedido = {}
+    for i in items:
+        pedido[i["id_producto"]] = pedido.get(i["id_producto"], 0) + i["UnidadesTotales"]
+    reservas.consumir(conn, reserva, pedido)
+    return registrar_venta(conn, int(d["id_cliente"]), sum(i["Subtotal"] for i in items),
+                           d.get("nro_factura"), d.get("metodo_pago"), items, d.get("descripcion"))
+
+
+# --- AUDITORÍA ---
+
+def auditar_stock(conn):
+    """Físico + Concesión vs. movimientos, resuelto en SQL a partir del último checkpoint"""
+    # 1) Corremos el checkpoint hacia adelante (solo suma los movimientos nuevos)
+    conn.execute(text("SELECT fn_avanzar_checkpoint_stock()"))
+    # 2) Calculado = saldo del checkpoint + movimientos posteriores al corte.
+    #    En el mismo statement se marcan como verificados los que cierran.
+    df = pd.read_sql(text("""
+        WITH corte AS (
+            SELECT COALESCE(MIN(transaccion_hasta), '0') AS minimo FROM stock_checkpoints
+        ), posteriores AS (
+            SELECT im.id_producto, SUM(im.cantidad) AS suma
+            FROM inventario_movimientos im
+            CROSS JOIN corte
+            LEFT JOIN stock_checkpoints ck ON ck.id_producto = im.id_producto
+            WHERE im.transaccion >= corte.minimo
+              AND im.transaccion >= COALESCE(ck.transaccion_hasta, corte.minimo)
+            GROUP BY im.id_producto
+        ), auditoria AS (
+            SELECT p.id_producto,
+                   p.nombre,
+                   p.stock_actual AS fisico,
+                   p.stock_concesion AS concesion,
+                   COALESCE(ck.saldo_movimientos, 0) + COALESCE(d.suma, 0) AS calculado,
+                   ck.verificado
+            FROM productos p
+            LEFT JOIN stock_checkpoints ck ON ck.id_producto = p.id_producto
+            LEFT JOIN posteriores d ON d.id_producto = p.id_producto
+        ), marcado AS (
+            UPDATE stock_checkpoints ck
+            SET diferencia = a.fisico + a.concesion - a.calculado,
+                verificado = CASE WHEN a.fisico + a.concesion = a.calculado THEN NOW() ELSE ck.verificado END
+            FROM auditoria a
+            WHERE ck.id_producto = a.id_producto
+            RETURNING ck.id_producto, ck.verificado
+        )
+        SELECT a.id_producto,
+               a.nombre,
+               a.fisico AS "Físico",
+               a.concesion AS "Concesión",
+               a.fisico + a.concesion AS "Total Real",
+               a.calculado AS "Calculado",
+               a.fisico + a.concesion - a.calculado AS "Diferencia",
+               COALESCE(m.verificado, a.verificado) AS "Última verificación"
+        FROM auditoria a
+        LEFT JOIN marcado m ON m.id_producto = a.id_producto
+        ORDER BY a.nombre
+    """), conn)
+    return df
@@ -0,0 +1,131 @@
+-- ==========================================================
+-- ESQUEMA BASE (tal como lo usa la app)
+-- En la base de producción ya existe todo y esto no hace nada; sirve para
+-- levantar una base local vacía (desarrollo, benchmarks).
+-- ==========================================================
+
+CREATE TABLE IF NOT EXISTS marcas (
+    id_marca  serial PRIMARY KEY,
+    nombre    text NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS proveedores (
+    id_proveedor  serial PRIMARY KEY,
+    nombre        text NOT NULL,
+    telefono      text,
+    email         text
+);
+
+CREATE TABLE IF NOT EXISTS clientes (
+    id_cliente    serial PRIMARY KEY,
+    razon_social  text NOT NULL,
+    direccion     text,
+    telefono      text
+);
+
+CREATE TABLE IF NOT EXISTS productos (
+    id_producto            serial PRIMARY KEY,
+    nombre                 text NOT NULL,
+    id_marca               integer NOT NULL REFERENCES marcas (id_marca),
+    precio_venta           numeric(12, 2) NOT NULL DEFAULT 0,
+    precio_venta_caja      numeric(12, 2) NOT NULL DEFAULT 0,
+    precio_costo_promedio  numeric(12, 4) NOT NULL DEFAULT 0,
+    stock_actual           integer NOT NULL DEFAULT 0,
+    stock_concesion        integer NOT NULL DEFAULT 0,
+    stock_minimo           integer NOT NULL DEFAULT 0,
+    unidades_por_caja      integer NOT NULL DEFAULT 1
+);
+
+CREATE TABLE IF NOT EXISTS ventas (
+    id_venta     serial PRIMARY KEY,
+    id_cliente   integer NOT NULL REFERENCES clientes (id_cliente),
+    fecha        timestamp NOT NULL DEFAULT NOW(),
+    total_venta  numeric(14, 2) NOT NULL DEFAULT 0,
+    nro_factura  text,
+    metodo_pago  text
+);
+
+CREATE TABLE IF NOT EXISTS detalle_ventas (
+    id_detalle                 serial PRIMARY KEY,
+    id_venta                   integer NOT NULL REFERENCES ventas (id_venta),
+    id_producto                integer NOT NULL REFERENCES productos (id_producto),
+    formato_venta              text NOT NULL DEFAULT 'Unidad',
+    cantidad_formato           integer NOT NULL,
+    precio_unitario_historico  numeric(12, 2) NOT NULL,
+    descripcion                text,
+    es_concesion               boolean NOT NULL DEFAULT FALSE
+);
+
+CREATE TABLE IF NOT EXISTS compras (
+    id_compra     serial PRIMARY KEY,
+    id_proveedor  integer NOT NULL REFERENCES proveedores (id_proveedor),
+    fecha         timestamp NOT NULL DEFAULT NOW(),
+    total_compra  numeric(14, 2) NOT NULL DEFAULT 0,
+    costo_flete   numeric(14, 2) NOT NULL DEFAULT 0,
+    nro_factura   text
+);
+
+CREATE TABLE IF NOT EXISTS detalle_compras (
+    id_detalle          serial PRIMARY KEY,
+    id_compra           integer NOT NULL REFERENCES compras (id_compra),
+    id_producto         integer NOT NULL REFERENCES productos (id_producto),
+    cantidad_unidades   integer NOT NULL,
+    precio_compra_neto  numeric(12, 4) NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS concesiones (
+    id_concesion  serial PRIMARY KEY,
+    id_cliente    integer NOT NULL REFERENCES clientes (id_cliente),
+    fecha         timestamp NOT NULL DEFAULT NOW(),
+    estado        text NOT NULL DEFAULT 'ACTIVA'
+);
+
+CREATE TABLE IF NOT EXISTS detalle_concesiones (
+    id_detalle    serial PRIMARY KEY,
+    id_concesion  integer NOT NULL REFERENCES concesiones (id_concesion),
+    id_producto   integer NOT NULL REFERENCES productos (id_producto),
+    cantidad      integer NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS inventario_movimientos (
+    id_movimiento  bigserial PRIMARY KEY,
+    id_producto    integer NOT NULL REFERENCES productos (id_producto),
+    tipo           text NOT NULL,
+    cantidad       integer NOT NULL,
+    fecha          timestamp NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS historial_precios (
+    id_historial     serial PRIMARY KEY,
+    id_producto      integer NOT NULL REFERENCES productos (id_producto),
+    precio_anterior  numeric(12, 2),
+    precio_nuevo     numeric(12, 2),
+    fecha            timestamp NOT NULL DEFAULT NOW()
+);
+
+-- Vista de la sección Análisis: costo promedio vs. última compra.
+-- Solo se crea si no existe (en producción puede tener otra definición).
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_views WHERE viewname = 'v_comparacion_costos') THEN
+        CREATE VIEW v_comparacion_costos AS
+        SELECT p.id_producto,
+               p.nombre,
+               p.stock_actual,
+               ROUND(p.precio_costo_promedio, 2) AS costo_promedio,
+               u.precio_compra_neto AS costo_ultima_compra,
+               ROUND(u.precio_compra_neto - p.precio_costo_promedio, 2) AS diferencia,
+               ROUND((u.precio_compra_neto - p.precio_costo_promedio)
+                     / NULLIF(p.precio_costo_promedio, 0) * 100, 1) AS variacion_porcentual
+        FROM productos p
+        JOIN LATERAL (
+            SELECT dc.precio_compra_neto
+            FROM detalle_compras dc
+            JOIN compras c ON c.id_compra = dc.id_compra
+            WHERE dc.id_producto = p.id_producto
+            ORDER BY c.fecha DESC, c.id_compra DESC
+            LIMIT 1
+        ) u ON TRUE;
+    END IF;
+END;
+$$;
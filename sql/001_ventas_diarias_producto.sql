@@ -0,0 +1,90 @@
+-- ==========================================================
+-- RESUMEN DIARIO DE VENTAS POR PRODUCTO
+-- Lo mantienen los triggers de detalle_ventas; el dashboard y los
+-- análisis leen de acá en vez de re-agregar todo el historial.
+-- ==========================================================
+
+CREATE TABLE IF NOT EXISTS ventas_diarias_producto (
+    fecha            date    NOT NULL,
+    id_producto      integer NOT NULL REFERENCES productos (id_producto),
+    unidades_reales  numeric NOT NULL DEFAULT 0,  -- cantidad_formato x unidades_por_caja
+    ingresos         numeric NOT NULL DEFAULT 0,
+    costo            numeric NOT NULL DEFAULT 0,  -- a costo promedio del momento de la venta
+    PRIMARY KEY (fecha, id_producto)
+);
+
+CREATE INDEX IF NOT EXISTS ix_ventas_diarias_producto_prod
+    ON ventas_diarias_producto (id_producto, fecha);
+
+
+-- Alta de líneas: se suma por (día, producto) todo lo que entró en el statement
+CREATE OR REPLACE FUNCTION fn_ventas_diarias_alta() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO ventas_diarias_producto AS vdp (fecha, id_producto, unidades_reales, ingresos, costo)
+    SELECT v.fecha::date,
+           n.id_producto,
+           SUM(n.cantidad_formato * CASE WHEN n.formato_venta = 'Caja' THEN p.unidades_por_caja ELSE 1 END),
+           SUM(n.cantidad_formato * CASE WHEN n.formato_venta = 'Caja' THEN p.unidades_por_caja ELSE 1 END
+               * n.precio_unitario_historico),
+           SUM(n.cantidad_formato * CASE WHEN n.formato_venta = 'Caja' THEN p.unidades_por_caja ELSE 1 END
+               * p.precio_costo_promedio)
+    FROM nuevas n
+    JOIN ventas v ON v.id_venta = n.id_venta
+    JOIN productos p ON p.id_producto = n.id_producto
+    GROUP BY v.fecha::date, n.id_producto
+    ON CONFLICT (fecha, id_producto) DO UPDATE
+        SET unidades_reales = vdp.unidades_reales + EXCLUDED.unidades_reales,
+            ingresos        = vdp.ingresos + EXCLUDED.ingresos,
+            costo           = vdp.costo + EXCLUDED.costo;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Baja de líneas: se resta lo mismo. La app borra el detalle ANTES que la
+-- cabecera, así que la fecha de la venta todavía está disponible.
+CREATE OR REPLACE FUNCTION fn_ventas_diarias_baja() RETURNS trigger AS $$
+BEGIN
+    UPDATE ventas_diarias_producto vdp
+    SET unidades_reales = vdp.unidades_reales - b.unidades,
+        ingresos        = vdp.ingresos - b.ingresos,
+        costo           = vdp.costo - b.costo
+    FROM (
+        SELECT v.fecha::date AS fecha,
+               o.id_producto,
+               SUM(o.cantidad_formato * CASE WHEN o.formato_venta = 'Caja' THEN p.unidades_por_caja ELSE 1 END) AS unidades,
+               SUM(o.cantidad_formato * CASE WHEN o.formato_venta = 'Caja' THEN p.unidades_por_caja ELSE 1 END
+                   * o.precio_unitario_historico) AS ingresos,
+               SUM(o.cantidad_formato * CASE WHEN o.formato_venta = 'Caja' THEN p.unidades_por_caja ELSE 1 END
+                   * p.precio_costo_promedio) AS costo
+        FROM viejas o
+        JOIN ventas v ON v.id_venta = o.id_venta
+        JOIN productos p ON p.id_producto = o.id_producto
+        GROUP BY v.fecha::date, o.id_producto
+    ) b
+    WHERE vdp.fecha = b.fecha AND vdp.id_producto = b.id_producto;
+
+    -- Los días que quedaron en cero no aportan nada (solo miramos los tocados)
+    DELETE FROM ventas_diarias_producto vdp
+    USING viejas o
+    JOIN ventas v ON v.id_venta = o.id_venta
+    WHERE vdp.fecha = v.fecha::date
+      AND vdp.id_producto = o.id_producto
+      AND vdp.unidades_reales = 0
+      AND vdp.ingresos = 0;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+DROP TRIGGER IF EXISTS trg_ventas_diarias_alta ON detalle_ventas;
+CREATE TRIGGER trg_ventas_diarias_alta
+    AFTER INSERT ON detalle_ventas
+    REFERENCING NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION fn_ventas_diarias_alta();
+
+DROP TRIGGER IF EXISTS trg_ventas_diarias_baja ON detalle_ventas;
+CREATE TRIGGER trg_ventas_diarias_baja
+    AFTER DELETE ON detalle_ventas
+    REFERENCING OLD TABLE AS viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION fn_ventas_diarias_baja();
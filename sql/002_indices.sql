@@ -0,0 +1,46 @@
+-- ==========================================================
+-- ÍNDICES PARA LAS CONSULTAS DE LA APP
+-- CREATE INDEX (sin CONCURRENTLY) porque cada migración corre en una
+-- transacción: conviene aplicarla fuera del horario de atención.
+-- ==========================================================
+
+-- Joins de detalle -> cabecera / producto
+CREATE INDEX IF NOT EXISTS ix_detalle_ventas_venta        ON detalle_ventas (id_venta);
+CREATE INDEX IF NOT EXISTS ix_detalle_ventas_producto     ON detalle_ventas (id_producto);
+CREATE INDEX IF NOT EXISTS ix_detalle_compras_compra      ON detalle_compras (id_compra);
+CREATE INDEX IF NOT EXISTS ix_detalle_compras_producto    ON detalle_compras (id_producto);
+CREATE INDEX IF NOT EXISTS ix_detalle_concesiones_conc    ON detalle_concesiones (id_concesion);
+
+-- Concesiones: casi todo filtra por estado = 'ACTIVA', que son pocas filas
+CREATE INDEX IF NOT EXISTS ix_concesiones_activas_cliente
+    ON concesiones (id_cliente) WHERE estado = 'ACTIVA';
+
+-- Historiales paginados por (fecha, id): cubren el rango de la página sin
+-- ir a la tabla (INCLUDE trae lo que muestra la cabecera)
+CREATE INDEX IF NOT EXISTS ix_ventas_fecha_id
+    ON ventas (fecha DESC, id_venta DESC) INCLUDE (id_cliente, nro_factura);
+CREATE INDEX IF NOT EXISTS ix_ventas_cliente_fecha_id
+    ON ventas (id_cliente, fecha DESC, id_venta DESC);
+CREATE INDEX IF NOT EXISTS ix_compras_fecha_id
+    ON compras (fecha DESC, id_compra DESC) INCLUDE (id_proveedor, nro_factura, costo_flete, total_compra);
+CREATE INDEX IF NOT EXISTS ix_compras_proveedor_fecha_id
+    ON compras (id_proveedor, fecha DESC, id_compra DESC);
+CREATE INDEX IF NOT EXISTS ix_movimientos_fecha_id
+    ON inventario_movimientos (fecha DESC, id_movimiento DESC);
+CREATE INDEX IF NOT EXISTS ix_movimientos_tipo_fecha_id
+    ON inventario_movimientos (tipo, fecha DESC, id_movimiento DESC);
+CREATE INDEX IF NOT EXISTS ix_movimientos_producto_fecha
+    ON inventario_movimientos (id_producto, fecha);
+
+-- Productos críticos (KPI del dashboard): solo indexa los que están bajos
+CREATE INDEX IF NOT EXISTS ix_productos_criticos
+    ON productos (id_producto) WHERE stock_actual <= stock_minimo;
+
+ANALYZE detalle_ventas;
+ANALYZE detalle_compras;
+ANALYZE detalle_concesiones;
+ANALYZE concesiones;
+ANALYZE ventas;
+ANALYZE compras;
+ANALYZE inventario_movimientos;
+ANALYZE productos;
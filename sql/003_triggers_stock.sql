@@ -0,0 +1,209 @@
+-- ==========================================================
+-- TRIGGERS DE STOCK QUE LA APP DA POR SUPUESTOS
+--
+-- Convención: inventario_movimientos suma el stock TOTAL propio
+-- (físico + en concesión), que es lo que compara la Auditoría Profunda.
+--   * Venta:      baja stock_actual (o stock_concesion si es_concesion) y
+--                 registra un movimiento negativo.
+--   * Compra:     sube stock_actual, recalcula el costo promedio ponderado
+--                 (con el flete prorrateado) y registra un movimiento.
+--   * Concesión:  pasa unidades de stock_actual a stock_concesion. El total
+--                 no cambia, así que no hay movimiento.
+-- Todos son FOR EACH STATEMENT con tablas de transición: una venta de 60
+-- líneas actualiza productos con UN UPDATE agrupado por producto.
+--
+-- Solo se instalan si las tablas no tienen ya triggers propios (la base de
+-- producción los trae de antes): así no se descuenta el stock dos veces.
+-- ==========================================================
+
+CREATE OR REPLACE FUNCTION fn_stock_venta_alta() RETURNS trigger AS $$
+BEGIN
+    WITH lineas AS (
+        SELECT n.id_producto,
+               COALESCE(n.es_concesion, FALSE) AS es_concesion,
+               n.cantidad_formato * CASE WHEN n.formato_venta = 'Caja' THEN p.unidades_por_caja ELSE 1 END AS unidades
+        FROM nuevas n
+        JOIN productos p ON p.id_producto = n.id_producto
+    ), movimientos AS (
+        INSERT INTO inventario_movimientos (id_producto, tipo, cantidad, fecha)
+        SELECT id_producto, CASE WHEN es_concesion THEN 'VENTA_CONCESION' ELSE 'VENTA' END, -SUM(unidades), NOW()
+        FROM lineas
+        GROUP BY id_producto, es_concesion
+    )
+    UPDATE productos p
+    SET stock_actual    = p.stock_actual    - x.fisico,
+        stock_concesion = p.stock_concesion - x.concesion
+    FROM (
+        SELECT id_producto,
+               COALESCE(SUM(unidades) FILTER (WHERE NOT es_concesion), 0) AS fisico,
+               COALESCE(SUM(unidades) FILTER (WHERE es_concesion), 0) AS concesion
+        FROM lineas
+        GROUP BY id_producto
+    ) x
+    WHERE p.id_producto = x.id_producto;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE OR REPLACE FUNCTION fn_stock_venta_baja() RETURNS trigger AS $$
+BEGIN
+    WITH lineas AS (
+        SELECT o.id_producto,
+               COALESCE(o.es_concesion, FALSE) AS es_concesion,
+               o.cantidad_formato * CASE WHEN o.formato_venta = 'Caja' THEN p.unidades_por_caja ELSE 1 END AS unidades
+        FROM viejas o
+        JOIN productos p ON p.id_producto = o.id_producto
+    ), movimientos AS (
+        INSERT INTO inventario_movimientos (id_producto, tipo, cantidad, fecha)
+        SELECT id_producto, 'ANULACION_VENTA', SUM(unidades), NOW()
+        FROM lineas
+        GROUP BY id_producto
+    )
+    UPDATE productos p
+    SET stock_actual    = p.stock_actual    + x.fisico,
+        stock_concesion = p.stock_concesion + x.concesion
+    FROM (
+        SELECT id_producto,
+               COALESCE(SUM(unidades) FILTER (WHERE NOT es_concesion), 0) AS fisico,
+               COALESCE(SUM(unidades) FILTER (WHERE es_concesion), 0) AS concesion
+        FROM lineas
+        GROUP BY id_producto
+    ) x
+    WHERE p.id_producto = x.id_producto;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Costo real de cada línea = neto x (1 + flete / neto total de la factura)
+CREATE OR REPLACE FUNCTION fn_stock_compra_alta() RETURNS trigger AS $$
+BEGIN
+    WITH lineas AS (
+        SELECT n.id_producto,
+               n.cantidad_unidades AS cantidad,
+               n.precio_compra_neto
+                   * (1 + COALESCE(c.costo_flete / NULLIF(c.total_compra - c.costo_flete, 0), 0)) AS costo_real
+        FROM nuevas n
+        JOIN compras c ON c.id_compra = n.id_compra
+    ), movimientos AS (
+        INSERT INTO inventario_movimientos (id_producto, tipo, cantidad, fecha)
+        SELECT id_producto, 'COMPRA', SUM(cantidad), NOW()
+        FROM lineas
+        GROUP BY id_producto
+    )
+    UPDATE productos p
+    SET precio_costo_promedio = CASE
+            WHEN GREATEST(p.stock_actual + p.stock_concesion, 0) + x.cantidad > 0
+            THEN (GREATEST(p.stock_actual + p.stock_concesion, 0) * p.precio_costo_promedio + x.valor)
+                 / (GREATEST(p.stock_actual + p.stock_concesion, 0) + x.cantidad)
+            ELSE p.precio_costo_promedio
+        END,
+        stock_actual = p.stock_actual + x.cantidad
+    FROM (
+        SELECT id_producto, SUM(cantidad) AS cantidad, SUM(cantidad * costo_real) AS valor
+        FROM lineas
+        GROUP BY id_producto
+    ) x
+    WHERE p.id_producto = x.id_producto;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- La app borra el detalle antes que la cabecera: el flete sigue disponible
+CREATE OR REPLACE FUNCTION fn_stock_compra_baja() RETURNS trigger AS $$
+BEGIN
+    WITH lineas AS (
+        SELECT o.id_producto,
+               o.cantidad_unidades AS cantidad,
+               o.precio_compra_neto
+                   * (1 + COALESCE(c.costo_flete / NULLIF(c.total_compra - c.costo_flete, 0), 0)) AS costo_real
+        FROM viejas o
+        JOIN compras c ON c.id_compra = o.id_compra
+    ), movimientos AS (
+        INSERT INTO inventario_movimientos (id_producto, tipo, cantidad, fecha)
+        SELECT id_producto, 'ANULACION_COMPRA', -SUM(cantidad), NOW()
+        FROM lineas
+        GROUP BY id_producto
+    )
+    UPDATE productos p
+    SET precio_costo_promedio = CASE
+            WHEN p.stock_actual + p.stock_concesion - x.cantidad > 0
+            THEN ((p.stock_actual + p.stock_concesion) * p.precio_costo_promedio - x.valor)
+                 / (p.stock_actual + p.stock_concesion - x.cantidad)
+            ELSE p.precio_costo_promedio
+        END,
+        stock_actual = p.stock_actual - x.cantidad
+    FROM (
+        SELECT id_producto, SUM(cantidad) AS cantidad, SUM(cantidad * costo_real) AS valor
+        FROM lineas
+        GROUP BY id_producto
+    ) x
+    WHERE p.id_producto = x.id_producto;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE OR REPLACE FUNCTION fn_stock_concesion_alta() RETURNS trigger AS $$
+BEGIN
+    UPDATE productos p
+    SET stock_actual    = p.stock_actual    - x.cantidad,
+        stock_concesion = p.stock_concesion + x.cantidad
+    FROM (
+        SELECT id_producto, SUM(cantidad) AS cantidad
+        FROM nuevas
+        GROUP BY id_producto
+    ) x
+    WHERE p.id_producto = x.id_producto;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1
+        FROM pg_trigger t
+        WHERE t.tgrelid IN ('detalle_ventas'::regclass, 'detalle_compras'::regclass, 'detalle_concesiones'::regclass)
+          AND NOT t.tgisinternal
+          AND t.tgname NOT LIKE 'trg_stock_%'
+          AND t.tgname NOT LIKE 'trg_ventas_diarias_%'
+    ) THEN
+        RAISE NOTICE 'La base ya tiene triggers de stock propios: no se instalan los de la app.';
+        RETURN;
+    END IF;
+
+    DROP TRIGGER IF EXISTS trg_stock_venta_alta ON detalle_ventas;
+    CREATE TRIGGER trg_stock_venta_alta
+        AFTER INSERT ON detalle_ventas
+        REFERENCING NEW TABLE AS nuevas
+        FOR EACH STATEMENT EXECUTE FUNCTION fn_stock_venta_alta();
+
+    DROP TRIGGER IF EXISTS trg_stock_venta_baja ON detalle_ventas;
+    CREATE TRIGGER trg_stock_venta_baja
+        AFTER DELETE ON detalle_ventas
+        REFERENCING OLD TABLE AS viejas
+        FOR EACH STATEMENT EXECUTE FUNCTION fn_stock_venta_baja();
+
+    DROP TRIGGER IF EXISTS trg_stock_compra_alta ON detalle_compras;
+    CREATE TRIGGER trg_stock_compra_alta
+        AFTER INSERT ON detalle_compras
+        REFERENCING NEW TABLE AS nuevas
+        FOR EACH STATEMENT EXECUTE FUNCTION fn_stock_compra_alta();
+
+    DROP TRIGGER IF EXISTS trg_stock_compra_baja ON detalle_compras;
+    CREATE TRIGGER trg_stock_compra_baja
+        AFTER DELETE ON detalle_compras
+        REFERENCING OLD TABLE AS viejas
+        FOR EACH STATEMENT EXECUTE FUNCTION fn_stock_compra_baja();
+
+    DROP TRIGGER IF EXISTS trg_stock_concesion_alta ON detalle_concesiones;
+    CREATE TRIGGER trg_stock_concesion_alta
+        AFTER INSERT ON detalle_concesiones
+        REFERENCING NEW TABLE AS nuevas
+        FOR EACH STATEMENT EXECUTE FUNCTION fn_stock_concesion_alta();
+END;
+$$;
@@ -0,0 +1,117 @@
+-- ==========================================================
+-- CHECKPOINTS DE STOCK PARA LA AUDITORÍA PROFUNDA
+--
+-- stock_checkpoints guarda, por producto, la suma de inventario_movimientos
+-- hasta un id de movimiento (id_movimiento_hasta). La auditoría ya no suma
+-- todo el historial: toma ese saldo y le agrega solo los movimientos
+-- posteriores, que entran por el índice de la clave primaria.
+--
+-- fn_avanzar_checkpoint_stock() corre el corte hacia adelante de forma
+-- incremental (saldo anterior + movimientos nuevos). La llama la app en cada
+-- auditoría y `mantenimiento.py checkpoint-stock` para hacerlo periódico.
+-- ==========================================================
+
+CREATE TABLE IF NOT EXISTS stock_checkpoints (
+    id_producto          integer PRIMARY KEY REFERENCES productos (id_producto),
+    id_movimiento_hasta  bigint NOT NULL,
+    saldo_movimientos    bigint NOT NULL,
+    creado               timestamptz NOT NULL DEFAULT NOW(),
+    verificado           timestamptz,          -- última auditoría en la que cerró
+    diferencia           integer               -- resultado de la última auditoría
+);
+
+-- MIN(id_movimiento_hasta) es el punto desde donde se suman movimientos
+CREATE INDEX IF NOT EXISTS ix_stock_checkpoints_hasta ON stock_checkpoints (id_movimiento_hasta);
+
+
+CREATE OR REPLACE FUNCTION fn_avanzar_checkpoint_stock() RETURNS bigint AS $$
+DECLARE
+    v_hasta  bigint;
+    v_minimo bigint;
+BEGIN
+    -- El corte es un movimiento de hace más de 5 minutos: un id menor que no
+    -- estuviera confirmado todavía sería de una transacción abierta desde
+    -- antes, y la app corta todo a los 15 s (statement_timeout).
+    SELECT id_movimiento INTO v_hasta
+    FROM inventario_movimientos
+    WHERE fecha < NOW() - INTERVAL '5 minutes'
+    ORDER BY fecha DESC, id_movimiento DESC
+    LIMIT 1;
+
+    SELECT MIN(id_movimiento_hasta) INTO v_minimo FROM stock_checkpoints;
+    IF v_hasta IS NULL OR v_hasta <= COALESCE(v_minimo, 0) THEN
+        RETURN v_minimo;
+    END IF;
+
+    INSERT INTO stock_checkpoints (id_producto, id_movimiento_hasta, saldo_movimientos, creado)
+    SELECT p.id_producto, v_hasta, COALESCE(ck.saldo_movimientos, 0) + COALESCE(d.suma, 0), NOW()
+    FROM productos p
+    LEFT JOIN stock_checkpoints ck ON ck.id_producto = p.id_producto
+    LEFT JOIN (
+        SELECT im.id_producto, SUM(im.cantidad) AS suma
+        FROM inventario_movimientos im
+        LEFT JOIN stock_checkpoints ck2 ON ck2.id_producto = im.id_producto
+        WHERE im.id_movimiento > COALESCE(v_minimo, 0)
+          AND im.id_movimiento > COALESCE(ck2.id_movimiento_hasta, v_minimo, 0)
+          AND im.id_movimiento <= v_hasta
+        GROUP BY im.id_producto
+    ) d ON d.id_producto = p.id_producto
+    ON CONFLICT (id_producto) DO UPDATE
+    SET id_movimiento_hasta = EXCLUDED.id_movimiento_hasta,
+        saldo_movimientos   = EXCLUDED.saldo_movimientos,
+        creado              = EXCLUDED.creado;
+
+    RETURN v_hasta;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Si se corrige o borra a mano un movimiento que ya está dentro de un
+-- checkpoint, el saldo guardado se ajusta en el mismo statement.
+CREATE OR REPLACE FUNCTION fn_checkpoint_movimiento_baja() RETURNS trigger AS $$
+BEGIN
+    UPDATE stock_checkpoints ck
+    SET saldo_movimientos = ck.saldo_movimientos - x.suma
+    FROM (
+        SELECT o.id_producto, SUM(o.cantidad) AS suma
+        FROM viejas o
+        JOIN stock_checkpoints c ON c.id_producto = o.id_producto AND o.id_movimiento <= c.id_movimiento_hasta
+        GROUP BY o.id_producto
+    ) x
+    WHERE ck.id_producto = x.id_producto;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE OR REPLACE FUNCTION fn_checkpoint_movimiento_cambio() RETURNS trigger AS $$
+BEGIN
+    UPDATE stock_checkpoints ck
+    SET saldo_movimientos = ck.saldo_movimientos + x.suma
+    FROM (
+        SELECT m.id_producto, SUM(m.cantidad) AS suma
+        FROM (
+            SELECT o.id_producto, o.id_movimiento, -o.cantidad AS cantidad FROM viejas o
+            UNION ALL
+            SELECT n.id_producto, n.id_movimiento, n.cantidad FROM nuevas n
+        ) m
+        JOIN stock_checkpoints c ON c.id_producto = m.id_producto AND m.id_movimiento <= c.id_movimiento_hasta
+        GROUP BY m.id_producto
+    ) x
+    WHERE ck.id_producto = x.id_producto;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+DROP TRIGGER IF EXISTS trg_checkpoint_movimiento_baja ON inventario_movimientos;
+CREATE TRIGGER trg_checkpoint_movimiento_baja
+    AFTER DELETE ON inventario_movimientos
+    REFERENCING OLD TABLE AS viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION fn_checkpoint_movimiento_baja();
+
+DROP TRIGGER IF EXISTS trg_checkpoint_movimiento_cambio ON inventario_movimientos;
+CREATE TRIGGER trg_checkpoint_movimiento_cambio
+    AFTER UPDATE ON inventario_movimientos
+    REFERENCING OLD TABLE AS viejas NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION fn_checkpoint_movimiento_cambio();
@@ -0,0 +1,68 @@
+-- ==========================================================
+-- AVISOS DE CAMBIOS (LISTEN/NOTIFY) PARA INVALIDAR CACHES
+--
+-- Cada statement que toca una tabla cacheada por la app manda UN aviso por
+-- el canal 'galpon_cambios' con {"tabla": ..., "ids": [...]}. El aviso sale
+-- recién con el COMMIT (si hay rollback no se manda) y Postgres junta los
+-- repetidos de la misma transacción. notificaciones.py lo escucha en cada
+-- proceso de Streamlit y limpia solo los caches de esa tabla.
+--
+-- Las ventas/compras/concesiones no necesitan trigger propio: sus triggers
+-- de stock actualizan productos, y eso ya avisa.
+-- ==========================================================
+
+CREATE OR REPLACE FUNCTION fn_notificar_cambios() RETURNS trigger AS $$
+DECLARE
+    v_ids integer[];
+BEGIN
+    -- TG_ARGV[0]: columna id de la tabla
+    IF TG_OP = 'DELETE' THEN
+        EXECUTE format('SELECT array_agg(DISTINCT %I) FROM viejas', TG_ARGV[0]) INTO v_ids;
+    ELSE
+        EXECUTE format('SELECT array_agg(DISTINCT %I) FROM nuevas', TG_ARGV[0]) INTO v_ids;
+    END IF;
+    IF v_ids IS NULL THEN
+        RETURN NULL;  -- el statement no tocó filas
+    END IF;
+    -- El payload tiene un máximo de 8000 bytes: en cambios masivos va sin ids
+    IF cardinality(v_ids) > 500 THEN
+        v_ids := NULL;
+    END IF;
+    PERFORM pg_notify('galpon_cambios', json_build_object('tabla', TG_TABLE_NAME, 'ids', v_ids)::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Una tabla de transición solo se puede usar con un evento por trigger:
+-- tres triggers por tabla que comparten la función.
+DO $$
+DECLARE
+    t record;
+BEGIN
+    FOR t IN
+        SELECT * FROM (VALUES
+            ('productos', 'id_producto'),
+            ('marcas', 'id_marca'),
+            ('clientes', 'id_cliente'),
+            ('proveedores', 'id_proveedor'),
+            ('ventas_diarias_producto', 'id_producto')
+        ) AS x(tabla, columna)
+    LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_notificar_alta ON %I', t.tabla);
+        EXECUTE format('CREATE TRIGGER trg_notificar_alta AFTER INSERT ON %I
+                        REFERENCING NEW TABLE AS nuevas
+                        FOR EACH STATEMENT EXECUTE FUNCTION fn_notificar_cambios(%L)', t.tabla, t.columna);
+
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_notificar_cambio ON %I', t.tabla);
+        EXECUTE format('CREATE TRIGGER trg_notificar_cambio AFTER UPDATE ON %I
+                        REFERENCING NEW TABLE AS nuevas
+                        FOR EACH STATEMENT EXECUTE FUNCTION fn_notificar_cambios(%L)', t.tabla, t.columna);
+
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_notificar_baja ON %I', t.tabla);
+        EXECUTE format('CREATE TRIGGER trg_notificar_baja AFTER DELETE ON %I
+                        REFERENCING OLD TABLE AS viejas
+                        FOR EACH STATEMENT EXECUTE FUNCTION fn_notificar_cambios(%L)', t.tabla, t.columna);
+    END LOOP;
+END;
+$$;
@@ -0,0 +1,98 @@
+-- ==========================================================
+-- CUBO DE VENTAS: DÍA x PRODUCTO x CLIENTE
+-- Lo mantienen los triggers de detalle_ventas (igual que el resumen
+-- diario de 001). La marca se toma de productos al consultar, así un cambio
+-- de marca no obliga a recalcular. Análisis y Reportes lee solo de acá:
+-- el costo depende del rango pedido, no del historial guardado.
+-- ==========================================================
+
+CREATE TABLE IF NOT EXISTS ventas_cubo (
+    fecha            date    NOT NULL,
+    id_producto      integer NOT NULL REFERENCES productos (id_producto),
+    id_cliente       integer NOT NULL REFERENCES clientes (id_cliente),
+    unidades_reales  numeric NOT NULL DEFAULT 0,
+    ingresos         numeric NOT NULL DEFAULT 0,
+    costo            numeric NOT NULL DEFAULT 0,
+    lineas           integer NOT NULL DEFAULT 0,
+    PRIMARY KEY (fecha, id_producto, id_cliente)
+);
+
+-- Drill-down por producto o por cliente dentro de un rango de fechas
+CREATE INDEX IF NOT EXISTS ix_ventas_cubo_producto ON ventas_cubo (id_producto, fecha);
+CREATE INDEX IF NOT EXISTS ix_ventas_cubo_cliente  ON ventas_cubo (id_cliente, fecha);
+
+
+CREATE OR REPLACE FUNCTION fn_ventas_cubo_alta() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO ventas_cubo AS vc (fecha, id_producto, id_cliente, unidades_reales, ingresos, costo, lineas)
+    SELECT v.fecha::date,
+           n.id_producto,
+           v.id_cliente,
+           SUM(n.cantidad_formato * CASE WHEN n.formato_venta = 'Caja' THEN p.unidades_por_caja ELSE 1 END),
+           SUM(n.cantidad_formato * CASE WHEN n.formato_venta = 'Caja' THEN p.unidades_por_caja ELSE 1 END
+               * n.precio_unitario_historico),
+           SUM(n.cantidad_formato * CASE WHEN n.formato_venta = 'Caja' THEN p.unidades_por_caja ELSE 1 END
+               * p.precio_costo_promedio),
+           COUNT(*)
+    FROM nuevas n
+    JOIN ventas v ON v.id_venta = n.id_venta
+    JOIN productos p ON p.id_producto = n.id_producto
+    GROUP BY v.fecha::date, n.id_producto, v.id_cliente
+    ON CONFLICT (fecha, id_producto, id_cliente) DO UPDATE
+        SET unidades_reales = vc.unidades_reales + EXCLUDED.unidades_reales,
+            ingresos        = vc.ingresos + EXCLUDED.ingresos,
+            costo           = vc.costo + EXCLUDED.costo,
+            lineas          = vc.lineas + EXCLUDED.lineas;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE OR REPLACE FUNCTION fn_ventas_cubo_baja() RETURNS trigger AS $$
+BEGIN
+    UPDATE ventas_cubo vc
+    SET unidades_reales = vc.unidades_reales - b.unidades,
+        ingresos        = vc.ingresos - b.ingresos,
+        costo           = vc.costo - b.costo,
+        lineas          = vc.lineas - b.lineas
+    FROM (
+        SELECT v.fecha::date AS fecha,
+               o.id_producto,
+               v.id_cliente,
+               SUM(o.cantidad_formato * CASE WHEN o.formato_venta = 'Caja' THEN p.unidades_por_caja ELSE 1 END) AS unidades,
+               SUM(o.cantidad_formato * CASE WHEN o.formato_venta = 'Caja' THEN p.unidades_por_caja ELSE 1 END
+                   * o.precio_unitario_historico) AS ingresos,
+               SUM(o.cantidad_formato * CASE WHEN o.formato_venta = 'Caja' THEN p.unidades_por_caja ELSE 1 END
+                   * p.precio_costo_promedio) AS costo,
+               COUNT(*) AS lineas
+        FROM viejas o
+        JOIN ventas v ON v.id_venta = o.id_venta
+        JOIN productos p ON p.id_producto = o.id_producto
+        GROUP BY v.fecha::date, o.id_producto, v.id_cliente
+    ) b
+    WHERE vc.fecha = b.fecha AND vc.id_producto = b.id_producto AND vc.id_cliente = b.id_cliente;
+
+    -- Las celdas sin líneas se borran (solo miramos las tocadas)
+    DELETE FROM ventas_cubo vc
+    USING viejas o
+    JOIN ventas v ON v.id_venta = o.id_venta
+    WHERE vc.fecha = v.fecha::date
+      AND vc.id_producto = o.id_producto
+      AND vc.id_cliente = v.id_cliente
+      AND vc.lineas = 0;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+DROP TRIGGER IF EXISTS trg_ventas_cubo_alta ON detalle_ventas;
+CREATE TRIGGER trg_ventas_cubo_alta
+    AFTER INSERT ON detalle_ventas
+    REFERENCING NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION fn_ventas_cubo_alta();
+
+DROP TRIGGER IF EXISTS trg_ventas_cubo_baja ON detalle_ventas;
+CREATE TRIGGER trg_ventas_cubo_baja
+    AFTER DELETE ON detalle_ventas
+    REFERENCING OLD TABLE AS viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION fn_ventas_cubo_baja();
@@ -0,0 +1,7 @@
+-- ==========================================================
+-- ÍNDICE PARA EXPORTAR EL HISTORIAL DE PRECIOS POR RANGO
+-- Las otras exportaciones usan los índices (fecha, id) de 002.
+-- ==========================================================
+
+CREATE INDEX IF NOT EXISTS ix_historial_precios_fecha_id
+    ON historial_precios (fecha, id_historial);
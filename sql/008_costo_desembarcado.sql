@@ -0,0 +1,186 @@
+-- ==========================================================
+-- COSTO DESEMBARCADO (FLETE PRORRATEADO) GUARDADO POR LÍNEA
+--
+-- El flete de cada compra se reparte entre sus líneas UNA vez, al grabar,
+-- en proporción al valor neto de la línea (cantidad x costo neto; si la
+-- factura vale $0, por unidades). Cada línea guarda su parte del flete y el
+-- costo real por unidad:
+--     costo_real = precio_compra_neto + flete_asignado / cantidad_unidades
+-- registrar_compra() lo calcula en el mismo INSERT; fn_prorratear_flete()
+-- aplica la misma regla a compras ya grabadas (backfill y correcciones).
+--
+-- Los triggers de stock usan el costo guardado: el alta actualiza el costo
+-- promedio ponderado con ese valor y la baja de una compra resta
+-- exactamente lo mismo que sumó el alta, aunque después se haya tocado la
+-- cabecera. fn_recalcular_costo_promedio() rearma el promedio de todos los
+-- productos desde el historial de compras, de una vez.
+-- ==========================================================
+
+ALTER TABLE detalle_compras ADD COLUMN IF NOT EXISTS flete_asignado numeric(14, 4);
+ALTER TABLE detalle_compras ADD COLUMN IF NOT EXISTS costo_real     numeric(12, 4);
+
+
+CREATE OR REPLACE FUNCTION fn_prorratear_flete(p_compras integer[]) RETURNS integer AS $$
+DECLARE
+    v_filas integer;
+BEGIN
+    -- p_compras NULL = todas las compras
+    UPDATE detalle_compras dc
+    SET flete_asignado = x.flete,
+        costo_real     = dc.precio_compra_neto + COALESCE(x.flete / NULLIF(dc.cantidad_unidades, 0), 0)
+    FROM (
+        SELECT d.id_detalle,
+               c.costo_flete * CASE
+                   WHEN SUM(d.cantidad_unidades * d.precio_compra_neto) OVER w > 0
+                   THEN d.cantidad_unidades * d.precio_compra_neto
+                        / SUM(d.cantidad_unidades * d.precio_compra_neto) OVER w
+                   ELSE d.cantidad_unidades / NULLIF(SUM(d.cantidad_unidades) OVER w, 0)::numeric
+               END AS flete
+        FROM detalle_compras d
+        JOIN compras c ON c.id_compra = d.id_compra
+        WHERE p_compras IS NULL OR d.id_compra = ANY(p_compras)
+        WINDOW w AS (PARTITION BY d.id_compra)
+    ) x
+    WHERE dc.id_detalle = x.id_detalle
+      AND (dc.flete_asignado, dc.costo_real) IS DISTINCT FROM
+          (x.flete, dc.precio_compra_neto + COALESCE(x.flete / NULLIF(dc.cantidad_unidades, 0), 0));
+    GET DIAGNOSTICS v_filas = ROW_COUNT;
+    RETURN v_filas;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Compras anteriores a esta migración
+SELECT fn_prorratear_flete(NULL);
+
+
+-- Mismo promedio ponderado que en 003, pero con el costo guardado en la línea
+-- (si alguien inserta sin costo_real se usa la fórmula de la cabecera)
+CREATE OR REPLACE FUNCTION fn_stock_compra_alta() RETURNS trigger AS $$
+BEGIN
+    WITH lineas AS (
+        SELECT n.id_producto,
+               n.cantidad_unidades AS cantidad,
+               COALESCE(n.costo_real, n.precio_compra_neto
+                   * (1 + COALESCE(c.costo_flete / NULLIF(c.total_compra - c.costo_flete, 0), 0))) AS costo_real
+        FROM nuevas n
+        JOIN compras c ON c.id_compra = n.id_compra
+    ), movimientos AS (
+        INSERT INTO inventario_movimientos (id_producto, tipo, cantidad, fecha)
+        SELECT id_producto, 'COMPRA', SUM(cantidad), NOW()
+        FROM lineas
+        GROUP BY id_producto
+    )
+    UPDATE productos p
+    SET precio_costo_promedio = CASE
+            WHEN GREATEST(p.stock_actual + p.stock_concesion, 0) + x.cantidad > 0
+            THEN (GREATEST(p.stock_actual + p.stock_concesion, 0) * p.precio_costo_promedio + x.valor)
+                 / (GREATEST(p.stock_actual + p.stock_concesion, 0) + x.cantidad)
+            ELSE p.precio_costo_promedio
+        END,
+        stock_actual = p.stock_actual + x.cantidad
+    FROM (
+        SELECT id_producto, SUM(cantidad) AS cantidad, SUM(cantidad * costo_real) AS valor
+        FROM lineas
+        GROUP BY id_producto
+    ) x
+    WHERE p.id_producto = x.id_producto;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Inversa exacta del alta: saca del promedio el mismo valor que sumó
+CREATE OR REPLACE FUNCTION fn_stock_compra_baja() RETURNS trigger AS $$
+BEGIN
+    WITH lineas AS (
+        SELECT o.id_producto,
+               o.cantidad_unidades AS cantidad,
+               COALESCE(o.costo_real, o.precio_compra_neto
+                   * (1 + COALESCE(c.costo_flete / NULLIF(c.total_compra - c.costo_flete, 0), 0))) AS costo_real
+        FROM viejas o
+        JOIN compras c ON c.id_compra = o.id_compra
+    ), movimientos AS (
+        INSERT INTO inventario_movimientos (id_producto, tipo, cantidad, fecha)
+        SELECT id_producto, 'ANULACION_COMPRA', -SUM(cantidad), NOW()
+        FROM lineas
+        GROUP BY id_producto
+    )
+    UPDATE productos p
+    SET precio_costo_promedio = CASE
+            WHEN p.stock_actual + p.stock_concesion - x.cantidad > 0
+            THEN ((p.stock_actual + p.stock_concesion) * p.precio_costo_promedio - x.valor)
+                 / (p.stock_actual + p.stock_concesion - x.cantidad)
+            ELSE p.precio_costo_promedio
+        END,
+        stock_actual = p.stock_actual - x.cantidad
+    FROM (
+        SELECT id_producto, SUM(cantidad) AS cantidad, SUM(cantidad * costo_real) AS valor
+        FROM lineas
+        GROUP BY id_producto
+    ) x
+    WHERE p.id_producto = x.id_producto;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Rearma precio_costo_promedio de todos los productos con compras, en el
+-- orden en que se hicieron: promedio = (stock previo x promedio anterior +
+-- valor comprado) / (stock previo + cantidad). El stock previo sale de los
+-- movimientos anteriores a cada compra. Todos los productos avanzan juntos
+-- (un paso de la recursión por compra), no uno por uno. El stock anterior a
+-- la primera compra (STOCK_INICIAL) se valúa al costo de esa compra.
+CREATE OR REPLACE FUNCTION fn_recalcular_costo_promedio() RETURNS integer AS $$
+DECLARE
+    v_filas integer;
+BEGIN
+    DROP TABLE IF EXISTS tmp_recosteo;
+    CREATE TEMP TABLE tmp_recosteo ON COMMIT DROP AS
+    SELECT x.id_producto,
+           ROW_NUMBER() OVER (PARTITION BY x.id_producto ORDER BY x.fecha, x.id_compra) AS n,
+           x.cantidad,
+           x.valor,
+           GREATEST(COALESCE((
+               SELECT SUM(im.cantidad)
+               FROM inventario_movimientos im
+               WHERE im.id_producto = x.id_producto AND im.fecha < x.fecha
+           ), 0), 0) AS stock_previo
+    FROM (
+        SELECT dc.id_producto, c.id_compra, c.fecha,
+               SUM(dc.cantidad_unidades) AS cantidad,
+               SUM(dc.cantidad_unidades * COALESCE(dc.costo_real, dc.precio_compra_neto)) AS valor
+        FROM detalle_compras dc
+        JOIN compras c ON c.id_compra = dc.id_compra
+        GROUP BY dc.id_producto, c.id_compra, c.fecha
+    ) x
+    WHERE x.cantidad > 0;
+
+    CREATE INDEX ON tmp_recosteo (id_producto, n);
+    ANALYZE tmp_recosteo;
+
+    WITH RECURSIVE costo AS (
+        SELECT id_producto, n, valor / cantidad AS promedio
+        FROM tmp_recosteo
+        WHERE n = 1
+        UNION ALL
+        SELECT t.id_producto, t.n,
+               CASE WHEN t.stock_previo + t.cantidad > 0
+                    THEN (t.stock_previo * c.promedio + t.valor) / (t.stock_previo + t.cantidad)
+                    ELSE c.promedio
+               END
+        FROM costo c
+        JOIN tmp_recosteo t ON t.id_producto = c.id_producto AND t.n = c.n + 1
+    )
+    UPDATE productos p
+    SET precio_costo_promedio = ROUND(u.promedio, 4)
+    FROM (
+        SELECT DISTINCT ON (id_producto) id_producto, promedio
+        FROM costo
+        ORDER BY id_producto, n DESC
+    ) u
+    WHERE p.id_producto = u.id_producto
+      AND p.precio_costo_promedio IS DISTINCT FROM ROUND(u.promedio, 4);
+    GET DIAGNOSTICS v_filas = ROW_COUNT;
+    RETURN v_filas;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,187 @@
+-- ==========================================================
+-- HECHOS DE VENTA COMPLETOS EN detalle_ventas
+--
+-- Cada línea guarda sus unidades reales (cantidad_formato x
+-- unidades_por_caja si es Caja) y el costo unitario del momento de la
+-- venta. Los graba la app (carrito de Ventas y liquidación de
+-- Concesiones); los triggers del resumen diario, del cubo y del stock ya no
+-- juntan con productos para calcularlos, y el margen histórico no se mueve
+-- cuando después cambia el costo promedio. La baja de una línea resta
+-- exactamente el costo con el que se sumó.
+--
+-- Backfill: las líneas viejas toman el costo promedio ACTUAL del producto
+-- (el del momento de la venta no quedó guardado línea por línea).
+-- ==========================================================
+
+ALTER TABLE detalle_ventas ADD COLUMN IF NOT EXISTS unidades_reales integer;
+ALTER TABLE detalle_ventas ADD COLUMN IF NOT EXISTS costo_unitario  numeric(12, 4);
+
+UPDATE detalle_ventas dv
+SET unidades_reales = dv.cantidad_formato * CASE WHEN dv.formato_venta = 'Caja' THEN p.unidades_por_caja ELSE 1 END,
+    costo_unitario  = p.precio_costo_promedio
+FROM productos p
+WHERE p.id_producto = dv.id_producto
+  AND (dv.unidades_reales IS NULL OR dv.costo_unitario IS NULL);
+
+ALTER TABLE detalle_ventas ALTER COLUMN unidades_reales SET NOT NULL;
+ALTER TABLE detalle_ventas ALTER COLUMN costo_unitario  SET NOT NULL;
+
+
+-- --- Resumen diario (001) ---
+
+CREATE OR REPLACE FUNCTION fn_ventas_diarias_alta() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO ventas_diarias_producto AS vdp (fecha, id_producto, unidades_reales, ingresos, costo)
+    SELECT v.fecha::date,
+           n.id_producto,
+           SUM(n.unidades_reales),
+           SUM(n.unidades_reales * n.precio_unitario_historico),
+           SUM(n.unidades_reales * n.costo_unitario)
+    FROM nuevas n
+    JOIN ventas v ON v.id_venta = n.id_venta
+    GROUP BY v.fecha::date, n.id_producto
+    ON CONFLICT (fecha, id_producto) DO UPDATE
+        SET unidades_reales = vdp.unidades_reales + EXCLUDED.unidades_reales,
+            ingresos        = vdp.ingresos + EXCLUDED.ingresos,
+            costo           = vdp.costo + EXCLUDED.costo;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE OR REPLACE FUNCTION fn_ventas_diarias_baja() RETURNS trigger AS $$
+BEGIN
+    UPDATE ventas_diarias_producto vdp
+    SET unidades_reales = vdp.unidades_reales - b.unidades,
+        ingresos        = vdp.ingresos - b.ingresos,
+        costo           = vdp.costo - b.costo
+    FROM (
+        SELECT v.fecha::date AS fecha,
+               o.id_producto,
+               SUM(o.unidades_reales) AS unidades,
+               SUM(o.unidades_reales * o.precio_unitario_historico) AS ingresos,
+               SUM(o.unidades_reales * o.costo_unitario) AS costo
+        FROM viejas o
+        JOIN ventas v ON v.id_venta = o.id_venta
+        GROUP BY v.fecha::date, o.id_producto
+    ) b
+    WHERE vdp.fecha = b.fecha AND vdp.id_producto = b.id_producto;
+
+    DELETE FROM ventas_diarias_producto vdp
+    USING viejas o
+    JOIN ventas v ON v.id_venta = o.id_venta
+    WHERE vdp.fecha = v.fecha::date
+      AND vdp.id_producto = o.id_producto
+      AND vdp.unidades_reales = 0
+      AND vdp.ingresos = 0;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- --- Cubo (006) ---
+
+CREATE OR REPLACE FUNCTION fn_ventas_cubo_alta() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO ventas_cubo AS vc (fecha, id_producto, id_cliente, unidades_reales, ingresos, costo, lineas)
+    SELECT v.fecha::date,
+           n.id_producto,
+           v.id_cliente,
+           SUM(n.unidades_reales),
+           SUM(n.unidades_reales * n.precio_unitario_historico),
+           SUM(n.unidades_reales * n.costo_unitario),
+           COUNT(*)
+    FROM nuevas n
+    JOIN ventas v ON v.id_venta = n.id_venta
+    GROUP BY v.fecha::date, n.id_producto, v.id_cliente
+    ON CONFLICT (fecha, id_producto, id_cliente) DO UPDATE
+        SET unidades_reales = vc.unidades_reales + EXCLUDED.unidades_reales,
+            ingresos        = vc.ingresos + EXCLUDED.ingresos,
+            costo           = vc.costo + EXCLUDED.costo,
+            lineas          = vc.lineas + EXCLUDED.lineas;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE OR REPLACE FUNCTION fn_ventas_cubo_baja() RETURNS trigger AS $$
+BEGIN
+    UPDATE ventas_cubo vc
+    SET unidades_reales = vc.unidades_reales - b.unidades,
+        ingresos        = vc.ingresos - b.ingresos,
+        costo           = vc.costo - b.costo,
+        lineas          = vc.lineas - b.lineas
+    FROM (
+        SELECT v.fecha::date AS fecha,
+               o.id_producto,
+               v.id_cliente,
+               SUM(o.unidades_reales) AS unidades,
+               SUM(o.unidades_reales * o.precio_unitario_historico) AS ingresos,
+               SUM(o.unidades_reales * o.costo_unitario) AS costo,
+               COUNT(*) AS lineas
+        FROM viejas o
+        JOIN ventas v ON v.id_venta = o.id_venta
+        GROUP BY v.fecha::date, o.id_producto, v.id_cliente
+    ) b
+    WHERE vc.fecha = b.fecha AND vc.id_producto = b.id_producto AND vc.id_cliente = b.id_cliente;
+
+    DELETE FROM ventas_cubo vc
+    USING viejas o
+    JOIN ventas v ON v.id_venta = o.id_venta
+    WHERE vc.fecha = v.fecha::date
+      AND vc.id_producto = o.id_producto
+      AND vc.id_cliente = v.id_cliente
+      AND vc.lineas = 0;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- --- Stock (003) ---
+
+CREATE OR REPLACE FUNCTION fn_stock_venta_alta() RETURNS trigger AS $$
+BEGIN
+    WITH movimientos AS (
+        INSERT INTO inventario_movimientos (id_producto, tipo, cantidad, fecha)
+        SELECT id_producto, CASE WHEN es_concesion THEN 'VENTA_CONCESION' ELSE 'VENTA' END, -SUM(unidades_reales), NOW()
+        FROM nuevas
+        GROUP BY id_producto, es_concesion
+    )
+    UPDATE productos p
+    SET stock_actual    = p.stock_actual    - x.fisico,
+        stock_concesion = p.stock_concesion - x.concesion
+    FROM (
+        SELECT id_producto,
+               COALESCE(SUM(unidades_reales) FILTER (WHERE NOT es_concesion), 0) AS fisico,
+               COALESCE(SUM(unidades_reales) FILTER (WHERE es_concesion), 0) AS concesion
+        FROM nuevas
+        GROUP BY id_producto
+    ) x
+    WHERE p.id_producto = x.id_producto;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE OR REPLACE FUNCTION fn_stock_venta_baja() RETURNS trigger AS $$
+BEGIN
+    WITH movimientos AS (
+        INSERT INTO inventario_movimientos (id_producto, tipo, cantidad, fecha)
+        SELECT id_producto, 'ANULACION_VENTA', SUM(unidades_reales), NOW()
+        FROM viejas
+        GROUP BY id_producto
+    )
+    UPDATE productos p
+    SET stock_actual    = p.stock_actual    + x.fisico,
+        stock_concesion = p.stock_concesion + x.concesion
+    FROM (
+        SELECT id_producto,
+               COALESCE(SUM(unidades_reales) FILTER (WHERE NOT es_concesion), 0) AS fisico,
+               COALESCE(SUM(unidades_reales) FILTER (WHERE es_concesion), 0) AS concesion
+        FROM viejas
+        GROUP BY id_producto
+    ) x
+    WHERE p.id_producto = x.id_producto;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
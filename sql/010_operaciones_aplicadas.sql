@@ -0,0 +1,16 @@
+-- ==========================================================
+-- CLAVES DE IDEMPOTENCIA DE LA COLA LOCAL (cola.py)
+--
+-- Cada venta/compra que llega desde la cola local deja su clave en esta
+-- tabla en la MISMA transacción en que se graba. Si el replicador se cae
+-- después del COMMIT y la vuelve a mandar, el INSERT ... ON CONFLICT DO
+-- NOTHING la reconoce y se devuelve el id ya grabado: no hay duplicados,
+-- aunque dos procesos repliquen el mismo diario a la vez.
+-- ==========================================================
+
+CREATE TABLE IF NOT EXISTS operaciones_aplicadas (
+    clave      uuid PRIMARY KEY,
+    tipo       text NOT NULL,
+    id_remoto  integer,
+    aplicada   timestamptz NOT NULL DEFAULT NOW()
+);
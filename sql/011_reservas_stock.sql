@@ -0,0 +1,44 @@
+-- ==========================================================
+-- RESERVAS DE STOCK DE LOS CARRITOS (reservas.py)
+--
+-- Agregar un producto al carrito de Ventas o de Concesiones deja una
+-- reserva con vencimiento; el stock disponible para los demás vendedores es
+-- stock_actual menos las reservas vigentes. Las reservas son filas propias
+-- (no se toca productos), así que dos carritos con el mismo producto no
+-- esperan uno al otro sobre su fila.
+--
+-- Al confirmar, la transacción que graba la venta/concesión borra las
+-- reservas de su carrito (FOR UPDATE SKIP LOCKED) y los triggers de stock
+-- descuentan todo el detalle en un solo UPDATE. Un carrito abandonado deja
+-- de renovar sus reservas: vencen solas y dejan de contar.
+-- ==========================================================
+
+CREATE TABLE IF NOT EXISTS reservas_stock (
+    id_reserva   bigserial PRIMARY KEY,
+    carrito      uuid NOT NULL,
+    id_producto  integer NOT NULL REFERENCES productos (id_producto) ON DELETE CASCADE,
+    cantidad     integer NOT NULL CHECK (cantidad > 0),
+    creada       timestamptz NOT NULL DEFAULT NOW(),
+    vence        timestamptz NOT NULL
+);
+
+-- Disponible por producto: suma de las vigentes sin ir a la tabla
+CREATE INDEX IF NOT EXISTS ix_reservas_stock_producto ON reservas_stock (id_producto, vence) INCLUDE (cantidad);
+CREATE INDEX IF NOT EXISTS ix_reservas_stock_carrito  ON reservas_stock (carrito);
+
+
+-- Limpieza de vencidas: saltea las que otra transacción está confirmando
+CREATE OR REPLACE FUNCTION fn_liberar_reservas_vencidas() RETURNS integer AS $$
+DECLARE
+    v_filas integer;
+BEGIN
+    DELETE FROM reservas_stock r
+    WHERE r.id_reserva IN (
+        SELECT id_reserva FROM reservas_stock
+        WHERE vence < NOW()
+        FOR UPDATE SKIP LOCKED
+    );
+    GET DIAGNOSTICS v_filas = ROW_COUNT;
+    RETURN v_filas;
+END;
+$$ LANGUAGE plpgsql;
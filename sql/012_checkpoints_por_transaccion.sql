@@ -0,0 +1,116 @@
+-- ==========================================================
+-- CORTE DE LOS CHECKPOINTS DE STOCK POR VISIBILIDAD (reemplaza el de 004)
+--
+-- El corte de 004 tomaba el último movimiento con fecha de hace más de
+-- 5 minutos y daba por confirmados todos los de id menor. No es cierto: el
+-- id se toma al insertar, fecha es el NOW() del comienzo de la transacción
+-- y statement_timeout corta statements, no transacciones (mantenimiento
+-- corre sin timeout). Un movimiento con id bajo que confirmaba después del
+-- corte quedaba afuera para siempre y la auditoría daba una diferencia falsa.
+-- (El comentario de fn_avanzar_checkpoint_stock en 004 que lo justifica
+-- queda sin efecto: 004 ya se aplicó y no se toca.)
+--
+-- Ahora cada movimiento guarda el xid de la transacción que lo grabó y el
+-- checkpoint cubre los movimientos con xid menor que transaccion_hasta.
+-- El corte es el xmin de la foto actual (pg_snapshot_xmin): toda
+-- transacción con xid menor ya terminó, así que lo que cubre el checkpoint
+-- no cambia más (salvo UPDATE/DELETE a mano, que ajustan los triggers).
+-- Requiere Postgres 13+ (xid8).
+-- ==========================================================
+
+-- Las filas existentes quedan con el primer xid normal (3): anteriores a
+-- cualquier corte. El DEFAULT constante no reescribe la tabla.
+ALTER TABLE inventario_movimientos ADD COLUMN IF NOT EXISTS transaccion xid8 NOT NULL DEFAULT '3';
+ALTER TABLE inventario_movimientos ALTER COLUMN transaccion SET DEFAULT pg_current_xact_id();
+
+-- La auditoría suma los movimientos posteriores al corte por este índice
+CREATE INDEX IF NOT EXISTS ix_inventario_movimientos_transaccion
+    ON inventario_movimientos (transaccion) INCLUDE (id_producto, cantidad);
+
+-- Los saldos guardados con el corte viejo pueden haber perdido movimientos:
+-- se rearman desde cero en la primera auditoría / checkpoint-stock
+TRUNCATE stock_checkpoints;
+ALTER TABLE stock_checkpoints DROP COLUMN IF EXISTS id_movimiento_hasta;
+ALTER TABLE stock_checkpoints ADD COLUMN IF NOT EXISTS transaccion_hasta xid8 NOT NULL;
+
+-- MIN(transaccion_hasta) es el punto desde donde se suman movimientos
+CREATE INDEX IF NOT EXISTS ix_stock_checkpoints_transaccion ON stock_checkpoints (transaccion_hasta);
+
+
+-- Retorna el último id de movimiento cubierto (informativo)
+CREATE OR REPLACE FUNCTION fn_avanzar_checkpoint_stock() RETURNS bigint AS $$
+DECLARE
+    v_corte  xid8;
+    v_minimo xid8;
+BEGIN
+    -- Las transacciones abiertas (aunque sus movimientos tengan id menor)
+    -- tienen xid >= xmin: quedan para el próximo corte
+    v_corte := pg_snapshot_xmin(pg_current_snapshot());
+    SELECT MIN(transaccion_hasta) INTO v_minimo FROM stock_checkpoints;
+
+    IF v_minimo IS NULL OR v_corte > v_minimo THEN
+        INSERT INTO stock_checkpoints (id_producto, transaccion_hasta, saldo_movimientos, creado)
+        SELECT p.id_producto, v_corte, COALESCE(ck.saldo_movimientos, 0) + COALESCE(d.suma, 0), NOW()
+        FROM productos p
+        LEFT JOIN stock_checkpoints ck ON ck.id_producto = p.id_producto
+        LEFT JOIN (
+            SELECT im.id_producto, SUM(im.cantidad) AS suma
+            FROM inventario_movimientos im
+            LEFT JOIN stock_checkpoints ck2 ON ck2.id_producto = im.id_producto
+            WHERE im.transaccion >= COALESCE(v_minimo, '0')
+              AND im.transaccion >= COALESCE(ck2.transaccion_hasta, v_minimo, '0')
+              AND im.transaccion < v_corte
+            GROUP BY im.id_producto
+        ) d ON d.id_producto = p.id_producto
+        ON CONFLICT (id_producto) DO UPDATE
+        SET transaccion_hasta = EXCLUDED.transaccion_hasta,
+            saldo_movimientos = EXCLUDED.saldo_movimientos,
+            creado            = EXCLUDED.creado;
+        v_minimo := v_corte;
+    END IF;
+
+    RETURN (
+        SELECT id_movimiento FROM inventario_movimientos
+        WHERE transaccion < v_minimo
+        ORDER BY id_movimiento DESC
+        LIMIT 1
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Corrección o baja a mano de un movimiento ya cubierto por el checkpoint
+CREATE OR REPLACE FUNCTION fn_checkpoint_movimiento_baja() RETURNS trigger AS $$
+BEGIN
+    UPDATE stock_checkpoints ck
+    SET saldo_movimientos = ck.saldo_movimientos - x.suma
+    FROM (
+        SELECT o.id_producto, SUM(o.cantidad) AS suma
+        FROM viejas o
+        JOIN stock_checkpoints c ON c.id_producto = o.id_producto AND o.transaccion < c.transaccion_hasta
+        GROUP BY o.id_producto
+    ) x
+    WHERE ck.id_producto = x.id_producto;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE OR REPLACE FUNCTION fn_checkpoint_movimiento_cambio() RETURNS trigger AS $$
+BEGIN
+    UPDATE stock_checkpoints ck
+    SET saldo_movimientos = ck.saldo_movimientos + x.suma
+    FROM (
+        SELECT m.id_producto, SUM(m.cantidad) AS suma
+        FROM (
+            SELECT o.id_producto, o.transaccion, -o.cantidad AS cantidad FROM viejas o
+            UNION ALL
+            SELECT n.id_producto, n.transaccion, n.cantidad FROM nuevas n
+        ) m
+        JOIN stock_checkpoints c ON c.id_producto = m.id_producto AND m.transaccion < c.transaccion_hasta
+        GROUP BY m.id_producto
+    ) x
+    WHERE ck.id_producto = x.id_producto;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,68 @@
+-- ==========================================================
+-- REEMPLAZO DE LOS TRIGGERS DE STOCK VIEJOS (FILA POR FILA)
+--
+-- 003 no instalaba los triggers de stock si detalle_ventas,
+-- detalle_compras o detalle_concesiones ya tenían triggers propios, para
+-- no descontar el stock dos veces. En la base de producción eso quiere
+-- decir que seguían corriendo los triggers viejos FOR EACH ROW y nunca se
+-- instalaban los de 003 (un UPDATE agrupado por producto por statement).
+--
+-- Esta migración los reemplaza de forma explícita, en su transacción:
+-- borra todo trigger de usuario sobre esas tablas que no sea de la app
+-- (avisa con NOTICE cuál borra) y crea los de stock con las funciones
+-- vigentes (003, con los cambios de 008 y 009). Si algo falla, el rollback
+-- deja los triggers viejos como estaban.
+--
+-- Desde acá rige la convención de 003 en todas las bases: los movimientos
+-- suman el stock TOTAL propio (físico + concesión); mandar o devolver
+-- mercadería en concesión no genera movimiento.
+-- ==========================================================
+
+DO $$
+DECLARE
+    t record;
+BEGIN
+    FOR t IN
+        SELECT tg.tgname, tg.tgrelid::regclass AS tabla
+        FROM pg_trigger tg
+        WHERE tg.tgrelid IN ('detalle_ventas'::regclass, 'detalle_compras'::regclass, 'detalle_concesiones'::regclass)
+          AND NOT tg.tgisinternal
+          AND tg.tgname NOT LIKE 'trg_stock_%'
+          AND tg.tgname NOT LIKE 'trg_ventas_diarias_%'
+          AND tg.tgname NOT LIKE 'trg_ventas_cubo_%'
+    LOOP
+        RAISE NOTICE 'Se reemplaza el trigger % de %', t.tgname, t.tabla;
+        EXECUTE format('DROP TRIGGER %I ON %s', t.tgname, t.tabla);
+    END LOOP;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_stock_venta_alta ON detalle_ventas;
+CREATE TRIGGER trg_stock_venta_alta
+    AFTER INSERT ON detalle_ventas
+    REFERENCING NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION fn_stock_venta_alta();
+
+DROP TRIGGER IF EXISTS trg_stock_venta_baja ON detalle_ventas;
+CREATE TRIGGER trg_stock_venta_baja
+    AFTER DELETE ON detalle_ventas
+    REFERENCING OLD TABLE AS viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION fn_stock_venta_baja();
+
+DROP TRIGGER IF EXISTS trg_stock_compra_alta ON detalle_compras;
+CREATE TRIGGER trg_stock_compra_alta
+    AFTER INSERT ON detalle_compras
+    REFERENCING NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION fn_stock_compra_alta();
+
+DROP TRIGGER IF EXISTS trg_stock_compra_baja ON detalle_compras;
+CREATE TRIGGER trg_stock_compra_baja
+    AFTER DELETE ON detalle_compras
+    REFERENCING OLD TABLE AS viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION fn_stock_compra_baja();
+
+DROP TRIGGER IF EXISTS trg_stock_concesion_alta ON detalle_concesiones;
+CREATE TRIGGER trg_stock_concesion_alta
+    AFTER INSERT ON detalle_concesiones
+    REFERENCING NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION fn_stock_concesion_alta();
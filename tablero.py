@@ -0,0 +1,177 @@
+"""
+Foto (snapshot) del inventario para el Dashboard.
+
+Los hechos crudos (stock, mínimo, venta 30d, costo, precio) y los KPIs se
+traen de la base UNA vez por versión de datos y quedan en el cache del
+proceso (refresco.py): se muestra lo último calculado mientras se recalcula
+en segundo plano. Todo lo demás —clasificación en estados, filtros,
+alertas, Top 10 e histograma— se arma con numpy sobre esa foto, así que
+mover un umbral o un filtro no vuelve a consultar la base.
+"""
+import numpy as np
+import pandas as pd
+import streamlit as st
+from sqlalchemy import text
+
+import catalogo
+import refresco
+import rendimiento
+
+ESTADOS = ['🔴 SIN STOCK', '🟡 BAJO', '⚪ SIN ROTACIÓN', '🟢 OK']
+
+# Stock bajo: stock <= stock_minimo x factor_minimo
+# Sin rotación: vendió menos de rotacion_minima unidades en 30 días
+UMBRALES_POR_DEFECTO = {"factor_minimo": 1.0, "rotacion_minima": 1}
+
+
+@refresco.mantener(intervalo=catalogo.TTL_PRODUCTOS)
+def cargar_hechos(_engine):
+    """Una fila por producto con los datos crudos (sin clasificar), ordenada por venta"""
+    with _engine.connect() as conn, rendimiento.etiqueta("query_master"):
+        df = pd.read_sql(text("""
+            WITH VentasRecientes AS (
+                SELECT id_producto, SUM(unidades_reales) AS vendido_30d
+                FROM ventas_diarias_producto
+                WHERE fecha >= CURRENT_DATE - 30
+                GROUP BY id_producto
+            )
+            SELECT
+                p.id_producto,
+                p.nombre AS "Producto",
+                m.nombre AS "Marca",
+                p.stock_actual::int AS "Stock",
+                p.stock_minimo::int AS stock_minimo,
+                COALESCE(vr.vendido_30d, 0)::float8 AS "Venta 30d",
+                p.precio_costo_promedio::float8 AS "Costo Prorr",
+                p.precio_venta::float8 AS "Precio"
+            FROM productos p
+            JOIN marcas m ON p.id_marca = m.id_marca
+            LEFT JOIN VentasRecientes vr ON p.id_producto = vr.id_producto
+            ORDER BY "Venta 30d" DESC, p.id_producto
+        """), conn)
+    df['Marca'] = df['Marca'].astype('category')
+    return df
+
+
+def armar_snapshot(_engine, factor_minimo, rotacion_minima):
+    """Foto clasificada con los umbrales dados: {'df', 'por_estado', 'por_marca'}"""
+    hechos, calculado = cargar_hechos.con_momento(_engine)
+    return _clasificar(hechos, factor_minimo, rotacion_minima, calculado)
+
+
+# 'calculado' identifica la versión de los hechos: cuando el refresco trae
+# datos nuevos cambia la clave y se clasifica de nuevo
+@st.cache_data(max_entries=16, show_spinner=False)
+def _clasificar(_hechos, factor_minimo, rotacion_minima, calculado):
+    df = _hechos.copy()
+    stock = df['Stock'].to_numpy()
+    venta = df['Venta 30d'].to_numpy()
+    costo = df['Costo Prorr'].to_numpy()
+    precio = df['Precio'].to_numpy()
+
+    # Columnas derivadas (antes salían del SQL)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        df['Costo Prorr'] = np.round(costo, 2)
+        df['Margen %'] = np.round(np.where(precio != 0, (precio - costo) / precio * 100, np.nan), 1)
+        df['Valor Stock'] = np.round(stock * costo, 2)
+        df['Días Stock'] = np.round(np.where(venta > 0, stock / (venta / 30.0), np.nan), 1)
+
+    # Estado: el primer caso que se cumple, en el orden de ESTADOS
+    codigos = np.select(
+        [stock <= 0,
+         stock <= df['stock_minimo'].to_numpy() * factor_minimo,
+         venta < rotacion_minima],
+        [0, 1, 2],
+        default=3
+    ).astype(np.int8)
+    df['Estado'] = pd.Categorical.from_codes(codigos, categories=ESTADOS)
+
+    return {
+        "df": df,
+        # Posiciones de fila de cada grupo: filtros y alertas no recorren el frame
+        "por_estado": {e: np.flatnonzero(codigos == i) for i, e in enumerate(ESTADOS)},
+        "por_marca": {m: np.asarray(pos) for m, pos in df.groupby('Marca', observed=True).indices.items()},
+    }
+
+
+def filtrar(snapshot, estados=None, marcas=None):
+    """Filas de la foto que cumplen los filtros (None = sin filtro; se mantiene el orden por venta)"""
+    df = snapshot["df"]
+    if estados is None and marcas is None:
+        return df
+    mascara = np.ones(len(df), dtype=bool)
+    for seleccion, grupos in ((estados, snapshot["por_estado"]), (marcas, snapshot["por_marca"])):
+        if seleccion is not None:
+            en_grupo = np.zeros(len(df), dtype=bool)
+            for clave in seleccion:
+                if clave in grupos:
+                    en_grupo[grupos[clave]] = True
+            mascara &= en_grupo
+    return df[mascara]
+
+
+def filas_estado(snapshot, estado):
+    """Las filas de un estado, usando el índice precalculado"""
+    return snapshot["df"].iloc[snapshot["por_estado"][estado]]
+
+
+def histograma(valores, bins=20):
+    """Cuentas por intervalo ya calculadas: el gráfico recibe 20 barras, no 50.000 puntos"""
+    valores = valores[~np.isnan(valores)]
+    if len(valores) == 0:
+        return pd.DataFrame({"desde": [], "hasta": [], "productos": []})
+    cuentas, bordes = np.histogram(valores, bins=bins)
+    return pd.DataFrame({"desde": bordes[:-1], "hasta": bordes[1:], "productos": cuentas})
+
+
+# --- KPIs (también mantenidos; las escrituras y los avisos NOTIFY los marcan vencidos) ---
+
+@refresco.mantener(intervalo=catalogo.TTL_PRODUCTOS)
+def cargar_kpis(_engine):
+    """KPIs del Dashboard: ventas y margen de 30 días, valor del stock y productos críticos"""
+    # Las ventas salen del resumen diario (ya viene en unidades reales y con
+    # costo), así el costo de la consulta no crece con el historial
+    with _engine.connect() as conn, rendimiento.etiqueta("obtener_kpis"):
+        result = conn.execute(text("""
+            WITH VentasTotales AS (
+                SELECT 
+                    SUM(ingresos) as total_ventas,
+                    SUM(costo) as costo_total
+                FROM ventas_diarias_producto
+                WHERE fecha >= CURRENT_DATE - 30
+            ),
+            StockValorizado AS (
+                SELECT SUM(stock_actual * precio_costo_promedio) as valor_inventario
+                FROM productos
+            )
+            SELECT 
+                COALESCE(vt.total_ventas, 0) as ventas_mes,
+                COALESCE(vt.total_ventas - vt.costo_total, 0) as margen_bruto,
+                COALESCE(sv.valor_inventario, 0) as valor_stock,
+                (SELECT COUNT(*) FROM productos WHERE stock_actual <= stock_minimo) as productos_criticos
+            FROM VentasTotales vt, StockValorizado sv
+        """)).fetchone()
+    return {
+        'ventas_mes': float(result[0]),
+        'margen_bruto': float(result[1]),
+        'valor_stock': float(result[2]),
+        'productos_criticos': int(result[3])
+    }
+
+
+@refresco.mantener(intervalo=catalogo.TTL_PRODUCTOS)
+def cargar_kpis_concesion(_engine):
+    """(unidades en la calle, capital en riesgo a costo, venta potencial)"""
+    with _engine.connect() as conn, rendimiento.etiqueta("query_kpi_concesion"):
+        return tuple(float(x) for x in conn.execute(text("""
+            SELECT 
+                COALESCE(SUM(stock_concesion), 0) as unidades_calle,
+                COALESCE(SUM(stock_concesion * precio_costo_promedio), 0) as capital_riesgo,
+                COALESCE(SUM(stock_concesion * precio_venta), 0) as venta_potencial
+            FROM productos
+        """)).fetchone())
+
+
+catalogo.registrar(["productos", "marcas", "ventas_diarias_producto"], cargar_hechos)
+catalogo.registrar(["productos", "ventas_diarias_producto"], cargar_kpis)
+catalogo.registrar(["productos"], cargar_kpis_concesion)